@@ -0,0 +1,125 @@
+import functools
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app, make_response, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 响应体小于该字节数时不压缩（压缩收益抵不过CPU开销和头部）
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = {
+    'application/json', 'text/html', 'text/plain', 'text/css', 'text/javascript', 'application/javascript',
+}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """安装了orjson时用它序列化JSON，否则与Flask默认实现相同
+
+    非ASCII字符直接输出UTF-8（不转义为\\uXXXX），响应更小；调试模式下同样缩进两格。
+    """
+
+    def _orjson_options(self) -> int:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode('utf-8')
+
+    def response(self, *args: Any, **kwargs: Any):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        options = self._orjson_options() | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            options |= orjson.OPT_INDENT_2
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=options), mimetype=self.mimetype)
+
+
+def compress_response(response):
+    """按Accept-Encoding用brotli（已安装时）或gzip压缩较大的文本响应；流式响应和文件不处理"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        encoding = 'br'
+    elif accept['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(data, GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _last_modified(versions: Dict[str, Dict[str, Any]]) -> Optional[datetime]:
+    """所有表都有修改时间时取最大值，否则不提供Last-Modified"""
+    times = [version.get('updated_at') for version in versions.values()]
+    if not times or None in times:
+        return None
+    return datetime.strptime(max(times), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def conditional(get_versions: Callable[[], Dict[str, Dict[str, Any]]]):
+    """列表接口的条件请求：根据所读表的版本号生成ETag（和Last-Modified），
+    客户端缓存仍然有效时直接返回304，不执行查询和序列化
+
+    ETag中包含请求路径和参数，版本号不变时同一URL的响应一定相同。
+    只按ETag判断是否返回304：Last-Modified精度为秒，同一秒内的两次修改无法区分，
+    只带If-Modified-Since的请求总是返回完整响应。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            versions = get_versions()
+            source = request.full_path + '|' + '|'.join(
+                f"{table}:{versions[table]['version']}" for table in sorted(versions)
+            )
+            etag = hashlib.sha1(source.encode('utf-8')).hexdigest()
+            last_modified = _last_modified(versions)
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            # 浏览器每次使用缓存前都要验证
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """安装JSON序列化和响应压缩"""
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
@@ -1,13 +1,25 @@
-from flask import Flask, render_template, request, jsonify, session, make_response
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, session, make_response, Response
 from flask_cors import CORS
+from werkzeug.local import LocalProxy
+from werkzeug.test import EnvironBuilder
 import os
 import time
-from database import Database
-from playwright_automation import automation, sync_start_browser, sync_navigate_to, sync_scroll_page, sync_get_page_text, sync_extract_element_text, sync_extract_element_json, sync_get_page_title, sync_get_current_url, sync_get_all_links, sync_hover_element, sync_double_click_element, sync_right_click_element, sync_click_element, sync_fill_input, sync_get_page_elements, sync_extract_element_data, sync_get_page_data, sync_analyze_page_content, sync_close_browser, sync_execute_script_steps, sync_start_recording, sync_stop_recording, sync_wait_for_selector, sync_wait_for_element_visible, sync_take_screenshot, sync_execute_multiple_test_cases, worker, sync_enable_element_selection, sync_disable_element_selection, sync_get_selected_element, sync_extract_json_from_selected_element, sync_wait_for_timeout  # 使用全局实例和同步包装器
+from database import Database, RETENTION_MAX_AGE_DAYS, RETENTION_KEEP_PER_CASE
+from project_transfer import dump_records, gzip_chunks, read_records
+from history_export import export_chunks, parse_time, EXPORT_MIMETYPES
+import automation_loader
+import api_response
+from element_selection import selection_channel, SELECTION_KEEPALIVE_SECONDS, SELECTION_LONG_POLL_MAX_SECONDS
+from history_writer import BatchWriter
+from recording_stream import RECORDING_BATCH_SIZE, RECORDING_FLUSH_INTERVAL
+from automation_loader import automation, sync_start_browser, sync_navigate_to, sync_scroll_page, sync_get_page_text, sync_extract_element_text, sync_extract_element_json, sync_get_page_title, sync_get_current_url, sync_get_all_links, sync_hover_element, sync_double_click_element, sync_right_click_element, sync_click_element, sync_fill_input, sync_get_page_elements, sync_extract_element_data, sync_get_page_data, sync_analyze_page_content, sync_close_browser, sync_execute_script_steps, sync_start_recording, sync_stop_recording, sync_wait_for_selector, sync_wait_for_element_visible, sync_take_screenshot, sync_execute_multiple_test_cases, worker, sync_enable_element_selection, sync_disable_element_selection, sync_get_selected_element, sync_extract_json_from_selected_element, sync_wait_for_timeout  # 自动化引擎在第一次调用时才导入
 import asyncio
 import json
 import functools
-from logger import uat_logger
+import logging
+import contextvars
+import contextlib
+from logger import uat_logger, new_run_id
 
 def generate_selector_by_method(method, value):
     """根据定位方法生成对应的选择器"""
@@ -47,10 +59,21 @@ def api_error_handler(func):
             }), 500
     return wrapper
 
+def _response_log_payload(response):
+    """响应日志内容：小的JSON响应解析后记录，大的只交给日志截断原始字节，流式响应不读取"""
+    if not getattr(response, 'is_json', False) or response.is_streamed:
+        return None
+    if (response.content_length or 0) > uat_logger.payload_max_bytes:
+        return response.get_data()
+    return response.get_json(silent=True)
+
 # API请求日志装饰器
 def log_api_request(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        # INFO级别关闭时不解析请求和响应数据
+        if not uat_logger.is_enabled_for(logging.INFO):
+            return func(*args, **kwargs)
         # 记录请求，处理没有请求体的情况
         try:
             request_data = request.json if request.method in ['POST', 'PUT', 'PATCH'] else None
@@ -61,32 +84,64 @@ def log_api_request(func):
         # 执行函数
         response = func(*args, **kwargs)
         # 记录响应
+        if isinstance(response, tuple):
+            body, status_code = response[0], response[1]
+        else:
+            body, status_code = response, 200
         try:
-            if isinstance(response, tuple):
-                uat_logger.log_api_response(func.__name__, response[1], response[0].get_json())
-            else:
-                uat_logger.log_api_response(func.__name__, 200, response.get_json())
+            response_data = _response_log_payload(body)
         except Exception:
-            # 如果响应无法解析为JSON，记录基本信息
-            status_code = response[1] if isinstance(response, tuple) else 200
-            uat_logger.log_api_response(func.__name__, status_code, None)
+            # 如果响应无法解析为JSON，只记录基本信息
+            response_data = None
+        uat_logger.log_api_response(func.__name__, status_code, response_data)
         return response
     return wrapper
 
-app = Flask(__name__)
-CORS(app)
-# 设置Flask应用的密钥，用于session加密
-app.secret_key = 'your-secret-key-here'
+# 运行日志上下文装饰器：每次调用分配新的运行ID，期间的日志和运行历史记录通过它关联
+def log_run_context(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with uat_logger.context(run_id=new_run_id(), case_id=kwargs.get('case_id'), step=None):
+            return func(*args, **kwargs)
+    return wrapper
+
+# 任务日志上下文装饰器：批量执行时所有用例的日志带上同一个任务ID
+def log_job_context(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with uat_logger.context(job_id=new_run_id()):
+            return func(*args, **kwargs)
+    return wrapper
+
+# 条件请求装饰器：按所读表的版本号生成ETag，数据未变化时返回304
+def cached_by_tables(*tables):
+    return api_response.conditional(lambda: db.get_table_versions(tables))
 
-# 初始化数据库
-db = Database()
+# 需要浏览器自动化引擎的接口，authoring角色下直接返回503
+def requires_automation(func):
+    func.requires_automation = True
+    return func
+
+bp = Blueprint('uat', __name__)
+
+# 当前应用的数据库实例（由create_app创建，所有请求共享同一个连接池）
+db = LocalProxy(lambda: current_app.extensions['uat_db'])
+
+@bp.before_app_request
+def check_automation_available():
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'requires_automation', False) and not automation_loader.is_enabled():
+        return jsonify({
+            'success': False,
+            'error': '当前服务为authoring角色，不提供浏览器自动化功能'
+        }), 503
 
 # 主页路由
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/create_case_v2')
+@bp.route('/create_case_v2')
 def create_case_v2():
     response = make_response(render_template('create_case_v2.html'))
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
@@ -96,29 +151,29 @@ def create_case_v2():
     return response
 
 # CDN测试页面
-@app.route('/cdn_test')
+@bp.route('/cdn_test')
 def cdn_test():
     response = make_response(render_template('cdn_test.html'))
     response.headers['Content-Type'] = 'text/html; charset=utf-8'
     return response
 
 # 项目管理页面
-@app.route('/list_projects')
+@bp.route('/list_projects')
 def list_projects():
     return render_template('list_projects.html')
 
 # 测试用例管理页面（新版本）
-@app.route('/list_cases_v2/<int:project_id>')
+@bp.route('/list_cases_v2/<int:project_id>')
 def list_cases_v2(project_id):
     return render_template('list_cases_v2.html', project_id=project_id)
 
 # 测试步骤管理页面
-@app.route('/list_steps')
+@bp.route('/list_steps')
 def list_steps():
     return render_template('list_steps.html')
 
 # API: 创建测试用例
-@app.route('/api/create_case', methods=['POST'])
+@bp.route('/api/create_case', methods=['POST'])
 @api_error_handler
 @log_api_request
 def api_create_case():
@@ -134,7 +189,7 @@ def api_create_case():
     return jsonify({'success': True, 'case_id': case_id})
 
 # API: 获取所有测试用例
-@app.route('/api/test_cases', methods=['GET'])
+@bp.route('/api/test_cases', methods=['GET'])
 @api_error_handler
 @log_api_request
 def api_get_test_cases():
@@ -142,7 +197,7 @@ def api_get_test_cases():
     return jsonify({'cases': cases})
 
 # API: 获取单个测试用例
-@app.route('/api/test_case/<int:case_id>', methods=['GET'])
+@bp.route('/api/test_case/<int:case_id>', methods=['GET'])
 @api_error_handler
 @log_api_request
 def api_get_test_case(case_id):
@@ -152,7 +207,7 @@ def api_get_test_case(case_id):
     return jsonify({'test_case': case})
 
 # API: 更新测试用例
-@app.route('/api/test_case/<int:case_id>', methods=['PUT'])
+@bp.route('/api/test_case/<int:case_id>', methods=['PUT'])
 @api_error_handler
 @log_api_request
 def api_update_test_case(case_id):
@@ -169,24 +224,28 @@ def api_update_test_case(case_id):
         return jsonify({'success': False, 'error': '更新测试用例失败'}), 400
 
 # API: 删除测试用例
-@app.route('/api/test_case/<int:case_id>', methods=['DELETE'])
+@bp.route('/api/test_case/<int:case_id>', methods=['DELETE'])
 @api_error_handler
 @log_api_request
 def api_delete_test_case(case_id):
-    success = db.delete_test_case(case_id)
+    purge_job_id = db.purge_case(case_id)
     
-    if success:
-        return jsonify({'success': True})
+    if purge_job_id is not None:
+        return jsonify({'success': True, 'purge_job_id': purge_job_id})
     else:
         return jsonify({'success': False, 'error': '删除测试用例失败'}), 400
 
 # API: 启动浏览器进行录制
-@app.route('/api/start_recording', methods=['POST'])
+@bp.route('/api/start_recording', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_start_recording():
     data = request.get_json(silent=True) or {}
     url = data.get('url', '')
+    case_id = data.get('case_id')
+    if case_id and not db.get_test_case(case_id):
+        return jsonify({'success': False, 'error': '测试用例不存在'}), 404
     
     try:
         # 启动浏览器
@@ -194,7 +253,8 @@ def api_start_recording():
         sync_start_browser(headless=False)
         
         # 开始录制 - 使用同步函数确保浏览器完全初始化
-        sync_start_recording()
+        # 指定了用例时，录制的步骤边录制边分批写入该用例
+        sync_start_recording(_open_recording_writer(case_id) if case_id else None)
         
         # 如果提供了URL，导航到该URL并保存到会话中
         if url:
@@ -211,6 +271,7 @@ def api_start_recording():
         return jsonify(response_data)
     except Exception as e:
         uat_logger.error(f"启动录制失败: {str(e)}")
+        _close_recording_writer()
         # 尝试关闭浏览器，清理资源
         try:
             sync_close_browser()
@@ -218,14 +279,85 @@ def api_start_recording():
             pass
         return jsonify({'success': False, 'error': f'录制启动失败: {str(e)}'}), 500
 
+def recorded_steps_to_test_steps(recorded_steps):
+    """将录制得到的步骤转换为test_steps的字段格式"""
+    test_steps = []
+    for recorded in recorded_steps:
+        action = recorded.get('action')
+        if not action:
+            continue
+        step = {
+            'action': 'input' if action == 'fill' else action,
+            'selector_type': 'css',
+            'selector_value': recorded.get('selector') or '',
+            'input_value': recorded.get('text') or ''
+        }
+        if action == 'navigate':
+            step['url'] = recorded.get('url') or ''
+            step['input_value'] = step['url']
+        elif action == 'keypress':
+            # 执行时从input_value读取按键
+            step['input_value'] = recorded.get('key') or ''
+        elif action == 'scroll':
+            # 滚动到的位置序列化到input_value，执行时解析后滚动到该位置
+            position = recorded.get('scrollPosition')
+            if not isinstance(position, dict):
+                continue
+            step['input_value'] = json.dumps({'x': position.get('x', 0), 'y': position.get('y', 0)})
+        test_steps.append(step)
+    return test_steps
+
+def _open_recording_writer(case_id):
+    """为录制会话创建后台写入线程，返回交给录制器的步骤接收函数
+
+    压缩后的步骤进入队列，每攒够RECORDING_BATCH_SIZE个或等待RECORDING_FLUSH_INTERVAL秒
+    用create_test_steps_bulk写入一批，录制时长不影响内存占用。
+    """
+    _close_recording_writer()
+    database = db._get_current_object()
+    recording = {'case_id': case_id, 'step_ids': []}
+
+    def write_batch(steps):
+        recording['step_ids'].extend(database.create_test_steps_bulk(case_id, recorded_steps_to_test_steps(steps)))
+
+    recording['writer'] = BatchWriter(write_batch, name=f"recording-writer[{case_id}]",
+                                      max_batch_size=RECORDING_BATCH_SIZE, max_delay=RECORDING_FLUSH_INTERVAL)
+    current_app.extensions['uat_recording'] = recording
+    return recording['writer'].submit
+
+def _close_recording_writer():
+    """写完录制会话剩余的步骤并停止写入线程，返回会话信息（没有进行中的会话时返回None）"""
+    recording = current_app.extensions.pop('uat_recording', None)
+    if recording:
+        recording['writer'].close()
+    return recording
+
 # API: 停止录制并保存步骤
-@app.route('/api/stop_recording', methods=['POST'])
+@bp.route('/api/stop_recording', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_stop_recording():
-    # 获取录制的步骤
-    steps = sync_stop_recording()
-    uat_logger.info(f"停止录制，获取到 {len(steps)} 个步骤")
+    data = request.get_json(silent=True) or {}
+    case_id = data.get('case_id')
+    
+    # 获取录制的步骤；开始录制时指定了用例的，步骤已在录制过程中写入，这里只写入最后一批
+    try:
+        steps = sync_stop_recording()
+    finally:
+        recording = _close_recording_writer()
+    
+    step_ids = []
+    if recording:
+        case_id = recording['case_id']
+        step_ids = recording['step_ids']
+        uat_logger.info(f"停止录制，已分批保存 {len(step_ids)} 个录制步骤到测试用例 #{case_id}")
+    else:
+        uat_logger.info(f"停止录制，获取到 {len(steps)} 个步骤")
+        # 指定了用例时，通过批量接口一次性保存录制的步骤
+        if case_id and steps:
+            step_ids = db.create_test_steps_bulk(case_id, recorded_steps_to_test_steps(steps))
+            uat_logger.info(f"已保存 {len(step_ids)} 个录制步骤到测试用例 #{case_id}")
     
     # 尝试关闭浏览器，但不影响结果返回
     warning_msg = None
@@ -237,14 +369,18 @@ def api_stop_recording():
         uat_logger.warning(warning_msg)
     
     response_data = {'success': True, 'steps': steps}
+    if case_id:
+        response_data['step_ids'] = step_ids
     if warning_msg:
         response_data['warning'] = warning_msg
         
     return jsonify(response_data)
 
 # API: 执行多个测试用例
-@app.route('/api/execute_multiple_cases', methods=['POST'])
+@bp.route('/api/execute_multiple_cases', methods=['POST'])
+@requires_automation
 @api_error_handler
+@log_job_context
 @log_api_request
 def api_execute_multiple_cases():
     data = request.get_json(silent=True) or {}
@@ -269,14 +405,13 @@ def api_execute_multiple_cases():
         # 创建队列用于返回结果
         result_queue = queue.Queue(maxsize=1)  # 设置队列大小，防止阻塞
         
+        # 子线程中没有应用上下文，先取出数据库实例
+        thread_db = db._get_current_object()
+        
         def execute_test_cases():
             """在子线程中执行测试用例"""
             try:
-                # 创建独立的数据库连接实例，确保线程安全
-                from database import Database
-                thread_db = Database()
-                
-                # 执行测试用例
+                # 执行测试用例（连接池按线程分配连接）
                 result = sync_execute_multiple_test_cases(case_ids, thread_db)
                 
                 # 尝试将结果放入队列，设置超时
@@ -292,7 +427,8 @@ def api_execute_multiple_cases():
                     uat_logger.error("结果队列已满，无法放入错误信息")
         
         # 启动子线程执行测试用例
-        thread = threading.Thread(target=execute_test_cases)
+        # 子线程沿用当前的日志上下文（任务ID）
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(execute_test_cases,))
         thread.daemon = True
         thread.start()
         
@@ -383,7 +519,8 @@ def api_execute_multiple_cases():
     return jsonify(response_data)
 
 # API: 导航到指定URL
-@app.route('/api/navigate', methods=['POST'])
+@bp.route('/api/navigate', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_navigate():
@@ -398,7 +535,8 @@ def api_navigate():
     return jsonify({'success': True})
 
 # API: 执行滚动操作
-@app.route('/api/scroll', methods=['POST'])
+@bp.route('/api/scroll', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_scroll():
@@ -411,7 +549,8 @@ def api_scroll():
     return jsonify({'success': True})
 
 # API: 提取元素文本
-@app.route('/api/extract_element_text', methods=['POST'])
+@bp.route('/api/extract_element_text', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_extract_element_text():
@@ -426,7 +565,8 @@ def api_extract_element_text():
     return jsonify({'success': True, 'text': text})
 
 # API: 提取元素JSON数据
-@app.route('/api/extract_element_json', methods=['POST'])
+@bp.route('/api/extract_element_json', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_extract_element_json():
@@ -441,7 +581,8 @@ def api_extract_element_json():
     return jsonify({'success': True, 'json': json_data})
 
 # API: 获取页面标题
-@app.route('/api/page_title', methods=['GET'])
+@bp.route('/api/page_title', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_page_title():
@@ -449,7 +590,8 @@ def api_page_title():
     return jsonify({'success': True, 'title': title})
 
 # API: 获取当前URL
-@app.route('/api/current_url', methods=['GET'])
+@bp.route('/api/current_url', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_current_url():
@@ -457,7 +599,8 @@ def api_current_url():
     return jsonify({'success': True, 'url': url})
 
 # API: 获取页面上所有链接
-@app.route('/api/links', methods=['GET'])
+@bp.route('/api/links', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_links():
@@ -465,7 +608,8 @@ def api_links():
     return jsonify({'success': True, 'links': links})
 
 # API: 启动可视化选择
-@app.route('/api/start_visual_selection', methods=['POST'])
+@bp.route('/api/start_visual_selection', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_start_visual_selection():
@@ -474,15 +618,18 @@ def api_start_visual_selection():
         data = request.get_json(silent=True) or {}
         target_url = data.get('url', '')
         
+        # 启动前的版本号，前端只等待比它新的选择
+        version = selection_channel.version
         # 启动可视化选择功能，并传递目标URL
         sync_enable_element_selection(target_url)
-        return jsonify({'success': True, 'message': '可视化选择已启动'})
+        return jsonify({'success': True, 'message': '可视化选择已启动', 'version': version})
     except Exception as e:
         uat_logger.error(f"启动可视化选择失败: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
 # API: 停止可视化选择
-@app.route('/api/stop_visual_selection', methods=['POST'])
+@bp.route('/api/stop_visual_selection', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_stop_visual_selection():
@@ -494,24 +641,50 @@ def api_stop_visual_selection():
         uat_logger.error(f"停止可视化选择失败: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
-# API: 检查选择的元素
-@app.route('/api/check_selected_element', methods=['GET'])
+# API: 检查选择的元素（长轮询）
+# since为已收到的版本号，wait为没有新选择时最多等待的秒数（默认不等待）
+@bp.route('/api/check_selected_element', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_check_selected_element():
-    try:
-        # 获取选择的元素
-        selected_element = sync_get_selected_element()
-        if selected_element:
-            return jsonify({'success': True, 'selected_element': selected_element})
-        else:
-            return jsonify({'success': True, 'selected_element': None})
-    except Exception as e:
-        uat_logger.error(f"检查选择元素失败: {e}")
-        return jsonify({'success': False, 'error': str(e)})
+    since = request.args.get('since', 0, type=int)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), SELECTION_LONG_POLL_MAX_SECONDS)
+    version, selected_element, active = selection_channel.wait(since, wait)
+    return jsonify({'success': True, 'selected_element': selected_element, 'version': version, 'active': active})
+
+# API: 选择结果推送（Server-Sent Events）
+# 每次选择发送一条selected事件（id为版本号，断线重连时通过Last-Event-ID续传），选择模式关闭时发送stopped事件并结束
+@bp.route('/api/element-selection/events', methods=['GET'])
+@requires_automation
+@api_error_handler
+@log_api_request
+def api_element_selection_events():
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+
+    def stream():
+        version = since
+        while True:
+            version, selected_element, active = selection_channel.wait(version, SELECTION_KEEPALIVE_SECONDS)
+            if selected_element is not None:
+                yield f"id: {version}\nevent: selected\ndata: {json.dumps(selected_element, ensure_ascii=False)}\n\n"
+            elif not active:
+                yield "event: stopped\ndata: {}\n\n"
+                return
+            else:
+                # 保活注释，避免代理和浏览器因长时间无数据断开连接
+                yield ": keepalive\n\n"
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # API: 提取元素数据
-@app.route('/api/extract_element_data', methods=['POST'])
+@bp.route('/api/extract_element_data', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_extract_element_data():
@@ -525,7 +698,8 @@ def api_extract_element_data():
     return jsonify({'success': True, 'data': element_data})
 
 # API: 获取页面数据
-@app.route('/api/page_data', methods=['GET'])
+@bp.route('/api/page_data', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_page_data():
@@ -533,7 +707,8 @@ def api_page_data():
     return jsonify({'success': True, 'data': page_data})
 
 # API: 分析页面内容
-@app.route('/api/analyze_content', methods=['POST'])
+@bp.route('/api/analyze_content', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_analyze_content():
@@ -544,7 +719,8 @@ def api_analyze_content():
     return jsonify({'success': True, 'analysis': analysis})
 
 # API: 悬停在元素上
-@app.route('/api/hover_element', methods=['POST'])
+@bp.route('/api/hover_element', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_hover_element():
@@ -560,7 +736,8 @@ def api_hover_element():
     return jsonify({'success': True})
 
 # API: 双击元素
-@app.route('/api/double_click', methods=['POST'])
+@bp.route('/api/double_click', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_double_click():
@@ -576,7 +753,8 @@ def api_double_click():
     return jsonify({'success': True})
 
 # API: 点击元素
-@app.route('/api/click_element', methods=['POST'])
+@bp.route('/api/click_element', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_click_element():
@@ -592,7 +770,8 @@ def api_click_element():
 
 
 # API: 右键点击元素
-@app.route('/api/right_click', methods=['POST'])
+@bp.route('/api/right_click', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_right_click():
@@ -608,7 +787,8 @@ def api_right_click():
     return jsonify({'success': True})
 
 # API: 等待元素出现
-@app.route('/api/wait_for_selector', methods=['POST'])
+@bp.route('/api/wait_for_selector', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_wait_for_selector():
@@ -623,7 +803,8 @@ def api_wait_for_selector():
     return jsonify({'success': True})
 
 # API: 等待元素可见
-@app.route('/api/wait_for_element_visible', methods=['POST'])
+@bp.route('/api/wait_for_element_visible', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_wait_for_element_visible():
@@ -638,7 +819,8 @@ def api_wait_for_element_visible():
     return jsonify({'success': True})
 
 # API: 获取页面元素
-@app.route('/api/page_elements', methods=['GET'])
+@bp.route('/api/page_elements', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_page_elements():
@@ -646,7 +828,7 @@ def api_page_elements():
     return jsonify({'success': True, 'elements': elements})
 
 # API: 检查是否存在测试用例
-@app.route('/api/has_test_cases', methods=['GET'])
+@bp.route('/api/has_test_cases', methods=['GET'])
 @api_error_handler
 @log_api_request
 def api_has_test_cases():
@@ -655,7 +837,8 @@ def api_has_test_cases():
     return jsonify({'success': True, 'has_cases': has_cases})
 
 # API: 获取页面截图
-@app.route('/api/screenshot', methods=['GET'])
+@bp.route('/api/screenshot', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_screenshot():
@@ -678,7 +861,8 @@ def api_screenshot():
         return jsonify({'error': str(e)}), 500
 
 # API: 启用元素选择模式
-@app.route('/api/enable_element_selection', methods=['POST'])
+@bp.route('/api/enable_element_selection', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_enable_element_selection():
@@ -689,7 +873,8 @@ def api_enable_element_selection():
         return jsonify({'error': str(e)}), 500
 
 # API: 禁用元素选择模式
-@app.route('/api/disable_element_selection', methods=['POST'])
+@bp.route('/api/disable_element_selection', methods=['POST'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_disable_element_selection():
@@ -700,7 +885,8 @@ def api_disable_element_selection():
         return jsonify({'error': str(e)}), 500
 
 # API: 获取选中的元素信息
-@app.route('/api/get_selected_element', methods=['GET'])
+@bp.route('/api/get_selected_element', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_get_selected_element():
@@ -711,7 +897,8 @@ def api_get_selected_element():
         return jsonify({'error': str(e)}), 500
 
 # API: 从选定元素提取JSON数据
-@app.route('/api/extract_json_from_selected_element', methods=['GET'])
+@bp.route('/api/extract_json_from_selected_element', methods=['GET'])
+@requires_automation
 @api_error_handler
 @log_api_request
 def api_extract_json_from_selected_element():
@@ -721,10 +908,92 @@ def api_extract_json_from_selected_element():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ==================== 批量接口 ====================
+
+# 批量接口单次最多包含的子操作数
+BATCH_MAX_OPERATIONS = 100
+
+class _BatchRollback(Exception):
+    """共享事务的批量请求中有操作失败，回滚整个事务"""
+
+def _batch_error(status, error):
+    return {'status': status, 'body': {'success': False, 'error': error}}
+
+def _run_batch_operation(operation, transactional):
+    """在独立的请求上下文中执行一个子操作，返回{'status', 'body'}"""
+    if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+        return _batch_error(400, '子操作必须包含path')
+    method = str(operation.get('method') or 'GET').upper()
+    path = operation['path']
+    if not path.startswith('/api/') or path.split('?', 1)[0].rstrip('/') == '/api/batch':
+        return _batch_error(400, f'不支持的子操作路径: {path}')
+    
+    app = current_app._get_current_object()
+    builder = EnvironBuilder(path=path, method=method, json=operation.get('body'), base_url=request.host_url)
+    try:
+        with app.request_context(builder.get_environ()):
+            view = app.view_functions.get(request.endpoint)
+            if transactional and getattr(view, 'requires_automation', False):
+                return _batch_error(400, '共享事务的批量请求中不能调用浏览器自动化接口')
+            response = app.full_dispatch_request()
+            # 错误页可能也是迭代器形式，只拒绝成功的流式响应（如导出）
+            if response.is_streamed and response.status_code < 400:
+                response.close()
+                return _batch_error(400, f'批量请求不支持流式接口: {path}')
+            body = response.get_json(silent=True)
+            if body is None and response.status_code != 304:
+                body = response.get_data(as_text=True)
+            return {'status': response.status_code, 'body': body}
+    except Exception as e:
+        uat_logger.log_exception('api_batch', e, f"{method} {path}")
+        return _batch_error(500, str(e))
+    finally:
+        builder.close()
+
+# API: 批量执行多个子操作（一次往返）
+@bp.route('/api/batch', methods=['POST'])
+@api_error_handler
+@log_api_request
+def api_batch():
+    """按顺序执行operations中的子操作（method、path、body），返回每个操作的状态码和响应
+    
+    transaction为true时所有操作共享一个数据库事务：任一操作失败（状态码>=400）时全部回滚，
+    后续操作不再执行；否则每个操作各自提交，stop_on_error为true时在第一个失败处停止。
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'error': 'operations必须是非空列表'}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'success': False, 'error': f'单次最多{BATCH_MAX_OPERATIONS}个子操作'}), 400
+    
+    transactional = bool(data.get('transaction'))
+    stop_on_error = transactional or bool(data.get('stop_on_error'))
+    results = []
+    try:
+        with db.transaction() if transactional else contextlib.nullcontext():
+            for operation in operations:
+                result = _run_batch_operation(operation, transactional)
+                if isinstance(operation, dict) and 'id' in operation:
+                    result['id'] = operation['id']
+                results.append(result)
+                if result['status'] >= 400 and stop_on_error:
+                    if transactional:
+                        raise _BatchRollback()
+                    break
+    except _BatchRollback:
+        pass
+    
+    success = len(results) == len(operations) and all(result['status'] < 400 for result in results)
+    response = {'success': success, 'results': results}
+    if transactional:
+        response['committed'] = success
+    return jsonify(response)
+
 # ==================== 项目管理API ====================
 
 # API: 创建项目
-@app.route('/api/projects', methods=['POST'])
+@bp.route('/api/projects', methods=['POST'])
 @api_error_handler
 @log_api_request
 def api_create_project():
@@ -739,16 +1008,18 @@ def api_create_project():
     return jsonify({'success': True, 'project_id': project_id})
 
 # API: 获取所有项目
-@app.route('/api/projects', methods=['GET'])
+@bp.route('/api/projects', methods=['GET'])
 @api_error_handler
+@cached_by_tables('projects')
 @log_api_request
 def api_get_projects():
     projects = db.get_all_projects()
     return jsonify({'projects': projects})
 
 # API: 获取单个项目
-@app.route('/api/projects/<int:project_id>', methods=['GET'])
+@bp.route('/api/projects/<int:project_id>', methods=['GET'])
 @api_error_handler
+@cached_by_tables('projects')
 @log_api_request
 def api_get_project(project_id):
     project = db.get_project(project_id)
@@ -757,7 +1028,7 @@ def api_get_project(project_id):
     return jsonify({'project': project})
 
 # API: 更新项目
-@app.route('/api/projects/<int:project_id>', methods=['PUT'])
+@bp.route('/api/projects/<int:project_id>', methods=['PUT'])
 @api_error_handler
 @log_api_request
 def api_update_project(project_id):
@@ -773,29 +1044,76 @@ def api_update_project(project_id):
         return jsonify({'success': False, 'error': '更新项目失败'}), 400
 
 # API: 删除项目
-@app.route('/api/projects/<int:project_id>', methods=['DELETE'])
+@bp.route('/api/projects/<int:project_id>', methods=['DELETE'])
 @api_error_handler
 @log_api_request
 def api_delete_project(project_id):
-    success = db.delete_project(project_id)
+    # 项目和用例立即删除，步骤和运行历史由后台分批清理，可通过purge_job_id查询进度
+    purge_job_id = db.purge_project(project_id)
     
-    if success:
-        return jsonify({'success': True})
+    if purge_job_id is not None:
+        return jsonify({'success': True, 'purge_job_id': purge_job_id})
     else:
         return jsonify({'success': False, 'error': '删除项目失败'}), 400
 
 # API: 获取项目下的所有测试用例
-@app.route('/api/projects/<int:project_id>/cases', methods=['GET'])
+@bp.route('/api/projects/<int:project_id>/cases', methods=['GET'])
 @api_error_handler
+@cached_by_tables('test_cases', 'test_steps')
 @log_api_request
 def api_get_project_cases(project_id):
     cases = db.get_project_cases(project_id)
     return jsonify({'cases': cases})
 
+# API: 获取项目统计（通过率、耗时分位数、不稳定度等）
+@bp.route('/api/projects/<int:project_id>/stats', methods=['GET'])
+@api_error_handler
+@log_api_request
+def api_get_project_stats(project_id):
+    if not db.get_project(project_id):
+        return jsonify({'error': '项目不存在'}), 404
+    stats = db.get_project_stats(project_id)
+    return jsonify({'success': True, 'stats': stats})
+
+# API: 流式导出项目（NDJSON，gzip=1时压缩；history=1时包含运行历史）
+@bp.route('/api/projects/<int:project_id>/export', methods=['GET'])
+@api_error_handler
+@log_api_request
+def api_export_project(project_id):
+    if not db.get_project(project_id):
+        return jsonify({'error': '项目不存在'}), 404
+    include_history = request.args.get('history', '').lower() in ('1', 'true')
+    compress = request.args.get('gzip', '').lower() in ('1', 'true')
+    
+    chunks = dump_records(db.iter_project_export(project_id, include_history=include_history))
+    filename = f"project_{project_id}.ndjson"
+    mimetype = 'application/x-ndjson'
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+# API: 导入项目（请求体或上传文件为导出的NDJSON，可gzip压缩），总是创建新项目
+# 不使用log_api_request：请求体是NDJSON流，不能按JSON预先读取
+@bp.route('/api/projects/import', methods=['POST'])
+@api_error_handler
+def api_import_project():
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    try:
+        result = db.import_project(read_records(stream), name=request.args.get('name') or None)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    uat_logger.info(f"导入项目完成: {result}")
+    return jsonify({'success': True, **result})
+
 # ==================== 测试用例管理API（新版本） ====================
 
 # API: 创建测试用例（关联到项目）
-@app.route('/api/cases', methods=['POST'])
+@bp.route('/api/cases', methods=['POST'])
 @api_error_handler
 @log_api_request
 def api_create_case_v2():
@@ -816,8 +1134,9 @@ def api_create_case_v2():
     return jsonify({'success': True, 'case_id': case_id})
 
 # API: 获取测试用例详情（新版本）
-@app.route('/api/cases/<int:case_id>', methods=['GET'])
+@bp.route('/api/cases/<int:case_id>', methods=['GET'])
 @api_error_handler
+@cached_by_tables('test_cases')
 @log_api_request
 def api_get_case_v2(case_id):
     case = db.get_test_case_v2(case_id)
@@ -826,7 +1145,7 @@ def api_get_case_v2(case_id):
     return jsonify({'test_case': case})
 
 # API: 更新测试用例（新版本）
-@app.route('/api/cases/<int:case_id>', methods=['PUT'])
+@bp.route('/api/cases/<int:case_id>', methods=['PUT'])
 @api_error_handler
 @log_api_request
 def api_update_case_v2(case_id):
@@ -845,29 +1164,40 @@ def api_update_case_v2(case_id):
         return jsonify({'success': False, 'error': '更新测试用例失败'}), 400
 
 # API: 删除测试用例（新版本）
-@app.route('/api/cases/<int:case_id>', methods=['DELETE'])
+@bp.route('/api/cases/<int:case_id>', methods=['DELETE'])
 @api_error_handler
 @log_api_request
 def api_delete_case_v2(case_id):
-    success = db.delete_test_case_v2(case_id)
+    purge_job_id = db.purge_case(case_id)
     
-    if success:
-        return jsonify({'success': True})
+    if purge_job_id is not None:
+        return jsonify({'success': True, 'purge_job_id': purge_job_id})
     else:
         return jsonify({'success': False, 'error': '删除测试用例失败'}), 400
 
+# API: 获取测试用例统计（通过率、耗时分位数、不稳定度等）
+@bp.route('/api/cases/<int:case_id>/stats', methods=['GET'])
+@api_error_handler
+@log_api_request
+def api_get_case_stats(case_id):
+    if not db.get_test_case_v2(case_id):
+        return jsonify({'error': '测试用例不存在'}), 404
+    stats = db.get_case_stats(case_id)
+    return jsonify({'success': True, 'stats': stats})
+
 # ==================== 测试步骤管理API ====================
 
 # API: 获取测试用例的所有步骤
-@app.route('/api/cases/<int:case_id>/steps', methods=['GET'])
+@bp.route('/api/cases/<int:case_id>/steps', methods=['GET'])
 @api_error_handler
+@cached_by_tables('test_cases', 'test_steps')
 @log_api_request
 def api_get_case_steps(case_id):
     steps = db.get_case_steps(case_id)
     return jsonify({'steps': steps})
 
 # API: 获取单个测试步骤详情
-@app.route('/api/steps/<int:step_id>', methods=['GET'])
+@bp.route('/api/steps/<int:step_id>', methods=['GET'])
 @api_error_handler
 @log_api_request
 def api_get_step(step_id):
@@ -877,7 +1207,7 @@ def api_get_step(step_id):
     return jsonify({'step': step})
 
 # API: 创建测试步骤
-@app.route('/api/steps', methods=['POST'])
+@bp.route('/api/steps', methods=['POST'])
 @api_error_handler
 @log_api_request
 def api_create_step():
@@ -907,8 +1237,27 @@ def api_create_step():
                                   swipe_x, swipe_y, url, enter_iframe, iframe_selector, compare_type)
     return jsonify({'success': True, 'step_id': step_id})
 
+# API: 批量创建测试步骤（单个事务）
+@bp.route('/api/cases/<int:case_id>/steps/bulk', methods=['POST'])
+@api_error_handler
+@log_api_request
+def api_create_steps_bulk(case_id):
+    data = request.get_json(silent=True) or {}
+    steps = data.get('steps', [])
+    
+    if not isinstance(steps, list) or not steps:
+        return jsonify({'success': False, 'error': 'steps参数必须是非空数组'}), 400
+    if not db.get_test_case_v2(case_id):
+        return jsonify({'success': False, 'error': '测试用例不存在'}), 404
+    
+    try:
+        step_ids = db.create_test_steps_bulk(case_id, steps)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'step_ids': step_ids})
+
 # API: 更新测试步骤
-@app.route('/api/steps/<int:step_id>', methods=['PUT'])
+@bp.route('/api/steps/<int:step_id>', methods=['PUT'])
 @api_error_handler
 @log_api_request
 def api_update_step(step_id):
@@ -932,7 +1281,7 @@ def api_update_step(step_id):
         return jsonify({'success': False, 'error': '更新测试步骤失败'}), 400
 
 # API: 删除测试步骤
-@app.route('/api/steps/<int:step_id>', methods=['DELETE'])
+@bp.route('/api/steps/<int:step_id>', methods=['DELETE'])
 @api_error_handler
 @log_api_request
 def api_delete_step(step_id):
@@ -944,7 +1293,7 @@ def api_delete_step(step_id):
         return jsonify({'success': False, 'error': '删除测试步骤失败'}), 400
 
 # API: 删除测试用例的所有步骤
-@app.route('/api/cases/<int:case_id>/steps', methods=['DELETE'])
+@bp.route('/api/cases/<int:case_id>/steps', methods=['DELETE'])
 @api_error_handler
 @log_api_request
 def api_delete_case_steps(case_id):
@@ -955,7 +1304,7 @@ def api_delete_case_steps(case_id):
         return jsonify({'success': False, 'error': '删除测试用例步骤失败'}), 400
 
 # API: 更新测试步骤顺序
-@app.route('/api/cases/<int:case_id>/steps/order', methods=['PUT'])
+@bp.route('/api/cases/<int:case_id>/steps/order', methods=['PUT'])
 @api_error_handler
 @log_api_request
 def api_update_step_order(case_id):
@@ -969,17 +1318,16 @@ def api_update_step_order(case_id):
         return jsonify({'success': False, 'error': '更新步骤顺序失败'}), 400
 
 # API: 运行测试用例
-@app.route('/api/cases/<int:case_id>/run', methods=['POST'])
+@bp.route('/api/cases/<int:case_id>/run', methods=['POST'])
+@requires_automation
 @api_error_handler
+@log_run_context
 @log_api_request
 def api_run_case(case_id):
     try:
         # 记录开始时间
         start_time = time.time()
         
-        # 初始化数据库连接（修复变量作用域问题）
-        db = Database()
-        
         # 获取测试用例信息
         case = db.get_test_case_v2(case_id)
         if not case:
@@ -1020,6 +1368,7 @@ def api_run_case(case_id):
             
             # 执行所有步骤
             for step in steps:
+                uat_logger.set_step(step.get('step_order'))
                 action = step.get('action', '')
                 selector_type = step.get('selector_type', 'css')
                 selector_value = step.get('selector_value', '')
@@ -1234,7 +1583,7 @@ def api_run_case(case_id):
             
             # 保存运行历史记录
             try:
-                db.create_run_history(case_id, 'success', duration, "", extracted_text, expected_text)
+                db.enqueue_run_history(case_id, 'success', duration, "", extracted_text, expected_text)
             except Exception as history_error:
                 uat_logger.warning(f"保存运行历史记录失败: {history_error}")
             
@@ -1258,7 +1607,7 @@ def api_run_case(case_id):
             
             # 保存运行历史记录
             try:
-                db.create_run_history(case_id, 'error', duration, str(e), extracted_text, expected_text)
+                db.enqueue_run_history(case_id, 'error', duration, str(e), extracted_text, expected_text)
             except Exception as history_error:
                 uat_logger.warning(f"保存运行历史记录失败: {history_error}")
             
@@ -1282,15 +1631,20 @@ def api_run_case(case_id):
             'error': str(e)
         }), 500
 
-@app.route('/run-history', methods=['GET'])
+@bp.route('/run-history', methods=['GET'])
 def run_history_page():
     """运行历史记录页面"""
     return render_template('run_history.html')
 
 
-@app.route('/api/run-history', methods=['GET'])
+@bp.route('/api/run-history', methods=['GET'])
+@cached_by_tables('run_history', 'test_cases', 'projects')
 def get_run_history():
-    """获取所有运行历史记录（支持分页、按测试用例ID过滤、按项目ID过滤和搜索）"""
+    """获取所有运行历史记录（支持分页、按测试用例ID过滤、按项目ID过滤和搜索）
+
+    传入cursor参数（首页传空字符串）时使用游标分页，返回next_cursor；
+    游标模式下只有include_total=1时才计算总数。
+    """
     try:
         # 获取分页参数
         page = request.args.get('page', 1, type=int)
@@ -1298,8 +1652,24 @@ def get_run_history():
         case_id = request.args.get('case_id', type=int)
         project_id = request.args.get('project_id', type=int)
         search_text = request.args.get('search_text', type=str)
-        
-        db = Database()
+
+        if 'cursor' in request.args:
+            try:
+                result = db.get_run_history_page(request.args.get('cursor'), page_size, case_id, search_text, project_id)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            response_data = {
+                'success': True,
+                'history': result['history'],
+                'next_cursor': result['next_cursor'],
+                'has_more': result['has_more'],
+                'page_size': page_size
+            }
+            if request.args.get('include_total') == '1':
+                response_data['total'] = db.get_run_history_count(case_id, search_text, project_id)
+            return jsonify(response_data)
+
         history = db.get_all_run_history(page, page_size, case_id, search_text, project_id)
         total = db.get_run_history_count(case_id, search_text, project_id)
         
@@ -1317,11 +1687,10 @@ def get_run_history():
             'error': f'获取运行历史记录失败: {str(e)}'
         }), 500
 
-@app.route('/api/run-history/<int:record_id>', methods=['DELETE'])
+@bp.route('/api/run-history/<int:record_id>', methods=['DELETE'])
 def delete_run_history(record_id):
     """删除运行历史记录"""
     try:
-        db = Database()
         success = db.delete_run_history(record_id)
         if success:
             return jsonify({
@@ -1340,11 +1709,35 @@ def delete_run_history(record_id):
             'error': str(e)
         }), 500
 
-@app.route('/api/run-history', methods=['DELETE'])
+@bp.route('/api/run-history/<int:record_id>/logs', methods=['GET'])
+def get_run_history_logs(record_id):
+    """获取一次运行的日志（按运行ID索引读取，不扫描日志文件）"""
+    try:
+        limit = request.args.get('limit', type=int)
+        record = db.get_run_history_log_run_id(record_id)
+        if not record:
+            return jsonify({
+                'success': False,
+                'error': '运行历史记录不存在'
+            }), 404
+        run_id = record['log_run_id']
+        logs = uat_logger.read_run_logs(run_id, limit) if run_id else []
+        return jsonify({
+            'success': True,
+            'run_id': run_id,
+            'logs': logs
+        })
+    except Exception as e:
+        uat_logger.error(f"获取运行日志失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/run-history', methods=['DELETE'])
 def delete_all_run_history():
     """删除所有运行历史记录"""
     try:
-        db = Database()
         success = db.delete_all_run_history()
         if success:
             return jsonify({
@@ -1363,11 +1756,10 @@ def delete_all_run_history():
             'error': str(e)
         }), 500
 
-@app.route('/api/run-history/<int:record_id>', methods=['GET'])
+@bp.route('/api/run-history/<int:record_id>', methods=['GET'])
 def get_run_history_detail(record_id):
     """获取运行历史记录详情"""
     try:
-        db = Database()
         record = db.get_run_history_detail(record_id)
         if record:
             return jsonify({
@@ -1386,11 +1778,10 @@ def get_run_history_detail(record_id):
             'error': str(e)
         }), 500
 
-@app.route('/api/cases/<int:case_id>/run-history', methods=['GET'])
+@bp.route('/api/cases/<int:case_id>/run-history', methods=['GET'])
 def get_case_run_history(case_id):
     """获取指定测试用例的运行历史记录"""
     try:
-        db = Database()
         history = db.get_case_run_history(case_id)
         return jsonify({
             'success': True,
@@ -1403,8 +1794,184 @@ def get_case_run_history(case_id):
             'error': str(e)
         }), 500
 
-@app.route('/api/execute_multiple_cases', methods=['POST'])
+@bp.route('/api/run-history/archive', methods=['POST'])
+def archive_run_history():
+    """按保留策略归档旧的运行历史记录并回收空间"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = db.archive_run_history(
+            max_age_days=data.get('max_age_days', RETENTION_MAX_AGE_DAYS),
+            keep_per_case=data.get('keep_per_case', RETENTION_KEEP_PER_CASE)
+        )
+        uat_logger.info(f"运行历史归档完成: {result}")
+        return jsonify({
+            'success': True,
+            'result': result
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        uat_logger.error(f"归档运行历史记录失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/run-history/writer', methods=['GET'])
+def get_run_history_writer_stats():
+    """获取运行历史后台写入线程状态（队列深度等）"""
+    try:
+        return jsonify({
+            'success': True,
+            'writer': db.get_history_writer_stats()
+        })
+    except Exception as e:
+        uat_logger.error(f"获取运行历史写入状态失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/cache/definitions', methods=['GET'])
+def get_definition_cache_stats():
+    """获取用例定义缓存状态（命中率等）"""
+    try:
+        return jsonify({
+            'success': True,
+            'cache': db.get_definition_cache_stats()
+        })
+    except Exception as e:
+        uat_logger.error(f"获取用例定义缓存状态失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/purge-jobs', methods=['GET'])
+def get_purge_jobs():
+    """获取最近的后台清理任务"""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        return jsonify({
+            'success': True,
+            'jobs': db.get_purge_jobs(limit)
+        })
+    except Exception as e:
+        uat_logger.error(f"获取清理任务失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/purge-jobs/<int:job_id>', methods=['GET'])
+def get_purge_job(job_id):
+    """获取后台清理任务的进度"""
+    try:
+        job = db.get_purge_job(job_id)
+        if job:
+            return jsonify({
+                'success': True,
+                'job': job
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'error': '清理任务不存在'
+            }), 404
+    except Exception as e:
+        uat_logger.error(f"获取清理任务进度失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/purge-jobs/orphans', methods=['POST'])
+def purge_orphans():
+    """清理用例已被删除但仍遗留的步骤、运行历史和统计"""
+    try:
+        job_id = db.purge_orphans()
+        return jsonify({
+            'success': True,
+            'purge_job_id': job_id
+        })
+    except Exception as e:
+        uat_logger.error(f"创建遗留数据清理任务失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/run-history/export', methods=['GET'])
+def export_run_history():
+    """流式导出运行历史（format=csv/ndjson/parquet），可按项目、用例和时间范围筛选，供离线分析"""
+    try:
+        export_format = request.args.get('format', 'csv')
+        batches = db.iter_run_history_export(
+            project_id=request.args.get('project_id', type=int),
+            case_id=request.args.get('case_id', type=int),
+            since=parse_time(request.args.get('since')),
+            until=parse_time(request.args.get('until')),
+            full_text=request.args.get('full_text', '').lower() in ('1', 'true')
+        )
+        response = Response(export_chunks(export_format, batches), mimetype=EXPORT_MIMETYPES[export_format])
+        response.headers['Content-Disposition'] = f'attachment; filename=run_history.{export_format}'
+        return response
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        uat_logger.error(f"导出运行历史失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/run-history/archives', methods=['GET'])
+def get_run_history_archives():
+    """获取运行历史归档概况"""
+    try:
+        archives = db.get_run_history_archives()
+        return jsonify({
+            'success': True,
+            'archives': archives
+        })
+    except Exception as e:
+        uat_logger.error(f"获取运行历史归档失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/cases/<int:case_id>/run-history/archive', methods=['GET'])
+def get_case_archived_run_history(case_id):
+    """获取指定测试用例已归档的运行历史记录"""
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', 20))
+        result = db.get_archived_run_history(case_id, page, page_size)
+        return jsonify({
+            'success': True,
+            'history': result['history'],
+            'total': result['total'],
+            'page': page,
+            'page_size': page_size
+        })
+    except Exception as e:
+        uat_logger.error(f"获取已归档运行历史记录失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/api/execute_multiple_cases', methods=['POST'])
+@requires_automation
 @api_error_handler
+@log_job_context
 @log_api_request
 def execute_multiple_cases():
     """执行多个测试用例"""
@@ -1418,9 +1985,6 @@ def execute_multiple_cases():
                 'error': '请提供有效的测试用例ID列表'
             }), 400
         
-        # 初始化数据库连接
-        db = Database()
-        
         # 执行结果
         case_results = []
         total_cases = len(case_ids)
@@ -1429,6 +1993,8 @@ def execute_multiple_cases():
         
         # 逐个执行测试用例
         for case_id in case_ids:
+            # 每个用例一个运行ID，该用例的日志和运行历史记录通过它关联
+            uat_logger.update_context(run_id=new_run_id(), case_id=case_id, step=None)
             try:
                 # 获取测试用例信息
                 case = db.get_test_case_v2(case_id)
@@ -1487,6 +2053,7 @@ def execute_multiple_cases():
                     
                     # 执行所有步骤
                     for step in steps:
+                        uat_logger.set_step(step.get('step_order'))
                         action = step.get('action', '')
                         selector_type = step.get('selector_type', 'css')
                         selector_value = step.get('selector_value', '')
@@ -1683,7 +2250,6 @@ def execute_multiple_cases():
                     uat_logger.info(f"测试用例 #{case_id} 运行成功，耗时: {duration}秒")
                     
                     # 保存运行结果到数据库
-                    db = Database()
                     db.add_run_history(
                         case_id=case_id,
                         status='passed',
@@ -1709,7 +2275,6 @@ def execute_multiple_cases():
                     uat_logger.error(f"运行测试用例 #{case_id} 时发生错误: {str(e)}")
                     
                     # 保存失败结果到数据库
-                    db = Database()
                     db.add_run_history(
                         case_id=case_id,
                         status='failed',
@@ -1765,5 +2330,38 @@ def execute_multiple_cases():
             'error': str(e)
         }), 500
 
+def create_app(db_path: str = None, history_db_path: str = None, role: str = None) -> Flask:
+    """创建Flask应用
+
+    role为authoring时（或环境变量UAT_APP_ROLE=authoring）只提供用例编辑和运行历史，
+    进程内从不导入Playwright；full角色在第一次调用自动化接口时才导入自动化引擎。
+    """
+    role = automation_loader.resolve_role(role)
+    automation_loader.set_enabled(role != automation_loader.ROLE_AUTHORING)
+
+    app = Flask(__name__)
+    CORS(app)
+    # 设置Flask应用的密钥，用于session加密
+    app.secret_key = 'your-secret-key-here'
+    app.config['UAT_APP_ROLE'] = role
+    # 更快的JSON序列化和响应压缩
+    api_response.init_app(app)
+
+    # 初始化数据库（执行尚未应用的结构迁移）
+    app.extensions['uat_db'] = Database(db_path or 'test_cases.db', history_db_path)
+    app.register_blueprint(bp)
+    return app
+
+_app = None
+
+def __getattr__(name):
+    """兼容`from app import app`：第一次访问时才创建默认应用"""
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,114 @@
+import importlib
+import os
+import threading
+
+# 进程角色（环境变量）：full加载自动化引擎；authoring只提供用例编辑和运行历史，从不加载Playwright
+APP_ROLE_ENV = 'UAT_APP_ROLE'
+ROLE_FULL = 'full'
+ROLE_AUTHORING = 'authoring'
+APP_ROLES = (ROLE_FULL, ROLE_AUTHORING)
+
+# 自动化引擎模块（连同Playwright和文本提取模块）在第一次使用时才导入
+AUTOMATION_MODULE = 'playwright_automation'
+
+_module = None
+_lock = threading.Lock()
+_enabled = True
+
+
+class AutomationUnavailable(RuntimeError):
+    """当前进程角色不加载自动化引擎"""
+
+
+def resolve_role(role: str = None) -> str:
+    """确定进程角色，未指定时读取环境变量，默认full"""
+    role = (role or os.environ.get(APP_ROLE_ENV) or ROLE_FULL).strip().lower()
+    if role not in APP_ROLES:
+        raise ValueError(f"无效的进程角色: {role}，可选: {', '.join(APP_ROLES)}")
+    return role
+
+
+def set_enabled(enabled: bool):
+    """authoring角色调用set_enabled(False)；已加载的引擎不会被卸载"""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def is_loaded() -> bool:
+    return _module is not None
+
+
+def load():
+    """导入自动化引擎模块（只导入一次），导入时会启动Playwright工作线程"""
+    global _module
+    if _module is None:
+        if not _enabled:
+            raise AutomationUnavailable("当前进程为authoring角色，不提供浏览器自动化功能")
+        with _lock:
+            if _module is None:
+                _module = importlib.import_module(AUTOMATION_MODULE)
+    return _module
+
+
+class _LazyAttribute:
+    """代理自动化引擎模块中的全局对象（如automation），每次访问时重新取值
+
+    reset_automation_instance会替换模块中的全局实例，所以不能缓存取到的对象。
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(getattr(load(), self._name), attr)
+
+    def __repr__(self):
+        state = 'loaded' if is_loaded() else 'not loaded'
+        return f"<lazy {AUTOMATION_MODULE}.{self._name} ({state})>"
+
+
+def _lazy_function(name: str):
+    def call(*args, **kwargs):
+        return getattr(load(), name)(*args, **kwargs)
+    call.__name__ = call.__qualname__ = name
+    return call
+
+
+automation = _LazyAttribute('automation')
+worker = _LazyAttribute('worker')
+
+sync_start_browser = _lazy_function('sync_start_browser')
+sync_navigate_to = _lazy_function('sync_navigate_to')
+sync_click_element = _lazy_function('sync_click_element')
+sync_fill_input = _lazy_function('sync_fill_input')
+sync_scroll_page = _lazy_function('sync_scroll_page')
+sync_get_page_text = _lazy_function('sync_get_page_text')
+sync_extract_element_text = _lazy_function('sync_extract_element_text')
+sync_extract_element_json = _lazy_function('sync_extract_element_json')
+sync_execute_script_steps = _lazy_function('sync_execute_script_steps')
+sync_close_browser = _lazy_function('sync_close_browser')
+sync_wait_for_timeout = _lazy_function('sync_wait_for_timeout')
+sync_get_all_links = _lazy_function('sync_get_all_links')
+sync_get_page_title = _lazy_function('sync_get_page_title')
+sync_get_current_url = _lazy_function('sync_get_current_url')
+sync_wait_for_selector = _lazy_function('sync_wait_for_selector')
+sync_take_screenshot = _lazy_function('sync_take_screenshot')
+sync_hover_element = _lazy_function('sync_hover_element')
+sync_double_click_element = _lazy_function('sync_double_click_element')
+sync_right_click_element = _lazy_function('sync_right_click_element')
+sync_get_page_elements = _lazy_function('sync_get_page_elements')
+sync_extract_element_data = _lazy_function('sync_extract_element_data')
+sync_get_page_data = _lazy_function('sync_get_page_data')
+sync_analyze_page_content = _lazy_function('sync_analyze_page_content')
+sync_wait_for_element_visible = _lazy_function('sync_wait_for_element_visible')
+sync_start_recording = _lazy_function('sync_start_recording')
+sync_stop_recording = _lazy_function('sync_stop_recording')
+sync_enable_element_selection = _lazy_function('sync_enable_element_selection')
+sync_disable_element_selection = _lazy_function('sync_disable_element_selection')
+sync_get_selected_element = _lazy_function('sync_get_selected_element')
+sync_extract_json_from_selected_element = _lazy_function('sync_extract_json_from_selected_element')
+sync_execute_multiple_test_cases = _lazy_function('sync_execute_multiple_test_cases')
@@ -0,0 +1,87 @@
+"""数据库CRUD吞吐量基准测试
+
+对比旧的"每次操作新建连接"方式与连接池方式的增删改查吞吐量。
+用法: python benchmark_db.py [操作次数]
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+from database import Database
+
+
+def _legacy_crud(db_path: str, case_id: int, n: int):
+    """模拟旧实现：每个操作都 connect / commit / close"""
+    step_ids = []
+    for i in range(n):
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(step_order) FROM test_steps WHERE case_id = ?", (case_id,))
+        max_order = cursor.fetchone()[0]
+        cursor.execute(
+            "INSERT INTO test_steps (case_id, action, selector_value, step_order) VALUES (?, ?, ?, ?)",
+            (case_id, 'click', f'#btn-{i}', (max_order or 0) + 1)
+        )
+        step_ids.append(cursor.lastrowid)
+        conn.commit()
+        conn.close()
+    for step_id in step_ids:
+        conn = sqlite3.connect(db_path)
+        conn.execute("SELECT * FROM test_steps WHERE id = ?", (step_id,)).fetchone()
+        conn.close()
+    for step_id in step_ids:
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE test_steps SET description = ? WHERE id = ?", ('updated', step_id))
+        conn.commit()
+        conn.close()
+    for step_id in step_ids:
+        conn = sqlite3.connect(db_path)
+        conn.execute("DELETE FROM test_steps WHERE id = ?", (step_id,))
+        conn.commit()
+        conn.close()
+
+
+def _pooled_crud(db: Database, case_id: int, n: int):
+    """使用连接池的Database方法"""
+    step_ids = [db.create_test_step(case_id, 'click', 'css', f'#btn-{i}') for i in range(n)]
+    for step_id in step_ids:
+        db.get_test_step(step_id)
+    for step_id in step_ids:
+        db.update_test_step(step_id, description='updated')
+    for step_id in step_ids:
+        db.delete_test_step(step_id)
+
+
+def run_benchmark(n: int = 500):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 旧实现使用默认的回滚日志模式
+        legacy_path = os.path.join(tmp_dir, 'legacy.db')
+        legacy_db = Database(legacy_path)
+        case_id = legacy_db.create_test_case_v2(1, 'benchmark')
+        legacy_db._pool.close_all()
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+        start = time.perf_counter()
+        _legacy_crud(legacy_path, case_id, n)
+        legacy_elapsed = time.perf_counter() - start
+
+        pooled_db = Database(os.path.join(tmp_dir, 'pooled.db'))
+        case_id = pooled_db.create_test_case_v2(1, 'benchmark')
+        start = time.perf_counter()
+        _pooled_crud(pooled_db, case_id, n)
+        pooled_elapsed = time.perf_counter() - start
+        pooled_db._pool.close_all()
+
+    total_ops = n * 4
+    print(f"操作次数: {total_ops} (创建/读取/更新/删除 各 {n} 次)")
+    print(f"旧实现:   {legacy_elapsed:.3f}秒, {total_ops / legacy_elapsed:.0f} 次/秒")
+    print(f"连接池:   {pooled_elapsed:.3f}秒, {total_ops / pooled_elapsed:.0f} 次/秒")
+    print(f"提升:     {legacy_elapsed / pooled_elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,69 @@
+import hashlib
+import sqlite3
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+
+# 不小于该字节数的文本存入text_blobs，较短的文本直接内联保存
+BLOB_MIN_BYTES = 256
+# 存入text_blobs的文本在运行历史中保留的预览长度（字符），运行历史列表也按该长度返回预览
+PREVIEW_CHARS = 200
+ZLIB_LEVEL = 6
+
+
+def decompress_text(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
+
+
+def store_text(cursor: sqlite3.Cursor, text: Optional[str], fts: bool = False) -> Tuple[Optional[str], Optional[int]]:
+    """保存文本，返回(内联值, blob_id)
+
+    短文本原样内联，blob_id为None；长文本按内容去重写入text_blobs，内联值为预览。
+    引用计数由run_history上的触发器维护，这里只负责创建blob。
+    """
+    if text is None:
+        return None, None
+    encoded = text.encode('utf-8')
+    if len(encoded) < BLOB_MIN_BYTES:
+        return text, None
+
+    digest = hashlib.sha256(encoded).hexdigest()
+    row = cursor.execute("SELECT id FROM text_blobs WHERE hash = ?", (digest,)).fetchone()
+    if row:
+        return text[:PREVIEW_CHARS], row[0]
+
+    cursor.execute(
+        "INSERT INTO text_blobs (hash, data, size, refcount) VALUES (?, ?, ?, 0)",
+        (digest, zlib.compress(encoded, ZLIB_LEVEL), len(encoded))
+    )
+    blob_id = cursor.lastrowid
+    if fts:
+        cursor.execute("INSERT INTO text_blobs_fts (rowid, content) VALUES (?, ?)", (blob_id, text))
+    return text[:PREVIEW_CHARS], blob_id
+
+
+def load_texts(cursor: sqlite3.Cursor, blob_ids: Iterable[Optional[int]]) -> Dict[int, str]:
+    """批量读取并解压blob，返回 {blob_id: 文本}"""
+    ids = sorted({blob_id for blob_id in blob_ids if blob_id is not None})
+    if not ids:
+        return {}
+    cursor.execute(
+        f"SELECT id, data FROM text_blobs WHERE id IN ({', '.join(['?'] * len(ids))})",
+        ids
+    )
+    return {blob_id: decompress_text(data) for blob_id, data in cursor.fetchall()}
+
+
+def collect_garbage(cursor: sqlite3.Cursor, fts: bool = False) -> int:
+    """删除引用计数归零的blob，返回删除数量"""
+    cursor.execute("SELECT id, data FROM text_blobs WHERE refcount <= 0")
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+    if fts:
+        # 无内容(contentless)的FTS表删除时需要提供原始文本
+        cursor.executemany(
+            "INSERT INTO text_blobs_fts (text_blobs_fts, rowid, content) VALUES ('delete', ?, ?)",
+            [(blob_id, decompress_text(data)) for blob_id, data in rows]
+        )
+    cursor.executemany("DELETE FROM text_blobs WHERE id = ?", [(blob_id,) for blob_id, _ in rows])
+    return len(rows)
@@ -0,0 +1,190 @@
+import json
+import math
+from typing import Any, Dict, Iterable, Optional
+
+# 视为通过的运行状态
+PASSED_STATUSES = ('success', 'passed')
+
+# 分位数草图的相对误差（对数分桶，桶宽为 GAMMA 倍），同一草图可直接按桶相加合并
+SKETCH_RELATIVE_ACCURACY = 0.02
+SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+SKETCH_MIN_VALUE = 0.001
+
+# 不稳定度：相邻两次运行结果翻转的指数加权平均，越接近1越不稳定
+FLAKINESS_ALPHA = 0.1
+
+STATS_COLUMNS = (
+    'case_id', 'total_runs', 'passed_runs', 'failed_runs',
+    'duration_count', 'duration_mean', 'duration_m2', 'duration_min', 'duration_max',
+    'duration_sketch', 'last_run_at', 'last_status', 'last_failure_at',
+    'status_flips', 'flakiness'
+)
+
+
+def new_stats(case_id: int) -> Dict[str, Any]:
+    """创建空的用例统计"""
+    return {
+        'case_id': case_id,
+        'total_runs': 0,
+        'passed_runs': 0,
+        'failed_runs': 0,
+        'duration_count': 0,
+        'duration_mean': 0.0,
+        'duration_m2': 0.0,
+        'duration_min': None,
+        'duration_max': None,
+        'duration_sketch': {},
+        'last_run_at': None,
+        'last_status': None,
+        'last_failure_at': None,
+        'status_flips': 0,
+        'flakiness': 0.0
+    }
+
+
+def _sketch_key(value: float) -> int:
+    if value <= SKETCH_MIN_VALUE:
+        return 0
+    return int(math.ceil(math.log(value / SKETCH_MIN_VALUE, SKETCH_GAMMA)))
+
+
+def _sketch_value(key: int) -> float:
+    if key <= 0:
+        return 0.0
+    # 取桶的几何中点，保证相对误差不超过 SKETCH_RELATIVE_ACCURACY
+    return SKETCH_MIN_VALUE * 2 * SKETCH_GAMMA ** key / (SKETCH_GAMMA + 1)
+
+
+def apply_run(stats: Dict[str, Any], status: str, duration: Optional[float], created_at: str) -> Dict[str, Any]:
+    """把一次运行结果累加到统计中（原地修改并返回）"""
+    passed = status in PASSED_STATUSES
+
+    if stats['last_status'] is not None:
+        flipped = (stats['last_status'] in PASSED_STATUSES) != passed
+        if flipped:
+            stats['status_flips'] += 1
+        stats['flakiness'] = (1 - FLAKINESS_ALPHA) * stats['flakiness'] + FLAKINESS_ALPHA * (1.0 if flipped else 0.0)
+
+    stats['total_runs'] += 1
+    if passed:
+        stats['passed_runs'] += 1
+    else:
+        stats['failed_runs'] += 1
+        stats['last_failure_at'] = created_at
+    stats['last_run_at'] = created_at
+    stats['last_status'] = status
+
+    if duration is not None:
+        # Welford算法增量计算均值和方差
+        duration = float(duration)
+        stats['duration_count'] += 1
+        delta = duration - stats['duration_mean']
+        stats['duration_mean'] += delta / stats['duration_count']
+        stats['duration_m2'] += delta * (duration - stats['duration_mean'])
+        stats['duration_min'] = duration if stats['duration_min'] is None else min(stats['duration_min'], duration)
+        stats['duration_max'] = duration if stats['duration_max'] is None else max(stats['duration_max'], duration)
+
+        key = str(_sketch_key(duration))
+        stats['duration_sketch'][key] = stats['duration_sketch'].get(key, 0) + 1
+
+    return stats
+
+
+def merge_stats(stats_list: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并多个用例的统计（用于项目级统计）"""
+    merged = new_stats(None)
+    flakiness_weight = 0
+
+    for stats in stats_list:
+        merged['total_runs'] += stats['total_runs']
+        merged['passed_runs'] += stats['passed_runs']
+        merged['failed_runs'] += stats['failed_runs']
+        merged['status_flips'] += stats['status_flips']
+
+        # Chan并行算法合并均值和M2
+        count = stats['duration_count']
+        if count:
+            total = merged['duration_count'] + count
+            delta = stats['duration_mean'] - merged['duration_mean']
+            merged['duration_mean'] += delta * count / total
+            merged['duration_m2'] += stats['duration_m2'] + delta * delta * merged['duration_count'] * count / total
+            merged['duration_count'] = total
+            merged['duration_min'] = stats['duration_min'] if merged['duration_min'] is None else min(merged['duration_min'], stats['duration_min'])
+            merged['duration_max'] = stats['duration_max'] if merged['duration_max'] is None else max(merged['duration_max'], stats['duration_max'])
+
+        for key, bucket_count in stats['duration_sketch'].items():
+            merged['duration_sketch'][key] = merged['duration_sketch'].get(key, 0) + bucket_count
+
+        if stats['last_run_at'] and (merged['last_run_at'] is None or stats['last_run_at'] > merged['last_run_at']):
+            merged['last_run_at'] = stats['last_run_at']
+            merged['last_status'] = stats['last_status']
+        if stats['last_failure_at'] and (merged['last_failure_at'] is None or stats['last_failure_at'] > merged['last_failure_at']):
+            merged['last_failure_at'] = stats['last_failure_at']
+
+        # 项目不稳定度按运行次数加权
+        merged['flakiness'] += stats['flakiness'] * stats['total_runs']
+        flakiness_weight += stats['total_runs']
+
+    if flakiness_weight:
+        merged['flakiness'] /= flakiness_weight
+    return merged
+
+
+def quantile(sketch: Dict[str, int], q: float) -> Optional[float]:
+    """从草图中估算分位数"""
+    total = sum(sketch.values())
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for key in sorted(sketch, key=int):
+        seen += sketch[key]
+        if seen > rank:
+            return _sketch_value(int(key))
+    return _sketch_value(int(max(sketch, key=int)))
+
+
+def stats_from_row(row) -> Dict[str, Any]:
+    """将case_stats表的一行转换为统计字典"""
+    stats = dict(zip(STATS_COLUMNS, row))
+    stats['duration_sketch'] = json.loads(stats['duration_sketch'] or '{}')
+    return stats
+
+
+def stats_to_row(stats: Dict[str, Any]) -> tuple:
+    """将统计字典转换为case_stats表的一行"""
+    values = dict(stats)
+    values['duration_sketch'] = json.dumps(stats['duration_sketch'], separators=(',', ':'))
+    return tuple(values[column] for column in STATS_COLUMNS)
+
+
+def summarize(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """生成对外展示的统计摘要"""
+    count = stats['duration_count']
+    total = stats['total_runs']
+    return {
+        'total_runs': total,
+        'passed_runs': stats['passed_runs'],
+        'failed_runs': stats['failed_runs'],
+        'pass_rate': round(stats['passed_runs'] / total, 4) if total else None,
+        'duration_mean': round(stats['duration_mean'], 3) if count else None,
+        'duration_stddev': round(math.sqrt(stats['duration_m2'] / (count - 1)), 3) if count > 1 else None,
+        'duration_min': stats['duration_min'],
+        'duration_max': stats['duration_max'],
+        'duration_p50': _clamped_quantile(stats, 0.5),
+        'duration_p95': _clamped_quantile(stats, 0.95),
+        'last_run_at': stats['last_run_at'],
+        'last_status': stats['last_status'],
+        'last_failure_at': stats['last_failure_at'],
+        'status_flips': stats['status_flips'],
+        'flakiness': round(stats['flakiness'], 4)
+    }
+
+
+def _clamped_quantile(stats: Dict[str, Any], q: float) -> Optional[float]:
+    """分位数估算值限制在实际最小值和最大值之间"""
+    value = quantile(stats['duration_sketch'], q)
+    if value is None:
+        return None
+    value = min(max(value, stats['duration_min']), stats['duration_max'])
+    return round(value, 3)
@@ -18,32 +18,28 @@ if case_result.get('success'):
     case_id = case_result.get('case_id')
     print(f"创建测试用例成功，ID: {case_id}")
     
-    # 创建测试步骤 - 导航到百度首页
-    step1_data = {
-        "case_id": case_id,
-        "action": "navigate",
-        "input_value": "https://www.baidu.com",
-        "description": "导航到百度首页"
-    }
+    # 一次请求批量创建所有测试步骤
+    steps = [
+        # 导航到百度首页
+        {
+            "action": "navigate",
+            "input_value": "https://www.baidu.com",
+            "description": "导航到百度首页"
+        },
+        # 提取百度首页标题
+        {
+            "action": "text_compare",
+            "selector_type": "css",
+            "selector_value": "#su",
+            "input_value": "百度一下",
+            "description": "验证百度首页搜索按钮文本",
+            "compare_type": "equals"
+        }
+    ]
     
-    step1_response = requests.post(f"http://localhost:5000/api/steps", json=step1_data)
-    step1_result = step1_response.json()
-    print(f"创建步骤1响应: {step1_result}")
-    
-    # 创建测试步骤 - 提取百度首页标题
-    step2_data = {
-        "case_id": case_id,
-        "action": "text_compare",
-        "selector_type": "css",
-        "selector_value": "#su",
-        "input_value": "百度一下",
-        "description": "验证百度首页搜索按钮文本",
-        "compare_type": "equals"
-    }
-    
-    step2_response = requests.post(f"http://localhost:5000/api/steps", json=step2_data)
-    step2_result = step2_response.json()
-    print(f"创建步骤2响应: {step2_result}")
+    steps_response = requests.post(f"http://localhost:5000/api/cases/{case_id}/steps/bulk", json={"steps": steps})
+    steps_result = steps_response.json()
+    print(f"批量创建步骤响应: {steps_result}")
     
     # 运行测试用例
     print(f"\n运行测试用例 #{case_id}...")
@@ -1,506 +1,436 @@
+import os
 import sqlite3
 import json
-from datetime import datetime
-from typing import List, Dict, Any
+import base64
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+from db_pool import get_pool
+from db_migrations import migrate, split_history_database, install_cross_database_triggers, fts_available, VERSIONED_TABLES, STEP_ORDER_GAP
+import case_stats
+import history_archive
+import blob_store
+import project_transfer
+import history_export
+from history_writer import get_history_writer
+from definition_cache import definition_cache, MISSING
+from purge_worker import get_purge_worker
+from logger import current_log_context, uat_logger
+
+# 测试步骤可写字段及其默认值（与create_test_step参数默认值一致）
+STEP_FIELD_DEFAULTS = {
+    'action': '',
+    'selector_type': '',
+    'selector_value': '',
+    'input_value': '',
+    'description': '',
+    'page_name': '',
+    'swipe_x': '',
+    'swipe_y': '',
+    'url': '',
+    'enter_iframe': False,
+    'iframe_selector': '',
+    'compare_type': 'equals',
+}
+
+# 带搜索条件的计数缓存: (db_path, case_id, search_text, project_id) -> (count, 缓存时间)，LRU，最多COUNT_CACHE_MAX_ENTRIES条
+COUNT_CACHE_TTL = 30
+COUNT_CACHE_MAX_ENTRIES = 256
+_count_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def _get_cached_count(key: tuple) -> Optional[int]:
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[1] >= COUNT_CACHE_TTL:
+            del _count_cache[key]
+            return None
+        _count_cache.move_to_end(key)
+        return cached[0]
+
+
+def _put_cached_count(key: tuple, count: int):
+    """写入时顺便删除已过期的条目，超出容量时淘汰最久未用的"""
+    now = time.monotonic()
+    with _count_cache_lock:
+        for expired in [k for k, (_, cached_at) in _count_cache.items() if now - cached_at >= COUNT_CACHE_TTL]:
+            del _count_cache[expired]
+        _count_cache[key] = (count, now)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > COUNT_CACHE_MAX_ENTRIES:
+            _count_cache.popitem(last=False)
+
+
+def _clear_count_cache(db_path: str):
+    with _count_cache_lock:
+        for key in [key for key in _count_cache if key[0] == db_path]:
+            del _count_cache[key]
+
+# 本进程内已检查过未完成清理任务的数据库文件
+_purge_resumed = set()
+
+
+# 运行历史独立数据库文件（环境变量），设置后运行历史相关的表放在该文件中并ATTACH为history
+HISTORY_DB_ENV = 'UAT_HISTORY_DB_PATH'
+HISTORY_SCHEMA = 'history'
+
+# 运行历史保留策略默认值：超过天数或超出每个用例最近条数的记录移入归档
+RETENTION_MAX_AGE_DAYS = 90
+RETENTION_KEEP_PER_CASE = 500
+# 每批归档的记录数，每批一个事务，避免长时间持有写锁
+RETENTION_BATCH_SIZE = 500
+
+# 后台清理每批最多删除的行数（步骤+运行历史），以及每批处理的用例数
+PURGE_BATCH_SIZE = 500
+PURGE_CASES_PER_BATCH = 50
+PURGE_JOB_COLUMNS = ("id, kind, target_id, status, total_cases, purged_cases, deleted_steps, deleted_runs, error, "
+                     "created_at, updated_at, finished_at")
+
+
+# 各查询使用的字段（按列名解码，不依赖表中字段的物理顺序）
+TEST_CASE_COLUMNS = "id, project_id, name, url, description, created_at, precondition, expected_result"
+TEST_STEP_COLUMNS = ("id, case_id, action, selector_type, selector_value, input_value, description, step_order, created_at, "
+                     "page_name, swipe_x, swipe_y, url, enter_iframe, iframe_selector, compare_type")
+# 运行历史列表只返回预览（不读取text_blobs，长度与存入blob时内联保留的预览一致），完整文本由详情接口返回
+HISTORY_LIST_COLUMNS = (f"rh.id, rh.case_id, rh.status, rh.duration, "
+                        f"substr(rh.error, 1, {blob_store.PREVIEW_CHARS}) AS error, "
+                        f"substr(rh.extracted_text, 1, {blob_store.PREVIEW_CHARS}) AS extracted_text, "
+                        f"rh.created_at, rh.expected_text")
+HISTORY_DETAIL_COLUMNS = ("rh.id, rh.case_id, rh.status, rh.duration, rh.error, rh.extracted_text, rh.created_at, rh.expected_text, "
+                          "rh.log_run_id, rh.error_blob, rh.extracted_text_blob")
+
+# 查询语句 -> 结果列名；同一形状的查询只解析一次cursor.description
+_query_columns: Dict[str, tuple] = {}
+
+
+def fetch_dicts(cursor: sqlite3.Cursor, sql: str, params=()) -> List[Dict[str, Any]]:
+    """执行查询并按列名把每行解码为字典"""
+    cursor.execute(sql, params)
+    columns = _query_columns.get(sql)
+    if columns is None:
+        columns = tuple(column[0] for column in cursor.description)
+        _query_columns[sql] = columns
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def fetch_dict(cursor: sqlite3.Cursor, sql: str, params=()) -> Optional[Dict[str, Any]]:
+    """执行查询并返回第一行（按列名解码），没有结果时返回None"""
+    rows = fetch_dicts(cursor, sql, params)
+    return rows[0] if rows else None
+
+
+def _purge_progress(job: Dict[str, Any]) -> float:
+    """清理任务完成的用例比例（0~1）"""
+    return round(job['purged_cases'] / job['total_cases'], 4) if job['total_cases'] else 1.0
+
+
+# trigram分词器要求每个检索词至少3个字符
+FTS_MIN_TERM_LENGTH = 3
+# bm25权重：用例名称、错误信息、提取文本、预期结果
+FTS_RANK_WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+# 各数据库文件是否已建立全文索引
+_fts_available: Dict[str, bool] = {}
+
+
+def build_fts_query(search_text: str) -> Optional[str]:
+    """将用户输入转换为FTS5查询（各词之间为AND）；存在过短的词时返回None，由调用方退化为LIKE"""
+    terms = search_text.split()
+    if not terms or any(len(term) < FTS_MIN_TERM_LENGTH for term in terms):
+        return None
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def encode_history_cursor(created_at: str, record_id: int) -> str:
+    """将(created_at, id)编码为不透明的游标字符串"""
+    raw = json.dumps([created_at, record_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_history_cursor(cursor_token: str):
+    """解析游标字符串，格式错误时抛出ValueError"""
+    try:
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(cursor_token.encode('ascii')))
+        return created_at, int(record_id)
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor_token}")
+
 
 class Database:
-    def __init__(self, db_path: str = "test_cases.db"):
+    def __init__(self, db_path: str = "test_cases.db", history_db_path: Optional[str] = None):
         self.db_path = db_path
+        # 运行历史可以放在独立的数据库文件中，与用例编辑各自加写锁、各自备份和回收空间
+        self.history_db_path = history_db_path or os.environ.get(HISTORY_DB_ENV) or None
+        self.history_schema = HISTORY_SCHEMA if self.history_db_path else 'main'
+        # 同一数据库文件的所有Database实例共享一个连接池
+        attachments = {HISTORY_SCHEMA: self.history_db_path} if self.history_db_path else None
+        self._pool = get_pool(db_path, attachments)
         self.init_db()
     
     def init_db(self):
-        """初始化数据库表"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 创建项目表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS projects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # 创建测试用例表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS test_cases (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER,
-                name TEXT NOT NULL,
-                url TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (project_id) REFERENCES projects (id)
-            )
-        ''')
-        
-        # 创建测试步骤表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS test_steps (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                case_id INTEGER,
-                action TEXT NOT NULL,
-                selector_type TEXT,
-                selector_value TEXT,
-                input_value TEXT,
-                description TEXT,
-                step_order INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (case_id) REFERENCES test_cases (id)
-            )
-        ''')
-        
-        # 创建测试脚本表（保留用于兼容性）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS test_scripts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                case_id INTEGER,
-                name TEXT NOT NULL,
-                steps TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (case_id) REFERENCES test_cases (id)
-            )
-        ''')
-        
-        # 添加新字段到test_cases表（如果不存在）
-        try:
-            cursor.execute("ALTER TABLE test_cases ADD COLUMN precondition TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            cursor.execute("ALTER TABLE test_cases ADD COLUMN expected_result TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        # 添加新字段到test_steps表（如果不存在）
-        try:
-            cursor.execute("ALTER TABLE test_steps ADD COLUMN page_name TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            cursor.execute("ALTER TABLE test_steps ADD COLUMN swipe_x TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            cursor.execute("ALTER TABLE test_steps ADD COLUMN swipe_y TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            cursor.execute("ALTER TABLE test_steps ADD COLUMN url TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        # 添加iframe相关字段
-        try:
-            cursor.execute("ALTER TABLE test_steps ADD COLUMN enter_iframe BOOLEAN DEFAULT FALSE")
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            cursor.execute("ALTER TABLE test_steps ADD COLUMN iframe_selector TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        # 创建运行历史记录表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS run_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                case_id INTEGER,
-                status TEXT NOT NULL,
-                duration REAL,
-                error TEXT,
-                extracted_text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (case_id) REFERENCES test_cases (id)
+        """初始化数据库表（执行尚未应用的结构迁移）"""
+        with self._pool.connection() as conn:
+            migrate(conn, self.db_path)
+            if self.history_db_path:
+                split_history_database(conn, self.db_path, HISTORY_SCHEMA)
+        if self.history_db_path:
+            self._pool.add_connect_hook(
+                'cross_database_triggers',
+                lambda conn: install_cross_database_triggers(conn, HISTORY_SCHEMA)
             )
-        ''')
+        if self.db_path not in _purge_resumed:
+            # 上次进程退出时未完成的清理任务，在后台继续
+            _purge_resumed.add(self.db_path)
+            with self._pool.connection() as conn:
+                pending = conn.execute(
+                    "SELECT 1 FROM purge_jobs WHERE status IN ('pending', 'running') LIMIT 1"
+                ).fetchone()
+            if pending:
+                self._wake_purge_worker()
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """在一个事务中执行多个操作
+        
+        期间同一线程内的Database调用都复用该连接（连接池的嵌套复用），正常退出时一起提交，
+        抛出异常时全部回滚。开始时即获取写锁，避免先读后写时升级锁失败。
+        """
+        with self._pool.connection() as conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+    
+    def _invalidate_case(self, case_id: int):
+        """用例或其步骤被修改：立即使缓存失效，事务结束后再失效一次
         
-        conn.commit()
-        conn.close()
+        事务提交前其他线程读到的仍是旧数据，可能又被放回缓存，所以提交（或回滚）后需要再次失效。
+        """
+        definition_cache.invalidate(self.db_path, case_id)
+        self._pool.call_after_transaction(lambda: definition_cache.invalidate(self.db_path, case_id))
+    
+    def _invalidate_step_case(self, cursor, step_id: int):
+        """按步骤ID找到所属用例并使其缓存失效"""
+        row = cursor.execute("SELECT case_id FROM test_steps WHERE id = ?", (step_id,)).fetchone()
+        if row:
+            self._invalidate_case(row[0])
+    
+    def get_definition_cache_stats(self) -> Dict[str, Any]:
+        """用例定义缓存的命中率等指标"""
+        return definition_cache.stats()
     
     def create_test_case(self, name: str, description: str = "", url: str = "") -> int:
         """创建测试用例"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "INSERT INTO test_cases (name, description, url) VALUES (?, ?, ?)",
-            (name, description, url)
-        )
-        case_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
-        
-        return case_id
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "INSERT INTO test_cases (name, description, url) VALUES (?, ?, ?)",
+                (name, description, url)
+            )
+            case_id = cursor.lastrowid
+            
+            return case_id
     
     def get_test_case(self, case_id: int) -> Dict[str, Any]:
         """获取测试用例"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM test_cases WHERE id = ?", (case_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            return {
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'target_url': row[3],
-                'created_at': row[4],
-                'project_id': row[5] if len(row) > 5 else None,
-                'url': row[6] if len(row) > 6 else '',
-                'precondition': row[7] if len(row) > 7 else '',
-                'expected_result': row[8] if len(row) > 8 else ''
-            }
-        
-        conn.close()
-        return None
+        with self._pool.connection() as conn:
+            case = fetch_dict(conn.cursor(), f"SELECT {TEST_CASE_COLUMNS} FROM test_cases WHERE id = ?", (case_id,))
+            if case:
+                # 旧接口使用target_url表示用例URL
+                case['target_url'] = case['url']
+            return case
     
     def get_all_test_cases(self) -> List[Dict[str, Any]]:
         """获取所有测试用例"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM test_cases ORDER BY created_at DESC")
-        rows = cursor.fetchall()
-        
-        cases = []
-        for row in rows:
-            case = {
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'target_url': row[3],
-                'created_at': row[4],
-                'project_id': row[5] if len(row) > 5 else None,
-                'url': row[6] if len(row) > 6 else '',
-                'precondition': row[7] if len(row) > 7 else '',
-                'expected_result': row[8] if len(row) > 8 else ''
-            }
-            cases.append(case)
-        
-        conn.close()
-        return cases
+        with self._pool.connection() as conn:
+            cases = fetch_dicts(conn.cursor(), f"SELECT {TEST_CASE_COLUMNS} FROM test_cases ORDER BY created_at DESC")
+            for case in cases:
+                case['target_url'] = case['url']
+            return cases
     
     def update_test_case(self, case_id: int, name: str = None, description: str = None, url: str = None) -> bool:
         """更新测试用例"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 构建更新语句和参数
-        updates = []
-        params = []
-        
-        if name is not None:
-            updates.append("name = ?")
-            params.append(name)
-        
-        if description is not None:
-            updates.append("description = ?")
-            params.append(description)
-        
-        if url is not None:
-            updates.append("url = ?")
-            params.append(url)
-        
-        if not updates:
-            conn.close()
-            return False
-        
-        query = f"UPDATE test_cases SET {', '.join(updates)} WHERE id = ?"
-        params.append(case_id)
-        
-        cursor.execute(query, params)
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # 构建更新语句和参数
+            updates = []
+            params = []
+            
+            if name is not None:
+                updates.append("name = ?")
+                params.append(name)
+            
+            if description is not None:
+                updates.append("description = ?")
+                params.append(description)
+            
+            if url is not None:
+                updates.append("url = ?")
+                params.append(url)
+            
+            if not updates:
+                return False
+            
+            query = f"UPDATE test_cases SET {', '.join(updates)} WHERE id = ?"
+            params.append(case_id)
+            
+            cursor.execute(query, params)
+            success = cursor.rowcount > 0
+            self._invalidate_case(case_id)
+            
+            return success
     
     def delete_test_case(self, case_id: int) -> bool:
-        """删除测试用例"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 删除测试用例
-        cursor.execute("DELETE FROM test_cases WHERE id = ?", (case_id,))
-        
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        """删除测试用例（步骤和运行历史由后台分批清理）"""
+        return self.purge_case(case_id) is not None
     
     # ==================== 项目管理方法 ====================
     
     def create_project(self, name: str, description: str = "") -> int:
         """创建项目"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "INSERT INTO projects (name, description) VALUES (?, ?)",
-            (name, description)
-        )
-        project_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
-        
-        return project_id
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "INSERT INTO projects (name, description) VALUES (?, ?)",
+                (name, description)
+            )
+            project_id = cursor.lastrowid
+            
+            return project_id
     
     def get_project(self, project_id: int) -> Dict[str, Any]:
         """获取项目"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM projects WHERE id = ?", (project_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            return {
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'created_at': row[3]
-            }
-        
-        conn.close()
-        return None
+        with self._pool.connection() as conn:
+            return fetch_dict(conn.cursor(), "SELECT id, name, description, created_at FROM projects WHERE id = ?", (project_id,))
     
     def get_all_projects(self) -> List[Dict[str, Any]]:
         """获取所有项目"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM projects ORDER BY created_at DESC")
-        rows = cursor.fetchall()
-        
-        projects = []
-        for row in rows:
-            projects.append({
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'created_at': row[3]
-            })
-        
-        conn.close()
-        return projects
+        with self._pool.connection() as conn:
+            return fetch_dicts(conn.cursor(), "SELECT id, name, description, created_at FROM projects ORDER BY created_at DESC")
     
     def update_project(self, project_id: int, name: str = None, description: str = None) -> bool:
         """更新项目"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        updates = []
-        params = []
-        
-        if name is not None:
-            updates.append("name = ?")
-            params.append(name)
-        
-        if description is not None:
-            updates.append("description = ?")
-            params.append(description)
-        
-        if not updates:
-            conn.close()
-            return False
-        
-        query = f"UPDATE projects SET {', '.join(updates)} WHERE id = ?"
-        params.append(project_id)
-        
-        cursor.execute(query, params)
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            updates = []
+            params = []
+            
+            if name is not None:
+                updates.append("name = ?")
+                params.append(name)
+            
+            if description is not None:
+                updates.append("description = ?")
+                params.append(description)
+            
+            if not updates:
+                return False
+            
+            query = f"UPDATE projects SET {', '.join(updates)} WHERE id = ?"
+            params.append(project_id)
+            
+            cursor.execute(query, params)
+            success = cursor.rowcount > 0
+            
+            return success
     
     def delete_project(self, project_id: int) -> bool:
         """删除项目及其相关测试用例和步骤"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 获取该项目下的所有测试用例
-        cursor.execute("SELECT id FROM test_cases WHERE project_id = ?", (project_id,))
-        case_ids = [row[0] for row in cursor.fetchall()]
-        
-        # 删除所有测试用例的步骤
-        for case_id in case_ids:
-            cursor.execute("DELETE FROM test_steps WHERE case_id = ?", (case_id,))
-        
-        # 删除所有测试用例
-        cursor.execute("DELETE FROM test_cases WHERE project_id = ?", (project_id,))
-        
-        # 删除项目
-        cursor.execute("DELETE FROM projects WHERE id = ?", (project_id,))
-        
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        return self.purge_project(project_id) is not None
     
     def get_project_cases(self, project_id: int) -> List[Dict[str, Any]]:
-        """获取项目下的所有测试用例"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT tc.*, COUNT(ts.id) as step_count
-            FROM test_cases tc
-            LEFT JOIN test_steps ts ON tc.id = ts.case_id
-            WHERE tc.project_id = ?
-            GROUP BY tc.id
-            ORDER BY tc.created_at DESC
-        """, (project_id,))
-        rows = cursor.fetchall()
-        
-        cases = []
-        for row in rows:
-            cases.append({
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'target_url': row[3],
-                'created_at': row[4],
-                'project_id': row[5] if len(row) > 5 else None,
-                'url': row[6] if len(row) > 6 else '',
-                'precondition': row[7] if len(row) > 7 else '',
-                'expected_result': row[8] if len(row) > 8 else '',
-                'step_count': row[9] if len(row) > 9 else 0
-            })
-        
-        conn.close()
-        return cases
-    
-    # ==================== 测试用例管理方法（新版本） ====================
+        """获取项目下的所有测试用例（含步骤数）"""
+        with self._pool.connection() as conn:
+            columns = ', '.join(f"tc.{column.strip()}" for column in TEST_CASE_COLUMNS.split(','))
+            return fetch_dicts(conn.cursor(), f"""
+                SELECT {columns},
+                       (SELECT COUNT(*) FROM test_steps ts WHERE ts.case_id = tc.id) AS step_count
+                FROM test_cases tc
+                WHERE tc.project_id = ?
+                ORDER BY tc.created_at DESC
+            """, (project_id,))
     
     def create_test_case_v2(self, project_id: int, name: str, url: str = "", description: str = "", precondition: str = "", expected_result: str = "") -> int:
         """创建测试用例（新版本，关联到项目）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "INSERT INTO test_cases (project_id, name, url, description, precondition, expected_result) VALUES (?, ?, ?, ?, ?, ?)",
-            (project_id, name, url, description, precondition, expected_result)
-        )
-        case_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
-        
-        return case_id
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "INSERT INTO test_cases (project_id, name, url, description, precondition, expected_result) VALUES (?, ?, ?, ?, ?, ?)",
+                (project_id, name, url, description, precondition, expected_result)
+            )
+            case_id = cursor.lastrowid
+            
+            return case_id
     
     def get_test_case_v2(self, case_id: int) -> Dict[str, Any]:
-        """获取测试用例（新版本）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id, project_id, name, url, description, created_at, precondition, expected_result FROM test_cases WHERE id = ?", (case_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            return {
-                'id': row[0],
-                'project_id': row[1],
-                'name': row[2],
-                'url': row[3],
-                'description': row[4],
-                'created_at': row[5],
-                'precondition': row[6] if len(row) > 6 else '',
-                'expected_result': row[7] if len(row) > 7 else ''
-            }
-        
-        conn.close()
-        return None
+        """获取测试用例（新版本，读穿缓存）"""
+        generation = definition_cache.generation(self.db_path)
+        case = definition_cache.get(self.db_path, 'case', case_id)
+        if case is not MISSING:
+            return case
+        
+        with self._pool.connection() as conn:
+            case = fetch_dict(conn.cursor(), f"SELECT {TEST_CASE_COLUMNS} FROM test_cases WHERE id = ?", (case_id,))
+        if case is not None:
+            definition_cache.put(self.db_path, 'case', case_id, generation, case)
+        return case
     
     def update_test_case_v2(self, case_id: int, name: str = None, url: str = None, description: str = None, precondition: str = None, expected_result: str = None) -> bool:
         """更新测试用例（新版本）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        updates = []
-        params = []
-        
-        if name is not None:
-            updates.append("name = ?")
-            params.append(name)
-        
-        if url is not None:
-            updates.append("url = ?")
-            params.append(url)
-        
-        if description is not None:
-            updates.append("description = ?")
-            params.append(description)
-        
-        if precondition is not None:
-            updates.append("precondition = ?")
-            params.append(precondition)
-        
-        if expected_result is not None:
-            updates.append("expected_result = ?")
-            params.append(expected_result)
-        
-        if not updates:
-            conn.close()
-            return False
-        
-        query = f"UPDATE test_cases SET {', '.join(updates)} WHERE id = ?"
-        params.append(case_id)
-        
-        cursor.execute(query, params)
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
-    
-    def delete_test_case_v2(self, case_id: int) -> bool:
-        """删除测试用例及其相关步骤（新版本）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            # 删除该用例的所有步骤
-            cursor.execute("DELETE FROM test_steps WHERE case_id = ?", (case_id,))
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
             
-            # 删除测试用例
-            cursor.execute("DELETE FROM test_cases WHERE id = ?", (case_id,))
+            updates = []
+            params = []
+            
+            if name is not None:
+                updates.append("name = ?")
+                params.append(name)
+            
+            if url is not None:
+                updates.append("url = ?")
+                params.append(url)
+            
+            if description is not None:
+                updates.append("description = ?")
+                params.append(description)
+            
+            if precondition is not None:
+                updates.append("precondition = ?")
+                params.append(precondition)
+            
+            if expected_result is not None:
+                updates.append("expected_result = ?")
+                params.append(expected_result)
             
-            # 检查是否有行被删除
-            steps_deleted = cursor.rowcount > 0
+            if not updates:
+                return False
             
-            # 提交事务
-            conn.commit()
+            query = f"UPDATE test_cases SET {', '.join(updates)} WHERE id = ?"
+            params.append(case_id)
             
-            # 验证测试用例是否真的被删除
-            cursor.execute("SELECT id FROM test_cases WHERE id = ?", (case_id,))
-            case_exists = cursor.fetchone() is not None
+            cursor.execute(query, params)
+            success = cursor.rowcount > 0
+            self._invalidate_case(case_id)
             
-            return not case_exists
+            return success
+    
+    def delete_test_case_v2(self, case_id: int) -> bool:
+        """删除测试用例及其相关步骤（新版本）"""
+        try:
+            return self.purge_case(case_id) is not None
         except Exception as e:
             print(f"删除测试用例失败: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
     
     # ==================== 测试步骤管理方法 ====================
     
@@ -509,460 +439,1268 @@ class Database:
                          description: str = "", step_order: int = None, page_name: str = "",
                          swipe_x: str = "", swipe_y: str = "", url: str = "",
                          enter_iframe: bool = False, iframe_selector: str = "", compare_type: str = "equals") -> int:
-        """创建测试步骤"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """创建测试步骤
         
-        # 如果没有指定step_order，自动计算最大顺序值
-        if step_order is None:
-            cursor.execute("SELECT MAX(step_order) FROM test_steps WHERE case_id = ?", (case_id,))
-            max_order = cursor.fetchone()[0]
-            step_order = (max_order or 0) + 1
-        
-        cursor.execute(
-            """INSERT INTO test_steps 
-               (case_id, action, selector_type, selector_value, input_value, description, step_order, page_name, swipe_x, swipe_y, url, enter_iframe, iframe_selector, compare_type) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (case_id, action, selector_type, selector_value, input_value, description, step_order, page_name, swipe_x, swipe_y, url, enter_iframe, iframe_selector, compare_type)
-        )
-        step_id = cursor.lastrowid
+        step_order为步骤位置（从1开始），指定时插入到该位置，否则追加到末尾。
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            if step_order is None:
+                # 走(case_id, step_order)索引，只读取一个键
+                cursor.execute("SELECT MAX(step_order) FROM test_steps WHERE case_id = ?", (case_id,))
+                max_order = cursor.fetchone()[0]
+                step_order = (max_order or 0) + STEP_ORDER_GAP
+            else:
+                step_order = self._order_key_for_position(cursor, case_id, step_order)
+            
+            cursor.execute(
+                """INSERT INTO test_steps 
+                   (case_id, action, selector_type, selector_value, input_value, description, step_order, page_name, swipe_x, swipe_y, url, enter_iframe, iframe_selector, compare_type) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (case_id, action, selector_type, selector_value, input_value, description, step_order, page_name, swipe_x, swipe_y, url, enter_iframe, iframe_selector, compare_type)
+            )
+            step_id = cursor.lastrowid
+            self._invalidate_case(case_id)
+            
+            return step_id
+    
+    def create_test_steps_bulk(self, case_id: int, steps: List[Dict[str, Any]]) -> List[int]:
+        """批量创建测试步骤（单个事务内executemany），返回按输入顺序排列的新步骤ID
+        
+        步骤字段与create_test_step的参数一致；未指定step_order的步骤依次排在已有步骤之后，
+        指定了step_order（位置）的步骤按输入顺序依次插入到该位置。
+        任一步骤校验失败时抛出ValueError，不会写入任何步骤。
+        """
+        normalized = []
+        for index, step in enumerate(steps):
+            if not isinstance(step, dict):
+                raise ValueError(f"第 {index + 1} 个步骤格式错误")
+            if not step.get('action'):
+                raise ValueError(f"第 {index + 1} 个步骤缺少操作类型")
+            normalized.append({
+                field: step.get(field) if step.get(field) is not None else default
+                for field, default in STEP_FIELD_DEFAULTS.items()
+            })
+            normalized[-1]['step_order'] = step.get('step_order')
         
-        conn.commit()
-        conn.close()
+        if not normalized:
+            return []
         
-        return step_id
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            # 先获取写锁，保证自增ID连续
+            if not conn.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            
+            insert_sql = f"""INSERT INTO test_steps
+                   (case_id, step_order, {', '.join(STEP_FIELD_DEFAULTS)})
+                   VALUES ({', '.join(['?'] * (len(STEP_FIELD_DEFAULTS) + 2))})"""
+            
+            if all(step['step_order'] is None for step in normalized):
+                cursor.execute("SELECT MAX(step_order) FROM test_steps WHERE case_id = ?", (case_id,))
+                max_order = cursor.fetchone()[0] or 0
+                cursor.executemany(insert_sql, [
+                    (case_id, max_order + STEP_ORDER_GAP * index) + tuple(step[field] for field in STEP_FIELD_DEFAULTS)
+                    for index, step in enumerate(normalized, 1)
+                ])
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'test_steps'")
+                last_id = cursor.fetchone()[0]
+                step_ids = list(range(last_id - len(normalized) + 1, last_id + 1))
+            else:
+                # 插入位置取决于前面插入的步骤，逐条计算键
+                step_ids = []
+                for step in normalized:
+                    if step['step_order'] is None:
+                        cursor.execute("SELECT MAX(step_order) FROM test_steps WHERE case_id = ?", (case_id,))
+                        step_order = (cursor.fetchone()[0] or 0) + STEP_ORDER_GAP
+                    else:
+                        step_order = self._order_key_for_position(cursor, case_id, step['step_order'])
+                    cursor.execute(insert_sql, (case_id, step_order) + tuple(step[field] for field in STEP_FIELD_DEFAULTS))
+                    step_ids.append(cursor.lastrowid)
+            
+            self._invalidate_case(case_id)
+            return step_ids
     
     def get_test_step(self, step_id: int) -> Dict[str, Any]:
-        """获取测试步骤"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM test_steps WHERE id = ?", (step_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            return {
-                'id': row[0],
-                'case_id': row[1],
-                'action': row[2],
-                'selector_type': row[3],
-                'selector_value': row[4],
-                'input_value': row[5],
-                'description': row[6],
-                'step_order': row[7],
-                'created_at': row[8],
-                'page_name': row[9] if len(row) > 9 else '',
-                'swipe_x': row[10] if len(row) > 10 else '',
-                'swipe_y': row[11] if len(row) > 11 else '',
-                'url': row[12] if len(row) > 12 else '',
-                'enter_iframe': row[13] if len(row) > 13 else False,
-                'iframe_selector': row[14] if len(row) > 14 else '',
-                'compare_type': row[15] if len(row) > 15 else 'equals'
-            }
-        
-        conn.close()
-        return None
+        """获取测试步骤（step_order为步骤在用例中的位置）"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            step = fetch_dict(cursor, f"SELECT {TEST_STEP_COLUMNS} FROM test_steps WHERE id = ?", (step_id,))
+            if step:
+                step['step_order'] = cursor.execute(
+                    "SELECT COUNT(*) FROM test_steps WHERE case_id IS ? AND (step_order, id) <= (?, ?)",
+                    (step['case_id'], step['step_order'], step_id)
+                ).fetchone()[0]
+            return step
     
     def get_case_steps(self, case_id: int) -> List[Dict[str, Any]]:
-        """获取测试用例的所有步骤"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM test_steps WHERE case_id = ? ORDER BY step_order ASC", (case_id,))
-        rows = cursor.fetchall()
-        
-        steps = []
-        for row in rows:
-            steps.append({
-                'id': row[0],
-                'case_id': row[1],
-                'action': row[2],
-                'selector_type': row[3],
-                'selector_value': row[4],
-                'input_value': row[5],
-                'description': row[6],
-                'step_order': row[7],
-                'created_at': row[8],
-                'page_name': row[9] if len(row) > 9 else '',
-                'swipe_x': row[10] if len(row) > 10 else '',
-                'swipe_y': row[11] if len(row) > 11 else '',
-                'url': row[12] if len(row) > 12 else '',
-                'enter_iframe': row[13] if len(row) > 13 else False,
-                'iframe_selector': row[14] if len(row) > 14 else '',
-                'compare_type': row[15] if len(row) > 15 else 'equals'
-            })
-        
-        conn.close()
+        """获取测试用例的所有步骤（读穿缓存）"""
+        generation = definition_cache.generation(self.db_path)
+        steps = definition_cache.get(self.db_path, 'steps', case_id)
+        if steps is not MISSING:
+            return steps
+        
+        with self._pool.connection() as conn:
+            # 用例已删除、步骤尚待后台清理时不返回这些步骤
+            steps = fetch_dicts(conn.cursor(), f"""
+                SELECT {TEST_STEP_COLUMNS} FROM test_steps
+                WHERE case_id = ? AND EXISTS (SELECT 1 FROM test_cases WHERE id = ?)
+                ORDER BY step_order, id
+            """, (case_id, case_id))
+        # 对外的step_order是位置（从1开始），稀疏键只在库内使用
+        for position, step in enumerate(steps, 1):
+            step['step_order'] = position
+        definition_cache.put(self.db_path, 'steps', case_id, generation, steps)
         return steps
     
     def update_test_step(self, step_id: int, action: str = None, selector_type: str = None,
                         selector_value: str = None, input_value: str = None,
                         description: str = None, step_order: int = None,
                         enter_iframe: bool = None, iframe_selector: str = None, compare_type: str = None) -> bool:
-        """更新测试步骤"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        updates = []
-        params = []
-        
-        if action is not None:
-            updates.append("action = ?")
-            params.append(action)
-        
-        if selector_type is not None:
-            updates.append("selector_type = ?")
-            params.append(selector_type)
-        
-        if selector_value is not None:
-            updates.append("selector_value = ?")
-            params.append(selector_value)
-        
-        if input_value is not None:
-            updates.append("input_value = ?")
-            params.append(input_value)
-        
-        if description is not None:
-            updates.append("description = ?")
-            params.append(description)
-        
-        if step_order is not None:
-            updates.append("step_order = ?")
-            params.append(step_order)
-        
-        if enter_iframe is not None:
-            updates.append("enter_iframe = ?")
-            params.append(enter_iframe)
-        
-        if iframe_selector is not None:
-            updates.append("iframe_selector = ?")
-            params.append(iframe_selector)
-        
-        if compare_type is not None:
-            updates.append("compare_type = ?")
-            params.append(compare_type)
-        
-        if not updates:
-            conn.close()
-            return False
-        
-        query = f"UPDATE test_steps SET {', '.join(updates)} WHERE id = ?"
-        params.append(step_id)
-        
-        cursor.execute(query, params)
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        """更新测试步骤（step_order为目标位置，从1开始）"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            updates = []
+            params = []
+            
+            if action is not None:
+                updates.append("action = ?")
+                params.append(action)
+            
+            if selector_type is not None:
+                updates.append("selector_type = ?")
+                params.append(selector_type)
+            
+            if selector_value is not None:
+                updates.append("selector_value = ?")
+                params.append(selector_value)
+            
+            if input_value is not None:
+                updates.append("input_value = ?")
+                params.append(input_value)
+            
+            if description is not None:
+                updates.append("description = ?")
+                params.append(description)
+            
+            if step_order is not None:
+                # step_order为目标位置，只修改该步骤自身的键
+                row = cursor.execute("SELECT case_id FROM test_steps WHERE id = ?", (step_id,)).fetchone()
+                if row:
+                    updates.append("step_order = ?")
+                    params.append(self._order_key_for_position(cursor, row[0], step_order, exclude_step_id=step_id))
+            
+            if enter_iframe is not None:
+                updates.append("enter_iframe = ?")
+                params.append(enter_iframe)
+            
+            if iframe_selector is not None:
+                updates.append("iframe_selector = ?")
+                params.append(iframe_selector)
+            
+            if compare_type is not None:
+                updates.append("compare_type = ?")
+                params.append(compare_type)
+            
+            if not updates:
+                return False
+            
+            query = f"UPDATE test_steps SET {', '.join(updates)} WHERE id = ?"
+            params.append(step_id)
+            
+            self._invalidate_step_case(cursor, step_id)
+            cursor.execute(query, params)
+            success = cursor.rowcount > 0
+            
+            return success
     
     def delete_test_step(self, step_id: int) -> bool:
         """删除测试步骤"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM test_steps WHERE id = ?", (step_id,))
-        
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            self._invalidate_step_case(cursor, step_id)
+            cursor.execute("DELETE FROM test_steps WHERE id = ?", (step_id,))
+            
+            success = cursor.rowcount > 0
+            
+            return success
     
     # ==================== 运行历史记录管理方法 ====================
     
-    def create_run_history(self, case_id: int, status: str, duration: float, error: str = "", extracted_text: str = "", expected_text: str = "") -> int:
-        """创建运行历史记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 获取本地时间，而不是使用 UTC 时间
-        import datetime
-        local_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    def create_run_history(self, case_id: int, status: str, duration: float, error: str = "", extracted_text: str = "", expected_text: str = "",
+                           log_run_id: Optional[str] = None) -> int:
+        """创建运行历史记录（log_run_id默认取当前日志上下文中的运行ID）"""
+        with self._pool.connection() as conn:
+            # 获取本地时间，而不是使用 UTC 时间
+            local_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            return self._insert_run_history(conn.cursor(), self._fts_enabled(), case_id, status, duration,
+                                            error, extracted_text, expected_text, local_time,
+                                            log_run_id or current_log_context().get('run_id'))
+    
+    def create_run_history_batch(self, records: List[Dict[str, Any]]) -> List[int]:
+        """在一个事务中批量创建运行历史记录（记录字段同create_run_history，另含created_at）"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            fts = self._fts_enabled()
+            return [
+                self._insert_run_history(
+                    cursor, fts, record['case_id'], record['status'], record['duration'],
+                    record.get('error', ""), record.get('extracted_text', ""), record.get('expected_text', ""),
+                    record.get('created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    record.get('log_run_id')
+                )
+                for record in records
+            ]
+    
+    def enqueue_run_history(self, case_id: int, status: str, duration: float, error: str = "", extracted_text: str = "", expected_text: str = "",
+                            log_run_id: Optional[str] = None):
+        """把运行结果交给后台写入线程批量提交，立即返回，不在执行路径上等待写库
+
+        log_run_id默认取当前日志上下文中的运行ID（写入线程中没有调用方的上下文，所以在这里取）。
+        """
+        get_history_writer(self.db_path, self.create_run_history_batch).submit({
+            'case_id': case_id,
+            'status': status,
+            'duration': duration,
+            'error': error,
+            'extracted_text': extracted_text,
+            'expected_text': expected_text,
+            # 以结果产生的时间为准，而不是实际写入的时间
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'log_run_id': log_run_id or current_log_context().get('run_id')
+        })
+    
+    def get_history_writer_stats(self) -> Dict[str, Any]:
+        """后台写入线程状态（队列深度、已写入数量等）"""
+        return get_history_writer(self.db_path, self.create_run_history_batch).stats()
+    
+    def flush_run_history(self):
+        """等待后台写入线程把已提交的运行结果全部写入"""
+        get_history_writer(self.db_path, self.create_run_history_batch).flush()
+    
+    def _insert_run_history(self, cursor, fts: bool, case_id: int, status: str, duration: float,
+                            error: str, extracted_text: str, expected_text: str, created_at: str,
+                            log_run_id: Optional[str] = None) -> int:
+        # 长文本按内容去重写入text_blobs，运行历史只保存预览和引用
+        error, error_blob = blob_store.store_text(cursor, error, fts)
+        extracted_text, extracted_text_blob = blob_store.store_text(cursor, extracted_text, fts)
         
         cursor.execute(
-            "INSERT INTO run_history (case_id, status, duration, error, extracted_text, expected_text, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (case_id, status, duration, error, extracted_text, expected_text, local_time)
+            "INSERT INTO run_history (case_id, status, duration, error, extracted_text, expected_text, created_at, error_blob, extracted_text_blob, log_run_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (case_id, status, duration, error, extracted_text, expected_text, created_at, error_blob, extracted_text_blob, log_run_id)
         )
         history_id = cursor.lastrowid
         
-        conn.commit()
-        conn.close()
+        # 在同一事务中增量更新用例统计
+        if case_id is not None:
+            self._apply_case_stats(cursor, case_id, status, duration, created_at)
         
         return history_id
     
+    def _apply_case_stats(self, cursor, case_id: int, status: str, duration: float, created_at: str):
+        """把一次运行结果累加到case_stats"""
+        cursor.execute(f"SELECT {', '.join(case_stats.STATS_COLUMNS)} FROM case_stats WHERE case_id = ?", (case_id,))
+        row = cursor.fetchone()
+        stats = case_stats.stats_from_row(row) if row else case_stats.new_stats(case_id)
+        case_stats.apply_run(stats, status, duration, created_at)
+        cursor.execute(
+            f"INSERT OR REPLACE INTO case_stats ({', '.join(case_stats.STATS_COLUMNS)}) "
+            f"VALUES ({', '.join(['?'] * len(case_stats.STATS_COLUMNS))})",
+            case_stats.stats_to_row(stats)
+        )
+    
+    def get_case_stats(self, case_id: int) -> Dict[str, Any]:
+        """获取用例统计摘要（读取汇总表，不扫描运行历史）"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"SELECT {', '.join(case_stats.STATS_COLUMNS)} FROM case_stats WHERE case_id = ?", (case_id,))
+            row = cursor.fetchone()
+            
+            stats = case_stats.stats_from_row(row) if row else case_stats.new_stats(case_id)
+            summary = case_stats.summarize(stats)
+            summary['case_id'] = case_id
+            return summary
+    
+    def get_project_stats(self, project_id: int) -> Dict[str, Any]:
+        """获取项目统计摘要（合并项目下各用例的汇总行）"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            columns = ', '.join(f"cs.{column}" for column in case_stats.STATS_COLUMNS)
+            cursor.execute(f"""
+                SELECT {columns}, tc.name
+                FROM case_stats cs
+                JOIN test_cases tc ON cs.case_id = tc.id
+                WHERE tc.project_id = ?
+            """, (project_id,))
+            rows = cursor.fetchall()
+            
+            all_stats = []
+            cases = []
+            for row in rows:
+                stats = case_stats.stats_from_row(row[:-1])
+                all_stats.append(stats)
+                case_summary = case_stats.summarize(stats)
+                case_summary['case_id'] = stats['case_id']
+                case_summary['case_name'] = row[-1]
+                cases.append(case_summary)
+            
+            summary = case_stats.summarize(case_stats.merge_stats(all_stats))
+            summary['project_id'] = project_id
+            summary['cases'] = sorted(cases, key=lambda item: item['flakiness'], reverse=True)
+            return summary
+    
+    def _fts_enabled(self) -> bool:
+        """当前数据库是否已建立运行历史全文索引"""
+        if self.db_path not in _fts_available:
+            with self._pool.connection() as conn:
+                _fts_available[self.db_path] = fts_available(conn, self.history_schema)
+        return _fts_available[self.db_path]
+    
+    def _run_history_filters(self, case_id: int = None, search_text: str = None, project_id: int = None):
+        """构建运行历史查询的WHERE条件（指定case_id时忽略project_id）"""
+        conditions = []
+        params = []
+        
+        if case_id:
+            conditions.append("rh.case_id = ?")
+            params.append(case_id)
+        elif project_id:
+            conditions.append("tc.project_id = ?")
+            params.append(project_id)
+        
+        if search_text:
+            fts_query = build_fts_query(search_text) if self._fts_enabled() else None
+            if fts_query:
+                conditions.append(self._fts_match_condition())
+                params.extend([fts_query] * 3)
+            else:
+                conditions.append("(tc.name LIKE ? OR rh.error LIKE ? OR rh.extracted_text LIKE ? OR rh.expected_text LIKE ?)")
+                params.extend([f'%{search_text}%'] * 4)
+        
+        return conditions, params
+    
+    def _fts_match_condition(self) -> str:
+        """全文检索条件（需要3个相同的MATCH参数）：记录自身的索引，或其引用的长文本blob的索引"""
+        return """(rh.id IN (SELECT rowid FROM run_history_fts WHERE run_history_fts MATCH ?)
+                   OR rh.error_blob IN (SELECT rowid FROM text_blobs_fts WHERE text_blobs_fts MATCH ?)
+                   OR rh.extracted_text_blob IN (SELECT rowid FROM text_blobs_fts WHERE text_blobs_fts MATCH ?))"""
+    
     def get_all_run_history(self, page: int = 1, page_size: int = 20, case_id: int = None, search_text: str = None, project_id: int = None) -> List[Dict[str, Any]]:
-        """获取所有运行历史记录（支持分页、按测试用例ID过滤、按项目ID过滤和搜索）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """获取所有运行历史记录（支持分页、按测试用例ID过滤、按项目ID过滤和搜索）
         
+        带搜索条件且可使用全文索引时，结果按相关度排序。
+        """
         offset = (page - 1) * page_size
+        fts_query = build_fts_query(search_text) if search_text and self._fts_enabled() else None
         
-        if case_id:
-            if search_text:
-                cursor.execute("""
-                    SELECT rh.*, tc.name as case_name 
-                    FROM run_history rh 
-                    LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                    WHERE rh.case_id = ? AND tc.name LIKE ?
-                    ORDER BY rh.created_at DESC
-                    LIMIT ? OFFSET ?
-                """, (case_id, f'%{search_text}%', page_size, offset))
-            else:
-                cursor.execute("""
-                    SELECT rh.*, tc.name as case_name 
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            if fts_query:
+                # 只匹配到长文本blob的记录没有bm25得分，排在有得分的记录之后
+                conditions, params = self._run_history_filters(case_id, search_text, project_id)
+                return fetch_dicts(cursor, f"""
+                    SELECT {HISTORY_LIST_COLUMNS}, tc.name as case_name 
                     FROM run_history rh 
+                    LEFT JOIN (
+                        SELECT rowid, bm25(run_history_fts, {', '.join(str(w) for w in FTS_RANK_WEIGHTS)}) AS rank 
+                        FROM run_history_fts WHERE run_history_fts MATCH ?
+                    ) fr ON fr.rowid = rh.id 
                     LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                    WHERE rh.case_id = ?
-                    ORDER BY rh.created_at DESC
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY fr.rank IS NULL, fr.rank, rh.id DESC
                     LIMIT ? OFFSET ?
-                """, (case_id, page_size, offset))
-        else:
-            if project_id:
-                if search_text:
-                    cursor.execute("""
-                        SELECT rh.*, tc.name as case_name 
-                        FROM run_history rh 
-                        LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                        WHERE tc.project_id = ? AND tc.name LIKE ?
-                        ORDER BY rh.created_at DESC
-                        LIMIT ? OFFSET ?
-                    """, (project_id, f'%{search_text}%', page_size, offset))
-                else:
-                    cursor.execute("""
-                        SELECT rh.*, tc.name as case_name 
-                        FROM run_history rh 
-                        LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                        WHERE tc.project_id = ?
-                        ORDER BY rh.created_at DESC
-                        LIMIT ? OFFSET ?
-                    """, (project_id, page_size, offset))
-            else:
-                if search_text:
-                    cursor.execute("""
-                        SELECT rh.*, tc.name as case_name 
-                        FROM run_history rh 
-                        LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                        WHERE tc.name LIKE ?
-                        ORDER BY rh.created_at DESC
-                        LIMIT ? OFFSET ?
-                    """, (f'%{search_text}%', page_size, offset))
-                else:
-                    cursor.execute("""
-                        SELECT rh.*, tc.name as case_name 
-                        FROM run_history rh 
-                        LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                        ORDER BY rh.created_at DESC
-                        LIMIT ? OFFSET ?
-                    """, (page_size, offset))
-        rows = cursor.fetchall()
-        
-        history = []
-        for row in rows:
-            history.append({
-                'id': row[0],
-                'case_id': row[1],
-                'status': row[2],
-                'duration': row[3],
-                'error': row[4],
-                'extracted_text': row[5],
-                'created_at': row[6],
-                'expected_text': row[7] if len(row) > 7 else '',
-                'case_name': row[8] if len(row) > 8 else ''
-            })
+                """, [fts_query] + params + [page_size, offset])
+            
+            conditions, params = self._run_history_filters(case_id, search_text, project_id)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            return fetch_dicts(cursor, f"""
+                SELECT {HISTORY_LIST_COLUMNS}, tc.name as case_name 
+                FROM run_history rh 
+                LEFT JOIN test_cases tc ON rh.case_id = tc.id 
+                {where}
+                ORDER BY rh.created_at DESC, rh.id DESC
+                LIMIT ? OFFSET ?
+            """, params + [page_size, offset])
+    
+    def get_run_history_page(self, cursor_token: str = None, page_size: int = 20, case_id: int = None, search_text: str = None, project_id: int = None) -> Dict[str, Any]:
+        """按游标（created_at, id）分页获取运行历史记录，翻页耗时与页码无关（搜索结果同样按时间倒序）"""
+        conditions, params = self._run_history_filters(case_id, search_text, project_id)
         
-        conn.close()
-        return history
-
-    def get_run_history_count(self, case_id: int = None, search_text: str = None, project_id: int = None) -> int:
-        """获取运行历史记录总数（支持按测试用例ID过滤、按项目ID过滤和搜索）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        if cursor_token:
+            created_at, last_id = decode_history_cursor(cursor_token)
+            conditions.append("(rh.created_at, rh.id) < (?, ?)")
+            params.extend([created_at, last_id])
         
-        if case_id:
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # 多取一条用于判断是否还有下一页
+            rows = fetch_dicts(cursor, f"""
+                SELECT {HISTORY_LIST_COLUMNS}, tc.name as case_name 
+                FROM run_history rh 
+                LEFT JOIN test_cases tc ON rh.case_id = tc.id 
+                {where}
+                ORDER BY rh.created_at DESC, rh.id DESC
+                LIMIT ?
+            """, params + [page_size + 1])
+        
+        has_more = len(rows) > page_size
+        history = rows[:page_size]
+        next_cursor = None
+        if has_more and history:
+            last = history[-1]
+            next_cursor = encode_history_cursor(last['created_at'], last['id'])
+        
+        return {
+            'history': history,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+    
+    def get_run_history_count(self, case_id: int = None, search_text: str = None, project_id: int = None) -> int:
+        """获取运行历史记录总数（支持按测试用例ID过滤、按项目ID过滤和搜索）
+        
+        不带搜索条件时直接读取由触发器维护的run_history_stats；
+        带搜索条件时需要扫描，结果缓存一小段时间。
+        """
+        if search_text:
+            cache_key = (self.db_path, case_id, search_text, project_id)
+            cached = _get_cached_count(cache_key)
+            if cached is not None:
+                return cached
+        
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
             if search_text:
-                cursor.execute("""
+                conditions, params = self._run_history_filters(case_id, search_text, project_id)
+                cursor.execute(f"""
                     SELECT COUNT(*) 
                     FROM run_history rh 
                     LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                    WHERE rh.case_id = ? AND tc.name LIKE ?
-                """, (case_id, f'%{search_text}%'))
-            else:
-                cursor.execute("SELECT COUNT(*) FROM run_history WHERE case_id = ?", (case_id,))
-        else:
-            if project_id:
-                if search_text:
-                    cursor.execute("""
-                        SELECT COUNT(*) 
-                        FROM run_history rh 
-                        LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                        WHERE tc.project_id = ? AND tc.name LIKE ?
-                    """, (project_id, f'%{search_text}%'))
-                else:
-                    cursor.execute("""
-                        SELECT COUNT(*) 
-                        FROM run_history rh 
-                        LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                        WHERE tc.project_id = ?
-                    """, (project_id,))
+                    WHERE {' AND '.join(conditions)}
+                """, params)
+            elif case_id:
+                cursor.execute("SELECT COALESCE(SUM(run_count), 0) FROM run_history_stats WHERE case_id = ?", (case_id,))
+            elif project_id:
+                cursor.execute("""
+                    SELECT COALESCE(SUM(s.run_count), 0) 
+                    FROM run_history_stats s 
+                    JOIN test_cases tc ON s.case_id = tc.id 
+                    WHERE tc.project_id = ?
+                """, (project_id,))
             else:
-                if search_text:
-                    cursor.execute("""
-                        SELECT COUNT(*) 
-                        FROM run_history rh 
-                        LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-                        WHERE tc.name LIKE ?
-                    """, (f'%{search_text}%',))
-                else:
-                    cursor.execute("SELECT COUNT(*) FROM run_history")
-        count = cursor.fetchone()[0]
-        
-        conn.close()
+                cursor.execute("SELECT COALESCE(SUM(run_count), 0) FROM run_history_stats")
+            count = cursor.fetchone()[0]
+        
+        if search_text:
+            _put_cached_count(cache_key, count)
         return count
     
     def get_case_run_history(self, case_id: int) -> List[Dict[str, Any]]:
         """获取指定测试用例的运行历史记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT * FROM run_history 
-            WHERE case_id = ? 
-            ORDER BY created_at DESC
-        """, (case_id,))
-        rows = cursor.fetchall()
-        
-        history = []
-        for row in rows:
-            history.append({
-                'id': row[0],
-                'case_id': row[1],
-                'status': row[2],
-                'duration': row[3],
-                'error': row[4],
-                'extracted_text': row[5],
-                'created_at': row[6],
-                'expected_text': row[7] if len(row) > 7 else ''
-            })
-        
-        conn.close()
-        return history
+        with self._pool.connection() as conn:
+            return fetch_dicts(conn.cursor(), f"""
+                SELECT {HISTORY_LIST_COLUMNS} FROM run_history rh 
+                WHERE rh.case_id = ? 
+                ORDER BY rh.created_at DESC
+            """, (case_id,))
+    
+    def iter_run_history_export(self, project_id: int = None, case_id: int = None, since: str = None, until: str = None,
+                                full_text: bool = False, chunk_size: int = history_export.EXPORT_CHUNK_SIZE) -> Iterator[List[tuple]]:
+        """按时间顺序分批产出运行历史行（字段见history_export.EXPORT_COLUMNS）
+        
+        按(created_at, id)键集分页，每批一个短连接、沿created_at相关索引顺序读取，内存占用与总行数无关。
+        since/until为created_at的闭开区间；full_text时从text_blobs解压完整文本，否则长文本只有预览。
+        """
+        conditions = ["(rh.created_at, rh.id) > (?, ?)"]
+        params = []
+        if case_id is not None:
+            conditions.append("rh.case_id = ?")
+            params.append(case_id)
+        if project_id is not None:
+            # +case_id：不走(case_id, created_at)索引，否则多个用例的结果需要在每批中重新排序
+            conditions.append("+rh.case_id IN (SELECT id FROM test_cases WHERE project_id = ?)")
+            params.append(project_id)
+        if since:
+            conditions.append("rh.created_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("rh.created_at < ?")
+            params.append(until)
+        sql = f"""
+            SELECT rh.id, rh.case_id, rh.status, rh.duration, rh.created_at, rh.error, rh.extracted_text, rh.expected_text,
+                   rh.error_blob, rh.extracted_text_blob
+            FROM run_history rh
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rh.created_at, rh.id
+            LIMIT ?
+        """
+        
+        # case_id -> (project_id, 项目名称, 用例名称)，不在每行上JOIN
+        labels: Dict[Optional[int], tuple] = {None: (None, None, None)}
+        last_key = ('', 0)
+        while True:
+            with self._pool.connection() as conn:
+                cursor = conn.cursor()
+                rows = cursor.execute(sql, list(last_key) + params + [chunk_size]).fetchall()
+                missing = list({row[1] for row in rows} - labels.keys())
+                if missing:
+                    cursor.execute(f"""
+                        SELECT tc.id, tc.project_id, p.name, tc.name FROM test_cases tc
+                        LEFT JOIN projects p ON tc.project_id = p.id
+                        WHERE tc.id IN ({', '.join(['?'] * len(missing))})
+                    """, missing)
+                    labels.update((row[0], row[1:]) for row in cursor.fetchall())
+                    labels.update((case_id, (None, None, None)) for case_id in missing if case_id not in labels)
+                texts = blob_store.load_texts(cursor, [blob_id for row in rows for blob_id in row[8:]]) if full_text else {}
+            if not rows:
+                return
+            last_key = (rows[-1][4], rows[-1][0])
+            
+            batch = []
+            for record_id, record_case_id, status, duration, created_at, error, extracted_text, expected_text, error_blob, extracted_text_blob in rows:
+                record_project_id, project_name, case_name = labels[record_case_id]
+                if full_text:
+                    error = texts.get(error_blob, error)
+                    extracted_text = texts.get(extracted_text_blob, extracted_text)
+                batch.append((record_id, record_project_id, project_name, record_case_id, case_name, status, duration,
+                              created_at, error, extracted_text, expected_text))
+            yield batch
     
     def delete_run_history(self, history_id: int) -> bool:
         """删除运行历史记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM run_history WHERE id = ?", (history_id,))
-        
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM run_history WHERE id = ?", (history_id,))
+            
+            success = cursor.rowcount > 0
+            
+            blob_store.collect_garbage(cursor, self._fts_enabled())
+            
+            return success
     
     def delete_case_run_history(self, case_id: int) -> bool:
         """删除指定测试用例的所有运行历史记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM run_history WHERE case_id = ?", (case_id,))
-        
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM run_history WHERE case_id = ?", (case_id,))
+            
+            success = cursor.rowcount > 0
+            
+            # 手动清空历史时同时重置统计
+            cursor.execute("DELETE FROM case_stats WHERE case_id = ?", (case_id,))
+            
+            blob_store.collect_garbage(cursor, self._fts_enabled())
+            
+            return success
     
     def delete_all_run_history(self) -> bool:
         """删除所有运行历史记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM run_history")
-        
-        success = cursor.rowcount > 0
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM run_history")
+            
+            success = cursor.rowcount > 0
+            
+            # 手动清空历史时同时重置统计
+            cursor.execute("DELETE FROM case_stats")
+            
+            # 已没有任何引用，直接清空blob，无需逐条解压删除全文索引
+            cursor.execute("DELETE FROM text_blobs")
+            if self._fts_enabled():
+                cursor.execute("INSERT INTO text_blobs_fts (text_blobs_fts) VALUES ('delete-all')")
+            
+            return success
+    
+    def archive_run_history(self, max_age_days: Optional[int] = RETENTION_MAX_AGE_DAYS,
+                            keep_per_case: Optional[int] = RETENTION_KEEP_PER_CASE,
+                            batch_size: int = RETENTION_BATCH_SIZE) -> Dict[str, Any]:
+        """按保留策略把旧的运行历史移入压缩归档文件，然后回收空间
+
+        早于max_age_days天、或超出每个用例最近keep_per_case条的记录会被归档（传None表示不使用该条件）。
+        每批先写入并fsync归档文件再删除记录；case_stats汇总不受影响。
+        """
+        if max_age_days is None and keep_per_case is None:
+            raise ValueError("max_age_days和keep_per_case至少需要指定一个")
+        
+        archive_dir = history_archive.archive_dir_for(self.history_db_path or self.db_path)
+        fts = self._fts_enabled()
+        cutoff = None
+        if max_age_days is not None:
+            cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+        
+        with self._pool.connection() as conn:
+            case_ids = [row[0] for row in conn.execute("SELECT DISTINCT case_id FROM run_history")]
+        
+        archived = 0
+        archived_cases = 0
+        for case_id in case_ids:
+            conditions = []
+            params = []
+            if cutoff is not None:
+                conditions.append("created_at < ?")
+                params.append(cutoff)
+            if keep_per_case is not None:
+                # 第keep_per_case条最近记录之前的都超出保留数量（走case_id+created_at索引）
+                with self._pool.connection() as conn:
+                    boundary = conn.execute("""
+                        SELECT created_at, id FROM run_history
+                        WHERE case_id IS ?
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT 1 OFFSET ?
+                    """, (case_id, max(keep_per_case, 1) - 1)).fetchone()
+                if boundary:
+                    conditions.append("(created_at, id) < (?, ?)")
+                    params.extend(boundary)
+            if not conditions:
+                continue
+            
+            path = history_archive.archive_path(archive_dir, case_id)
+            case_archived = 0
+            while True:
+                with self._pool.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(f"""
+                        SELECT {', '.join(history_archive.ARCHIVE_FIELDS)}, error_blob, extracted_text_blob FROM run_history
+                        WHERE case_id IS ? AND ({' OR '.join(conditions)})
+                        ORDER BY created_at, id
+                        LIMIT ?
+                    """, [case_id] + params + [batch_size])
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    
+                    # 归档文件中保存完整文本
+                    texts = blob_store.load_texts(cursor, [blob_id for row in rows for blob_id in row[-2:]])
+                    error_index = history_archive.ARCHIVE_FIELDS.index('error')
+                    extracted_index = history_archive.ARCHIVE_FIELDS.index('extracted_text')
+                    full_rows = []
+                    for row in rows:
+                        values = list(row[:-2])
+                        values[error_index] = texts.get(row[-2], values[error_index])
+                        values[extracted_index] = texts.get(row[-1], values[extracted_index])
+                        full_rows.append(values)
+                    
+                    member = history_archive.append_rows(path, full_rows)
+                    cursor.executemany("DELETE FROM run_history WHERE id = ?", [(row[0],) for row in rows])
+                    blob_store.collect_garbage(cursor, fts)
+                    cursor.execute("""
+                        INSERT INTO run_history_archive (case_id, path, row_count, first_created_at, last_created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(case_id) DO UPDATE SET
+                            path = excluded.path,
+                            row_count = row_count + excluded.row_count,
+                            first_created_at = MIN(first_created_at, excluded.first_created_at),
+                            last_created_at = MAX(last_created_at, excluded.last_created_at),
+                            updated_at = excluded.updated_at
+                    """, (history_archive.archive_key(case_id), path, len(rows), full_rows[0][-1], full_rows[-1][-1],
+                          datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                    # 与删除在同一事务中登记成员，未提交的成员不会被读取
+                    cursor.execute(
+                        "INSERT INTO run_history_archive_members (case_id, start_offset, end_offset, row_count) VALUES (?, ?, ?, ?)",
+                        (history_archive.archive_key(case_id),) + member
+                    )
+                case_archived += len(rows)
+            
+            if case_archived:
+                archived += case_archived
+                archived_cases += 1
         
-        conn.commit()
-        conn.close()
+        if archived:
+            # 计数缓存中可能还有已归档的记录
+            _clear_count_cache(self.db_path)
         
-        return success
+        result = {'archived': archived, 'archived_cases': archived_cases, 'archive_dir': archive_dir}
+        result.update(self.reclaim_space())
+        return result
+    
+    def reclaim_space(self, schema: Optional[str] = None) -> Dict[str, Any]:
+        """整理全文索引、增量回收空闲页并截断WAL
+        
+        默认处理运行历史所在的库；使用独立运行历史库时可传schema='main'单独处理主库。
+        未开启增量auto_vacuum的旧库不回收空闲页（转换需要一次锁住整个库的完整VACUUM，
+        由离线命令enable_incremental_vacuum完成），返回值中incremental_vacuum为False。
+        """
+        schema = schema or self.history_schema
+        if schema == self.history_schema and self._fts_enabled():
+            # 合并全文索引段，清除已删除记录留下的删除标记
+            with self._pool.connection() as conn:
+                conn.execute("INSERT INTO run_history_fts (run_history_fts) VALUES ('optimize')")
+                conn.execute("INSERT INTO text_blobs_fts (text_blobs_fts) VALUES ('optimize')")
+        
+        with self._pool.connection() as conn:
+            free_pages = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+            auto_vacuum = conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0]
+            if auto_vacuum == 2:
+                # execute()只会执行一步（释放一页），executescript会执行到结束
+                conn.executescript(f"PRAGMA {schema}.incremental_vacuum;")
+            conn.execute(f"PRAGMA {schema}.wal_checkpoint(TRUNCATE)").fetchall()
+            reclaimed_pages = free_pages - conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+            page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+            return {'reclaimed_pages': reclaimed_pages, 'reclaimed_bytes': reclaimed_pages * page_size,
+                    'incremental_vacuum': auto_vacuum == 2}
+    
+    def enable_incremental_vacuum(self, schema: Optional[str] = None) -> Dict[str, Any]:
+        """把旧库转换为增量auto_vacuum（离线执行：完整VACUUM会在重写期间锁住整个库）"""
+        schema = schema or self.history_schema
+        with self._pool.connection() as conn:
+            if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] == 2:
+                return {'schema': schema, 'converted': False}
+            conn.execute(f"PRAGMA {schema}.auto_vacuum=INCREMENTAL")
+            conn.execute(f"VACUUM {schema}")
+            return {'schema': schema, 'converted': True}
+    
+    def get_run_history_archives(self) -> List[Dict[str, Any]]:
+        """获取各用例的归档概况"""
+        with self._pool.connection() as conn:
+            return fetch_dicts(conn.cursor(), """
+                SELECT ra.case_id, tc.name AS case_name, ra.row_count, ra.first_created_at, ra.last_created_at, ra.updated_at
+                FROM run_history_archive ra
+                LEFT JOIN test_cases tc ON ra.case_id = tc.id
+                ORDER BY ra.updated_at DESC
+            """)
+    
+    def get_archived_run_history(self, case_id: int, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+        """分页读取指定用例已归档的运行历史（按时间倒序）"""
+        path = history_archive.archive_path(history_archive.archive_dir_for(self.history_db_path or self.db_path), case_id)
+        with self._pool.connection() as conn:
+            members = conn.execute("""
+                SELECT start_offset, end_offset, row_count FROM run_history_archive_members
+                WHERE case_id = ? ORDER BY start_offset
+            """, (history_archive.archive_key(case_id),)).fetchall()
+        history, total = history_archive.read_page(path, members, (page - 1) * page_size, page_size)
+        for record in history:
+            record['archived'] = True
+        return {'history': history, 'total': total}
     
     def get_run_history_detail(self, record_id: int) -> Dict[str, Any]:
-        """获取运行历史记录详情"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT rh.*, tc.name as case_name 
-            FROM run_history rh 
-            LEFT JOIN test_cases tc ON rh.case_id = tc.id 
-            WHERE rh.id = ?
-        """, (record_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            result = {
-                'id': row[0],
-                'case_id': row[1],
-                'status': row[2],
-                'duration': row[3],
-                'error': row[4],
-                'extracted_text': row[5],
-                'created_at': row[6],
-                'expected_text': row[7] if len(row) > 7 else '',
-                'case_name': row[8] if len(row) > 8 else ''
-            }
-            conn.close()
+        """获取运行历史记录详情（只有详情才解压完整的错误信息和提取文本）"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            record = fetch_dict(cursor, f"""
+                SELECT {HISTORY_DETAIL_COLUMNS}, tc.name as case_name 
+                FROM run_history rh 
+                LEFT JOIN test_cases tc ON rh.case_id = tc.id 
+                WHERE rh.id = ?
+            """, (record_id,))
+            
+            if record:
+                error_blob = record.pop('error_blob')
+                extracted_text_blob = record.pop('extracted_text_blob')
+                if error_blob is not None or extracted_text_blob is not None:
+                    texts = blob_store.load_texts(cursor, (error_blob, extracted_text_blob))
+                    record['error'] = texts.get(error_blob, record['error'])
+                    record['extracted_text'] = texts.get(extracted_text_blob, record['extracted_text'])
+            return record
+    
+    def get_run_history_log_run_id(self, record_id: int) -> Optional[Dict[str, Any]]:
+        """获取运行历史记录对应的运行日志ID，记录不存在时返回None"""
+        with self._pool.connection() as conn:
+            return fetch_dict(conn.cursor(), "SELECT id, log_run_id FROM run_history WHERE id = ?", (record_id,))
+    
+    def get_table_versions(self, tables: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """表的版本号和最后修改时间（UTC），数据变化时版本号一定变化
+        
+        projects/test_cases/test_steps由触发器维护；run_history写入频繁，INSERT不加触发器，
+        用最大ID、记录数（run_history_stats）和修改计数（run_history_changes）组合作为版本号，没有修改时间。
+        """
+        tables = list(tables)
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            versioned = [table for table in tables if table in VERSIONED_TABLES]
+            result = {}
+            if versioned:
+                cursor.execute(
+                    f"SELECT name, version, updated_at FROM table_versions WHERE name IN ({', '.join(['?'] * len(versioned))})",
+                    versioned
+                )
+                result = {name: {'version': str(version), 'updated_at': updated_at} for name, version, updated_at in cursor.fetchall()}
+            if 'run_history' in tables:
+                max_id = cursor.execute("SELECT MAX(id) FROM run_history").fetchone()[0]
+                total = cursor.execute("SELECT COALESCE(SUM(run_count), 0) FROM run_history_stats").fetchone()[0]
+                changes = cursor.execute("SELECT changes FROM run_history_changes WHERE id = 1").fetchone()[0]
+                result['run_history'] = {'version': f"{max_id or 0}-{total}-{changes}", 'updated_at': None}
             return result
-        
-        conn.close()
-        return None
     
     def delete_case_steps(self, case_id: int) -> bool:
         """删除测试用例的所有步骤"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM test_steps WHERE case_id = ?", (case_id,))
-        
-        success = cursor.rowcount > 0
-        
-        conn.commit()
-        conn.close()
-        
-        return success
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM test_steps WHERE case_id = ?", (case_id,))
+            
+            success = cursor.rowcount > 0
+            self._invalidate_case(case_id)
+            
+            return success
     
     def update_step_order(self, case_id: int, steps: List[Dict[str, Any]]) -> bool:
-        """更新测试步骤的顺序"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """更新测试步骤的顺序（steps为[{id, order}]，order为新位置，从1开始）
         
+        可以只列出移动的步骤：未列出的步骤保持原来的相对顺序，依次填入其余位置。
+        整个用例的顺序键按新顺序重新分配，不会与未列出步骤的键冲突（一条UPDATE语句）。
+        """
         try:
-            # 开始事务
-            conn.execute("BEGIN TRANSACTION")
-            
-            # 更新每个步骤的顺序
+            moves = {}
             for step in steps:
-                step_id = step.get('id')
-                step_order = step.get('order')
-                
-                if step_id and step_order:
-                    cursor.execute(
-                        "UPDATE test_steps SET step_order = ? WHERE id = ? AND case_id = ?",
-                        (step_order, step_id, case_id)
-                    )
+                step_id, order = step.get('id'), step.get('order')
+                if isinstance(step_id, bool) or isinstance(order, bool):
+                    raise ValueError(f"无效的步骤顺序: {step}")
+                step_id, order = int(step_id), int(order)
+                if order < 1 or step_id in moves:
+                    raise ValueError(f"无效的步骤顺序: {step}")
+                moves[step_id] = order
+            by_order = {order: step_id for step_id, order in moves.items()}
+            if len(by_order) != len(moves):
+                raise ValueError("多个步骤指定了同一个位置")
             
-            # 提交事务
-            conn.commit()
-            return True
+            with self._pool.connection() as conn:
+                self._invalidate_case(case_id)
+                current = [row[0] for row in conn.execute(
+                    "SELECT id FROM test_steps WHERE case_id = ? ORDER BY step_order, id", (case_id,)
+                )]
+                unknown = set(moves) - set(current)
+                if unknown:
+                    raise ValueError(f"步骤不属于用例 {case_id}: {sorted(unknown)}")
+                
+                rest = iter([step_id for step_id in current if step_id not in moves])
+                ordered = []
+                for position in range(1, len(current) + 1):
+                    if position in by_order:
+                        ordered.append(by_order[position])
+                    else:
+                        step_id = next(rest, None)
+                        if step_id is not None:
+                            ordered.append(step_id)
+                ordered.extend(rest)
+                # 位置超出步骤数的排在最后
+                ordered.extend(step_id for order, step_id in sorted(by_order.items()) if order > len(current))
+                
+                orders = [{'id': step_id, 'order': position} for position, step_id in enumerate(ordered, 1)]
+                # +case_id阻止使用(case_id, step_order)索引，让查询按json_each逐项以主键查找步骤
+                conn.execute("""
+                    UPDATE test_steps SET step_order = CAST(json_extract(item.value, '$.order') AS INTEGER) * ?
+                    FROM json_each(?) AS item
+                    WHERE test_steps.id = json_extract(item.value, '$.id') AND +test_steps.case_id = ?
+                """, (STEP_ORDER_GAP, json.dumps(orders), case_id))
+                
+                return True
         except Exception as e:
-            print(f"更新步骤顺序失败: {e}")
-            conn.rollback()
+            uat_logger.error(f"更新步骤顺序失败: {e}")
+            return False
+    
+    def _order_key_for_position(self, cursor, case_id: int, position: int, exclude_step_id: Optional[int] = None) -> int:
+        """计算插入到第position个位置（从1开始）的顺序键：取前后两个相邻键的中间值
+        
+        相邻键之间已没有空隙时先重新分配整个用例的键，再计算一次。
+        """
+        position = max(int(position), 1)
+        for _ in range(2):
+            # 前一个步骤和当前占据该位置的步骤（走(case_id, step_order)索引）
+            neighbours = [row[0] for row in cursor.execute("""
+                SELECT step_order FROM test_steps
+                WHERE case_id = ? AND id IS NOT ?
+                ORDER BY step_order, id
+                LIMIT ? OFFSET ?
+            """, (case_id, exclude_step_id, 2 if position > 1 else 1, max(position - 2, 0)))]
+            if position > 1:
+                previous = neighbours[0] if neighbours else None
+                following = neighbours[1] if len(neighbours) > 1 else None
+            else:
+                previous = None
+                following = neighbours[0] if neighbours else None
+            
+            if previous is None and following is None:
+                if position > 1:
+                    # 位置超出步骤数，追加到末尾
+                    row = cursor.execute(
+                        "SELECT MAX(step_order) FROM test_steps WHERE case_id = ? AND id IS NOT ?",
+                        (case_id, exclude_step_id)
+                    ).fetchone()
+                    return (row[0] or 0) + STEP_ORDER_GAP
+                return STEP_ORDER_GAP
+            if following is None:
+                return previous + STEP_ORDER_GAP
+            if previous is None:
+                return following - STEP_ORDER_GAP
+            if following - previous >= 2:
+                return (previous + following) // 2
+            self._rebalance_step_order(cursor, case_id)
+        raise RuntimeError(f"无法为用例 {case_id} 分配步骤顺序")
+    
+    def _rebalance_step_order(self, cursor, case_id: int):
+        """按当前顺序把用例的步骤键重新分配为STEP_ORDER_GAP的整数倍（一条UPDATE语句）"""
+        cursor.execute("""
+            UPDATE test_steps SET step_order = ranked.position * ?
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY step_order, id) AS position
+                FROM test_steps WHERE case_id = ?
+            ) AS ranked
+            WHERE test_steps.id = ranked.id
+        """, (STEP_ORDER_GAP, case_id))
+    
+    # ==================== 项目导出导入 ====================
+    
+    def iter_project_export(self, project_id: int, include_history: bool = False,
+                            chunk_size: int = project_transfer.EXPORT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+        """逐条生成项目的导出记录：meta、project、case、step，include_history时还有run
+        
+        各类记录按主键分块查询（每块一个短连接），内存占用与项目大小无关。
+        步骤的order_key是库内的顺序键，导入后保持同一用例内的相对顺序；运行历史带完整文本。
+        项目不存在时抛出ValueError。
+        """
+        with self._pool.connection() as conn:
+            project = fetch_dict(conn.cursor(), "SELECT id, name, description, created_at FROM projects WHERE id = ?", (project_id,))
+        if not project:
+            raise ValueError(f"项目不存在: {project_id}")
+        
+        yield {
+            'type': 'meta',
+            'format': project_transfer.EXPORT_FORMAT,
+            'version': project_transfer.EXPORT_VERSION,
+            'exported_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'include_history': include_history
+        }
+        yield {'type': 'project', **project}
+        
+        case_columns = ', '.join(f"tc.{column.strip()}" for column in TEST_CASE_COLUMNS.split(',') if column.strip() != 'project_id')
+        yield from self._iter_export_chunks('case', f"""
+            SELECT {case_columns} FROM test_cases tc
+            WHERE tc.project_id = ? AND tc.id > ?
+            ORDER BY tc.id LIMIT ?
+        """, project_id, chunk_size)
+        
+        step_columns = ', '.join(f"ts.{field}" for field in STEP_FIELD_DEFAULTS)
+        yield from self._iter_export_chunks('step', f"""
+            SELECT ts.id, ts.case_id, ts.step_order AS order_key, ts.created_at, {step_columns}
+            FROM test_steps ts JOIN test_cases tc ON ts.case_id = tc.id
+            WHERE tc.project_id = ? AND ts.id > ?
+            ORDER BY ts.id LIMIT ?
+        """, project_id, chunk_size)
+        
+        if include_history:
+            yield from self._iter_export_chunks('run', """
+                SELECT rh.id, rh.case_id, rh.status, rh.duration, rh.error, rh.extracted_text, rh.expected_text,
+                       rh.created_at, rh.error_blob, rh.extracted_text_blob
+                FROM run_history rh JOIN test_cases tc ON rh.case_id = tc.id
+                WHERE tc.project_id = ? AND rh.id > ?
+                ORDER BY rh.id LIMIT ?
+            """, project_id, chunk_size)
+    
+    def _iter_export_chunks(self, record_type: str, sql: str, project_id: int, chunk_size: int) -> Iterator[Dict[str, Any]]:
+        """按id分块执行导出查询（参数为project_id、上一块最后的id、块大小），在连接之外逐条产出"""
+        last_id = 0
+        while True:
+            with self._pool.connection() as conn:
+                cursor = conn.cursor()
+                rows = fetch_dicts(cursor, sql, (project_id, last_id, chunk_size))
+                if record_type == 'run':
+                    texts = blob_store.load_texts(cursor, [row[key] for row in rows for key in ('error_blob', 'extracted_text_blob')])
+                    for row in rows:
+                        row['error'] = texts.get(row.pop('error_blob'), row['error'])
+                        row['extracted_text'] = texts.get(row.pop('extracted_text_blob'), row['extracted_text'])
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            for row in rows:
+                yield {'type': record_type, **row}
+    
+    def import_project(self, records: Iterable[Dict[str, Any]], name: Optional[str] = None,
+                       chunk_size: int = project_transfer.IMPORT_CHUNK_SIZE) -> Dict[str, Any]:
+        """从导出记录创建新项目，返回新项目ID和导入的数量
+        
+        记录按chunk_size分块、每块一个事务批量写入，用例ID映射为新ID。
+        记录格式错误时抛出ValueError，已导入的部分由后台清理删除。
+        """
+        records = iter(records)
+        meta = next(records, None)
+        if not meta or meta.get('type') != 'meta' or meta.get('format') != project_transfer.EXPORT_FORMAT:
+            raise ValueError("不是项目导出文件")
+        if meta.get('version', 0) > project_transfer.EXPORT_VERSION:
+            raise ValueError(f"不支持的导出文件版本: {meta.get('version')}")
+        project = next(records, None)
+        if not project or project.get('type') != 'project':
+            raise ValueError("导出文件缺少项目记录")
+        
+        project_id = self.create_project(name or project.get('name') or '导入的项目', project.get('description') or "")
+        result = {'project_id': project_id, 'cases': 0, 'steps': 0, 'runs': 0}
+        # 导出文件中的用例ID -> 新用例ID
+        case_ids: Dict[int, int] = {}
+        pending_type = None
+        pending: List[Dict[str, Any]] = []
+        try:
+            for record in records:
+                record_type = record.get('type')
+                if record_type not in ('case', 'step', 'run'):
+                    raise ValueError(f"未知的记录类型: {record_type}")
+                if record_type != pending_type or len(pending) >= chunk_size:
+                    self._import_chunk(project_id, pending_type, pending, case_ids, result)
+                    pending_type, pending = record_type, []
+                pending.append(record)
+            self._import_chunk(project_id, pending_type, pending, case_ids, result)
+        except Exception:
+            self.purge_project(project_id)
+            raise
+        
+        if result['runs']:
+            _clear_count_cache(self.db_path)
+        return result
+    
+    def _import_chunk(self, project_id: int, record_type: Optional[str], records: List[Dict[str, Any]],
+                      case_ids: Dict[int, int], result: Dict[str, Any]):
+        """在一个事务中写入一块同类型的导入记录"""
+        if not records:
+            return
+        
+        def mapped_case_id(record):
+            case_id = case_ids.get(record.get('case_id'))
+            if case_id is None:
+                raise ValueError(f"{record_type}记录引用了导出文件中不存在的用例: {record.get('case_id')}")
+            return case_id
+        
+        if record_type == 'run':
+            for record in records:
+                if not record.get('status'):
+                    raise ValueError(f"运行历史记录缺少状态: {record.get('id')}")
+            self.create_run_history_batch([dict(record, case_id=mapped_case_id(record), duration=record.get('duration')) for record in records])
+            result['runs'] += len(records)
+            return
+        
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            if record_type == 'case':
+                for record in records:
+                    if not record.get('name'):
+                        raise ValueError(f"用例记录缺少名称: {record.get('id')}")
+                # 先获取写锁，保证自增ID连续，按顺序对应导出文件中的用例
+                if not conn.in_transaction:
+                    cursor.execute("BEGIN IMMEDIATE")
+                cursor.executemany("""
+                    INSERT INTO test_cases (project_id, name, url, description, precondition, expected_result, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                """, [
+                    (project_id, record['name'], record.get('url') or "", record.get('description') or "",
+                     record.get('precondition') or "", record.get('expected_result') or "", record.get('created_at'))
+                    for record in records
+                ])
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'test_cases'")
+                last_id = cursor.fetchone()[0]
+                imported_ids = range(last_id - len(records) + 1, last_id + 1)
+                for new_id, record in zip(imported_ids, records):
+                    case_ids[record.get('id')] = new_id
+                result['cases'] += len(records)
+            else:
+                rows = []
+                for index, record in enumerate(records, 1):
+                    if not record.get('action'):
+                        raise ValueError(f"步骤记录缺少操作类型: {record.get('id')}")
+                    order_key = record.get('order_key')
+                    if order_key is None:
+                        order_key = (result['steps'] + index) * STEP_ORDER_GAP
+                    rows.append((mapped_case_id(record), order_key, record.get('created_at')) + tuple(
+                        record.get(field) if record.get(field) is not None else default
+                        for field, default in STEP_FIELD_DEFAULTS.items()
+                    ))
+                cursor.executemany(f"""
+                    INSERT INTO test_steps (case_id, step_order, created_at, {', '.join(STEP_FIELD_DEFAULTS)})
+                    VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP), {', '.join(['?'] * len(STEP_FIELD_DEFAULTS))})
+                """, rows)
+                imported_ids = {row[0] for row in rows}
+                result['steps'] += len(records)
+            # 其他线程可能已把这些用例缓存为“不存在/没有步骤”，导入后同样需要失效
+            for case_id in imported_ids:
+                self._invalidate_case(case_id)
+    
+    # ==================== 后台清理 ====================
+    
+    def purge_project(self, project_id: int) -> Optional[int]:
+        """删除项目及其下的用例，返回后台清理任务ID；项目不存在时返回None
+        
+        项目和用例本身在当前事务中删除（立即从列表中消失），步骤、运行历史、统计和归档
+        记入待清理列表，由后台线程分批删除，不会长时间持有写锁。
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            if not cursor.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone():
+                return None
+            
+            for (case_id,) in cursor.execute("SELECT id FROM test_cases WHERE project_id = ?", (project_id,)).fetchall():
+                self._invalidate_case(case_id)
+            job_id = self._create_purge_job(cursor, 'project', project_id,
+                                            "SELECT ?, id FROM test_cases WHERE project_id = ?", (project_id,))
+            
+            cursor.execute("DELETE FROM test_cases WHERE project_id = ?", (project_id,))
+            cursor.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+            
+            return job_id
+    
+    def purge_case(self, case_id: int) -> Optional[int]:
+        """删除测试用例，返回后台清理任务ID；用例不存在时返回None"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM test_cases WHERE id = ?", (case_id,))
+            if cursor.rowcount == 0:
+                return None
+            
+            self._invalidate_case(case_id)
+            return self._create_purge_job(cursor, 'case', case_id, "SELECT ?, ?", (case_id,))
+    
+    def purge_orphans(self) -> Optional[int]:
+        """清理用例已不存在的步骤、运行历史和统计（旧版本删除用例时遗留的数据），没有遗留数据时返回None"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            job_id = self._create_purge_job(cursor, 'orphans', None, """
+                SELECT ?, case_id FROM (
+                    SELECT case_id FROM test_steps
+                    UNION SELECT case_id FROM test_scripts
+                    UNION SELECT case_id FROM run_history
+                    UNION SELECT case_id FROM case_stats
+                )
+                WHERE case_id IS NOT NULL
+                  AND case_id NOT IN (SELECT id FROM test_cases)
+                  AND case_id NOT IN (SELECT case_id FROM purge_cases)
+            """, ())
+            if cursor.execute("SELECT total_cases FROM purge_jobs WHERE id = ?", (job_id,)).fetchone()[0] == 0:
+                cursor.execute("DELETE FROM purge_jobs WHERE id = ?", (job_id,))
+                return None
+            return job_id
+    
+    def _create_purge_job(self, cursor, kind: str, target_id: Optional[int], cases_query: str, params: tuple) -> int:
+        """创建清理任务；cases_query返回(job_id, case_id)，第一个参数为任务ID。事务提交后唤醒清理线程"""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute(
+            "INSERT INTO purge_jobs (kind, target_id, status, created_at, updated_at) VALUES (?, ?, 'pending', ?, ?)",
+            (kind, target_id, now, now)
+        )
+        job_id = cursor.lastrowid
+        cursor.execute(f"INSERT OR IGNORE INTO purge_cases (job_id, case_id) {cases_query}", (job_id,) + tuple(params))
+        cursor.execute("UPDATE purge_jobs SET total_cases = ? WHERE id = ?", (cursor.rowcount, job_id))
+        self._pool.call_after_transaction(self._wake_purge_worker)
+        return job_id
+    
+    def _wake_purge_worker(self):
+        get_purge_worker(self.db_path, self._purge_batch).wake()
+    
+    def _purge_batch(self) -> bool:
+        """执行最早的未完成任务的一批清理，返回是否可能还有待清理的数据（由清理线程循环调用）"""
+        with self._pool.connection() as conn:
+            job = conn.execute(
+                "SELECT id FROM purge_jobs WHERE status IN ('pending', 'running') ORDER BY id LIMIT 1"
+            ).fetchone()
+        if not job:
             return False
-        finally:
-            conn.close()
+        
+        job_id = job[0]
+        try:
+            with self._pool.connection() as conn:
+                archive_paths = self._purge_job_batch(conn.cursor(), job_id)
+        except sqlite3.OperationalError:
+            # 数据库被锁等暂时性错误，由清理线程稍后重试
+            raise
+        except Exception as e:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with self._pool.connection() as conn:
+                conn.execute(
+                    "UPDATE purge_jobs SET status = 'failed', error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                    (str(e), now, now, job_id)
+                )
+            return True
+        
+        # 归档索引已删除并提交，再删除归档文件
+        for path in archive_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        return True
+    
+    def _purge_job_batch(self, cursor, job_id: int) -> List[str]:
+        """删除一批用例的步骤和运行历史（合计不超过PURGE_BATCH_SIZE行），返回待删除的归档文件"""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        case_ids = [row[0] for row in cursor.execute(
+            "SELECT case_id FROM purge_cases WHERE job_id = ? LIMIT ?", (job_id, PURGE_CASES_PER_BATCH)
+        )]
+        if not case_ids:
+            cursor.execute(
+                "UPDATE purge_jobs SET status = 'done', updated_at = ?, finished_at = ? WHERE id = ?",
+                (now, now, job_id)
+            )
+            _clear_count_cache(self.db_path)
+            return []
+        
+        in_cases = f"case_id IN ({', '.join(['?'] * len(case_ids))})"
+        budget = PURGE_BATCH_SIZE
+        cursor.execute(
+            f"DELETE FROM test_steps WHERE id IN (SELECT id FROM test_steps WHERE {in_cases} LIMIT ?)",
+            case_ids + [budget]
+        )
+        deleted_steps = cursor.rowcount
+        budget -= deleted_steps
+        
+        deleted_runs = 0
+        if budget > 0:
+            cursor.execute(
+                f"DELETE FROM run_history WHERE id IN (SELECT id FROM run_history WHERE {in_cases} LIMIT ?)",
+                case_ids + [budget]
+            )
+            deleted_runs = cursor.rowcount
+            budget -= deleted_runs
+            if deleted_runs:
+                blob_store.collect_garbage(cursor, self._fts_enabled())
+        
+        purged_cases = 0
+        archive_paths = []
+        if budget > 0:
+            # 未用完配额说明这批用例的步骤和运行历史已删完，清理其余关联数据
+            cursor.execute(f"DELETE FROM test_scripts WHERE {in_cases}", case_ids)
+            cursor.execute(f"DELETE FROM case_stats WHERE {in_cases}", case_ids)
+            cursor.execute(f"DELETE FROM run_history_stats WHERE {in_cases}", case_ids)
+            archive_paths = [row[0] for row in cursor.execute(
+                f"SELECT path FROM run_history_archive WHERE {in_cases}", case_ids
+            )]
+            cursor.execute(f"DELETE FROM run_history_archive WHERE {in_cases}", case_ids)
+            cursor.execute(f"DELETE FROM run_history_archive_members WHERE {in_cases}", case_ids)
+            cursor.execute(f"DELETE FROM purge_cases WHERE job_id = ? AND {in_cases}", [job_id] + case_ids)
+            purged_cases = len(case_ids)
+        
+        cursor.execute("""
+            UPDATE purge_jobs SET status = 'running',
+                purged_cases = purged_cases + ?, deleted_steps = deleted_steps + ?, deleted_runs = deleted_runs + ?,
+                updated_at = ?
+            WHERE id = ?
+        """, (purged_cases, deleted_steps, deleted_runs, now, job_id))
+        return archive_paths
+    
+    def get_purge_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """获取清理任务的进度"""
+        with self._pool.connection() as conn:
+            job = fetch_dict(conn.cursor(), f"SELECT {PURGE_JOB_COLUMNS} FROM purge_jobs WHERE id = ?", (job_id,))
+        if job:
+            job['progress'] = _purge_progress(job)
+        return job
+    
+    def get_purge_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """获取最近的清理任务（未完成的排在前面）"""
+        with self._pool.connection() as conn:
+            jobs = fetch_dicts(conn.cursor(), f"""
+                SELECT {PURGE_JOB_COLUMNS} FROM purge_jobs
+                ORDER BY status IN ('pending', 'running') DESC, id DESC
+                LIMIT ?
+            """, (limit,))
+        for job in jobs:
+            job['progress'] = _purge_progress(job)
+        return jobs
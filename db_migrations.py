@@ -0,0 +1,718 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, List, Set, Tuple
+
+import case_stats
+import blob_store
+import history_archive
+
+
+# 步骤排序等语句使用了UPDATE ... FROM（SQLite 3.33起支持）和窗口函数
+MIN_SQLITE_VERSION = (3, 33, 0)
+
+# 步骤顺序键之间的间隔：插入或移动步骤时取相邻两个键的中间值，间隔用尽时重新均匀分配整个用例的键
+STEP_ORDER_GAP = 1024
+
+
+def _column_exists(cursor: sqlite3.Cursor, table: str, column: str) -> bool:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    """添加字段（如果不存在）"""
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _table_schema(cursor: sqlite3.Cursor, table: str) -> str:
+    """表所在的数据库（运行历史表拆分后位于ATTACH的独立库中）"""
+    for _, schema, _ in cursor.execute("PRAGMA database_list").fetchall():
+        if cursor.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone():
+            return schema
+    return 'main'
+
+
+# ==================== 迁移定义 ====================
+
+def _migration_001_initial_schema(cursor: sqlite3.Cursor):
+    """初始表结构（兼容已存在的旧数据库）"""
+    # 创建项目表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 创建测试用例表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS test_cases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER,
+            name TEXT NOT NULL,
+            url TEXT,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (project_id) REFERENCES projects (id)
+        )
+    ''')
+
+    # 创建测试步骤表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS test_steps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            case_id INTEGER,
+            action TEXT NOT NULL,
+            selector_type TEXT,
+            selector_value TEXT,
+            input_value TEXT,
+            description TEXT,
+            step_order INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (case_id) REFERENCES test_cases (id)
+        )
+    ''')
+
+    # 创建测试脚本表（保留用于兼容性）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS test_scripts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            case_id INTEGER,
+            name TEXT NOT NULL,
+            steps TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (case_id) REFERENCES test_cases (id)
+        )
+    ''')
+
+    # 创建运行历史记录表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            case_id INTEGER,
+            status TEXT NOT NULL,
+            duration REAL,
+            error TEXT,
+            extracted_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (case_id) REFERENCES test_cases (id)
+        )
+    ''')
+
+    # 后续版本陆续添加的字段
+    _add_column(cursor, 'test_cases', 'precondition', 'TEXT')
+    _add_column(cursor, 'test_cases', 'expected_result', 'TEXT')
+    _add_column(cursor, 'test_steps', 'page_name', 'TEXT')
+    _add_column(cursor, 'test_steps', 'swipe_x', 'TEXT')
+    _add_column(cursor, 'test_steps', 'swipe_y', 'TEXT')
+    _add_column(cursor, 'test_steps', 'url', 'TEXT')
+    _add_column(cursor, 'test_steps', 'enter_iframe', 'BOOLEAN DEFAULT FALSE')
+    _add_column(cursor, 'test_steps', 'iframe_selector', 'TEXT')
+    _add_column(cursor, 'test_steps', 'compare_type', "TEXT DEFAULT 'equals'")
+    _add_column(cursor, 'run_history', 'expected_text', 'TEXT')
+
+
+def _migration_002_indexes(cursor: sqlite3.Cursor):
+    """为常用查询添加索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_cases_project ON test_cases (project_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_steps_case_order ON test_steps (case_id, step_order)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_run_history_case_created ON run_history (case_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_run_history_created ON run_history (created_at)")
+
+
+def _migration_003_run_history_stats(cursor: sqlite3.Cursor):
+    """按用例统计运行次数，由触发器增量维护，避免每次COUNT全表（case_id为空的记录计入0）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_history_stats (
+            case_id INTEGER PRIMARY KEY,
+            run_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_run_history_stats_insert
+        AFTER INSERT ON run_history
+        BEGIN
+            INSERT INTO run_history_stats (case_id, run_count) VALUES (COALESCE(NEW.case_id, 0), 1)
+            ON CONFLICT (case_id) DO UPDATE SET run_count = run_count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_run_history_stats_delete
+        AFTER DELETE ON run_history
+        BEGIN
+            UPDATE run_history_stats SET run_count = run_count - 1 WHERE case_id = COALESCE(OLD.case_id, 0);
+        END
+    ''')
+    # 回填已有数据
+    cursor.execute("DELETE FROM run_history_stats")
+    cursor.execute('''
+        INSERT INTO run_history_stats (case_id, run_count)
+        SELECT COALESCE(case_id, 0), COUNT(*) FROM run_history GROUP BY COALESCE(case_id, 0)
+    ''')
+
+
+def _migration_004_run_history_fts(cursor: sqlite3.Cursor):
+    """运行历史全文索引（用例名称、错误信息、提取文本、预期结果）
+
+    使用trigram分词器以支持中文子串检索；SQLite未编译FTS5时跳过，搜索退化为LIKE。
+    """
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS run_history_fts USING fts5(
+                case_name, error, extracted_text, expected_text,
+                tokenize = 'trigram'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        return
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_run_history_fts_insert
+        AFTER INSERT ON run_history
+        BEGIN
+            INSERT INTO run_history_fts (rowid, case_name, error, extracted_text, expected_text)
+            VALUES (NEW.id, (SELECT name FROM test_cases WHERE id = NEW.case_id),
+                    NEW.error, NEW.extracted_text, NEW.expected_text);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_run_history_fts_update
+        AFTER UPDATE OF case_id, error, extracted_text, expected_text ON run_history
+        BEGIN
+            UPDATE run_history_fts SET
+                case_name = (SELECT name FROM test_cases WHERE id = NEW.case_id),
+                error = NEW.error,
+                extracted_text = NEW.extracted_text,
+                expected_text = NEW.expected_text
+            WHERE rowid = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_run_history_fts_delete
+        AFTER DELETE ON run_history
+        BEGIN
+            DELETE FROM run_history_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_test_cases_fts_rename
+        AFTER UPDATE OF name ON test_cases
+        BEGIN
+            UPDATE run_history_fts SET case_name = NEW.name
+            WHERE rowid IN (SELECT id FROM run_history WHERE case_id = NEW.id);
+        END
+    ''')
+    # 回填已有数据
+    cursor.execute("DELETE FROM run_history_fts")
+    cursor.execute('''
+        INSERT INTO run_history_fts (rowid, case_name, error, extracted_text, expected_text)
+        SELECT rh.id, tc.name, rh.error, rh.extracted_text, rh.expected_text
+        FROM run_history rh
+        LEFT JOIN test_cases tc ON rh.case_id = tc.id
+    ''')
+
+
+def _migration_005_case_stats(cursor: sqlite3.Cursor):
+    """用例统计汇总表，由create_run_history增量更新；按历史记录回填"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS case_stats (
+            case_id INTEGER PRIMARY KEY,
+            total_runs INTEGER NOT NULL DEFAULT 0,
+            passed_runs INTEGER NOT NULL DEFAULT 0,
+            failed_runs INTEGER NOT NULL DEFAULT 0,
+            duration_count INTEGER NOT NULL DEFAULT 0,
+            duration_mean REAL NOT NULL DEFAULT 0,
+            duration_m2 REAL NOT NULL DEFAULT 0,
+            duration_min REAL,
+            duration_max REAL,
+            duration_sketch TEXT,
+            last_run_at TIMESTAMP,
+            last_status TEXT,
+            last_failure_at TIMESTAMP,
+            status_flips INTEGER NOT NULL DEFAULT 0,
+            flakiness REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+    all_stats = {}
+    rows = cursor.execute("""
+        SELECT case_id, status, duration, created_at FROM run_history
+        WHERE case_id IS NOT NULL
+        ORDER BY created_at, id
+    """)
+    for case_id, status, duration, created_at in rows:
+        stats = all_stats.setdefault(case_id, case_stats.new_stats(case_id))
+        case_stats.apply_run(stats, status, duration, created_at)
+
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO case_stats ({', '.join(case_stats.STATS_COLUMNS)}) "
+        f"VALUES ({', '.join(['?'] * len(case_stats.STATS_COLUMNS))})",
+        [case_stats.stats_to_row(stats) for stats in all_stats.values()]
+    )
+
+
+def _migration_006_run_history_archive(cursor: sqlite3.Cursor):
+    """运行历史归档索引：每个用例一个压缩归档文件（case_id为NULL的记录用0表示）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_history_archive (
+            case_id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            first_created_at TIMESTAMP,
+            last_created_at TIMESTAMP,
+            updated_at TIMESTAMP
+        )
+    ''')
+
+
+def _migration_007_text_blobs(cursor: sqlite3.Cursor):
+    """长文本（错误信息、提取文本）去重压缩存储
+
+    run_history中只保留预览和blob引用，引用计数由触发器维护；
+    blob全文进入无内容的text_blobs_fts，每段不同的文本只索引一次。
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS text_blobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT NOT NULL UNIQUE,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    _add_column(cursor, 'run_history', 'error_blob', 'INTEGER')
+    _add_column(cursor, 'run_history', 'extracted_text_blob', 'INTEGER')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_run_history_error_blob ON run_history(error_blob)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_run_history_extracted_text_blob ON run_history(extracted_text_blob)")
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_run_history_blob_ref_insert
+        AFTER INSERT ON run_history
+        WHEN NEW.error_blob IS NOT NULL OR NEW.extracted_text_blob IS NOT NULL
+        BEGIN
+            UPDATE text_blobs SET refcount = refcount + 1 WHERE id = NEW.error_blob;
+            UPDATE text_blobs SET refcount = refcount + 1 WHERE id = NEW.extracted_text_blob;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_run_history_blob_ref_update
+        AFTER UPDATE OF error_blob, extracted_text_blob ON run_history
+        BEGIN
+            UPDATE text_blobs SET refcount = refcount - 1 WHERE id = OLD.error_blob;
+            UPDATE text_blobs SET refcount = refcount - 1 WHERE id = OLD.extracted_text_blob;
+            UPDATE text_blobs SET refcount = refcount + 1 WHERE id = NEW.error_blob;
+            UPDATE text_blobs SET refcount = refcount + 1 WHERE id = NEW.extracted_text_blob;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_run_history_blob_ref_delete
+        AFTER DELETE ON run_history
+        WHEN OLD.error_blob IS NOT NULL OR OLD.extracted_text_blob IS NOT NULL
+        BEGIN
+            UPDATE text_blobs SET refcount = refcount - 1 WHERE id = OLD.error_blob;
+            UPDATE text_blobs SET refcount = refcount - 1 WHERE id = OLD.extracted_text_blob;
+        END
+    ''')
+
+    fts = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'run_history_fts'"
+    ).fetchone() is not None
+    if fts:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS text_blobs_fts USING fts5(
+                content, content = '', tokenize = 'trigram'
+            )
+        ''')
+
+    # 把已有的长文本移入text_blobs（UPDATE触发器会同步引用计数和run_history_fts）
+    record_ids = [row[0] for row in cursor.execute(f"""
+        SELECT id FROM run_history
+        WHERE error_blob IS NULL AND extracted_text_blob IS NULL
+          AND (LENGTH(CAST(error AS BLOB)) >= {blob_store.BLOB_MIN_BYTES}
+               OR LENGTH(CAST(extracted_text AS BLOB)) >= {blob_store.BLOB_MIN_BYTES})
+    """)]
+    for record_id in record_ids:
+        error, extracted_text = cursor.execute(
+            "SELECT error, extracted_text FROM run_history WHERE id = ?", (record_id,)
+        ).fetchone()
+        error, error_blob = blob_store.store_text(cursor, error, fts)
+        extracted_text, extracted_text_blob = blob_store.store_text(cursor, extracted_text, fts)
+        cursor.execute(
+            "UPDATE run_history SET error = ?, extracted_text = ?, error_blob = ?, extracted_text_blob = ? WHERE id = ?",
+            (error, extracted_text, error_blob, extracted_text_blob, record_id)
+        )
+    if fts and record_ids:
+        # 合并索引段，清除旧全文留下的删除标记
+        cursor.execute("INSERT INTO run_history_fts (run_history_fts) VALUES ('optimize')")
+
+
+def _migration_008_purge_jobs(cursor: sqlite3.Cursor):
+    """后台清理任务：删除项目/用例时只删除其本身，步骤和运行历史记入待清理列表后分批删除"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS purge_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            target_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total_cases INTEGER NOT NULL DEFAULT 0,
+            purged_cases INTEGER NOT NULL DEFAULT 0,
+            deleted_steps INTEGER NOT NULL DEFAULT 0,
+            deleted_runs INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS purge_cases (
+            job_id INTEGER NOT NULL,
+            case_id INTEGER NOT NULL,
+            PRIMARY KEY (job_id, case_id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_purge_jobs_status ON purge_jobs (status, id)")
+
+
+def _migration_009_sparse_step_order(cursor: sqlite3.Cursor):
+    """步骤顺序改为间隔为STEP_ORDER_GAP的稀疏键，插入和移动步骤只需修改一行"""
+    cursor.execute('''
+        UPDATE test_steps SET step_order = ranked.position * ?
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY case_id ORDER BY step_order, id) AS position
+            FROM test_steps
+        ) AS ranked
+        WHERE test_steps.id = ranked.id
+    ''', (STEP_ORDER_GAP,))
+
+
+def _migration_010_run_log_id(cursor: sqlite3.Cursor):
+    """运行历史记录对应的运行日志ID（logger按该ID索引运行日志）"""
+    _add_column(cursor, 'run_history', 'log_run_id', 'TEXT')
+
+
+# 由触发器维护版本号的表（API据此生成ETag/Last-Modified）
+VERSIONED_TABLES = ('projects', 'test_cases', 'test_steps')
+
+
+def _migration_011_table_versions(cursor: sqlite3.Cursor):
+    """表版本号：每次增删改都加1并记录修改时间（UTC），列表接口据此判断数据是否变化"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for table in VERSIONED_TABLES:
+        cursor.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 1)", (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE name = '{table}';
+                END
+            ''')
+
+
+def _migration_012_text_blobs_garbage_index(cursor: sqlite3.Cursor):
+    """引用计数归零的blob的部分索引，blob_store.collect_garbage不再扫描整个text_blobs"""
+    # 不带库名的CREATE INDEX总是建在主库，需指定text_blobs所在的库
+    schema = _table_schema(cursor, 'text_blobs')
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_text_blobs_garbage ON text_blobs(id) WHERE refcount <= 0")
+
+
+def _migration_013_run_history_archive_members(cursor: sqlite3.Cursor):
+    """归档文件中每个gzip成员的位置和行数，与删除运行历史在同一事务中登记，分页时只读取需要的成员
+
+    已有的归档文件去重后重写为一个成员并登记（中断后重复写入的记录在这里合并）。
+    """
+    schema = _table_schema(cursor, 'run_history_archive')
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.run_history_archive_members (
+            case_id INTEGER NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            PRIMARY KEY (case_id, start_offset)
+        )
+    ''')
+    for case_id, path in cursor.execute("SELECT case_id, path FROM run_history_archive").fetchall():
+        member = history_archive.rewrite_archive(path)
+        if member is None:
+            continue
+        cursor.execute(
+            "INSERT OR REPLACE INTO run_history_archive_members (case_id, start_offset, end_offset, row_count) VALUES (?, ?, ?, ?)",
+            (case_id,) + member
+        )
+        cursor.execute("UPDATE run_history_archive SET row_count = ? WHERE case_id = ?", (member[2], case_id))
+        if os.path.exists(path + '.idx'):
+            os.remove(path + '.idx')
+
+
+def _migration_014_run_history_changes(cursor: sqlite3.Cursor):
+    """运行历史的修改计数：UPDATE/DELETE时加1，与最大ID和记录数一起组成版本号
+
+    新增记录已能由最大ID和记录数反映，写入最频繁的INSERT不加触发器。
+    """
+    # 触发器只能引用同一个库中的表，计数表和触发器都建在run_history所在的库
+    schema = _table_schema(cursor, 'run_history')
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.run_history_changes (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            changes INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute(f"INSERT OR IGNORE INTO {schema}.run_history_changes (id, changes) VALUES (1, 0)")
+    for event in ('UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {schema}.trg_run_history_changes_{event.lower()}
+            AFTER {event} ON run_history
+            BEGIN
+                UPDATE run_history_changes SET changes = changes + 1 WHERE id = 1;
+            END
+        ''')
+
+
+# (版本号, 描述, 迁移函数)，版本号必须递增，已发布的迁移不能修改
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, '初始表结构', _migration_001_initial_schema),
+    (2, '添加常用查询索引', _migration_002_indexes),
+    (3, '运行历史计数表', _migration_003_run_history_stats),
+    (4, '运行历史全文索引', _migration_004_run_history_fts),
+    (5, '用例统计汇总表', _migration_005_case_stats),
+    (6, '运行历史归档索引', _migration_006_run_history_archive),
+    (7, '长文本去重压缩存储', _migration_007_text_blobs),
+    (8, '后台清理任务', _migration_008_purge_jobs),
+    (9, '步骤顺序稀疏键', _migration_009_sparse_step_order),
+    (10, '运行日志ID', _migration_010_run_log_id),
+    (11, '表版本号', _migration_011_table_versions),
+    (12, '待回收blob索引', _migration_012_text_blobs_garbage_index),
+    (13, '归档成员索引', _migration_013_run_history_archive_members),
+    (14, '运行历史修改计数', _migration_014_run_history_changes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# 本进程内已迁移到最新版本的数据库文件，避免每次创建Database都检查
+_migrated_paths: Set[str] = set()
+_migrated_lock = threading.Lock()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """获取数据库当前的结构版本"""
+    row = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+    ).fetchone()
+    if not row:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, db_path: str) -> List[int]:
+    """执行尚未应用的迁移，返回本次应用的版本号列表"""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(
+            f"需要SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} 或更高版本，当前为 {sqlite3.sqlite_version}"
+        )
+    with _migrated_lock:
+        if db_path in _migrated_paths:
+            return []
+
+        applied = []
+        cursor = conn.cursor()
+        # 获取写锁后再检查版本，避免多个进程重复执行同一迁移
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMP
+                )
+            ''')
+            current_version = get_schema_version(conn)
+
+            for version, description, func in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                func(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+                applied.append(version)
+
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        _migrated_paths.add(db_path)
+        return applied
+
+
+# ==================== 运行历史独立数据库 ====================
+
+# 存放在运行历史库中的表（写入频繁，与用例编辑的表分开加锁）
+HISTORY_TABLES = (
+    'run_history', 'run_history_stats', 'run_history_fts', 'case_stats',
+    'run_history_archive', 'run_history_archive_members', 'run_history_changes', 'text_blobs', 'text_blobs_fts'
+)
+
+# 引用了主库表（test_cases）的触发器，普通触发器不能跨库引用，改为每个连接上的TEMP触发器
+CROSS_DATABASE_TRIGGERS = {
+    'trg_run_history_fts_insert': '''
+        CREATE TEMP TRIGGER IF NOT EXISTS trg_run_history_fts_insert
+        AFTER INSERT ON {schema}.run_history
+        BEGIN
+            INSERT INTO run_history_fts (rowid, case_name, error, extracted_text, expected_text)
+            VALUES (NEW.id, (SELECT name FROM main.test_cases WHERE id = NEW.case_id),
+                    NEW.error, NEW.extracted_text, NEW.expected_text);
+        END
+    ''',
+    'trg_run_history_fts_update': '''
+        CREATE TEMP TRIGGER IF NOT EXISTS trg_run_history_fts_update
+        AFTER UPDATE OF case_id, error, extracted_text, expected_text ON {schema}.run_history
+        BEGIN
+            UPDATE run_history_fts SET
+                case_name = (SELECT name FROM main.test_cases WHERE id = NEW.case_id),
+                error = NEW.error,
+                extracted_text = NEW.extracted_text,
+                expected_text = NEW.expected_text
+            WHERE rowid = NEW.id;
+        END
+    ''',
+    'trg_test_cases_fts_rename': '''
+        CREATE TEMP TRIGGER IF NOT EXISTS trg_test_cases_fts_rename
+        AFTER UPDATE OF name ON main.test_cases
+        BEGIN
+            UPDATE run_history_fts SET case_name = NEW.name
+            WHERE rowid IN (SELECT id FROM {schema}.run_history WHERE case_id = NEW.id);
+        END
+    ''',
+}
+
+_OBJECT_NAME_PATTERN = re.compile(
+    r'^(\s*CREATE\s+(?:UNIQUE\s+)?(?:VIRTUAL\s+)?(?:TABLE|INDEX|TRIGGER)\s+(?:IF\s+NOT\s+EXISTS\s+)?)',
+    re.IGNORECASE
+)
+
+# 本进程内已完成拆分检查的数据库文件
+_split_paths: Set[str] = set()
+
+
+def _schema_objects(conn: sqlite3.Connection, schema: str, object_type: str) -> List[Tuple[str, str, str]]:
+    """(name, tbl_name, sql)，只返回运行历史相关且有建表语句的对象（跳过FTS影子表和自动索引）"""
+    rows = conn.execute(
+        f"SELECT name, tbl_name, sql FROM {schema}.sqlite_master WHERE type = ? AND sql IS NOT NULL",
+        (object_type,)
+    ).fetchall()
+    return [row for row in rows if row[1] in HISTORY_TABLES]
+
+
+def _has_rows(conn: sqlite3.Connection, schema: str, table: str) -> bool:
+    exists = conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return bool(exists) and conn.execute(f"SELECT 1 FROM {schema}.{table} LIMIT 1").fetchone() is not None
+
+
+def fts_available(conn: sqlite3.Connection, schema: str = 'main') -> bool:
+    """运行历史全文索引是否存在"""
+    return conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'run_history_fts'"
+    ).fetchone() is not None
+
+
+def split_history_database(conn: sqlite3.Connection, db_path: str, schema: str):
+    """把运行历史相关的表从主库移到已ATTACH为schema的独立数据库
+
+    迁移始终在主库上执行；之后把运行历史表（含索引、库内触发器和数据）复制到独立库，
+    再删除主库中的这些表。独立库已有数据时不再复制（中断后重跑是安全的）；
+    两边都有数据且主库更新时拒绝继续，避免误删。
+    """
+    with _migrated_lock:
+        if db_path in _split_paths:
+            return
+        main_tables = [row for row in _schema_objects(conn, 'main', 'table') if row[0] in HISTORY_TABLES]
+        if main_tables:
+            _move_history_tables(conn, schema, main_tables)
+        _split_paths.add(db_path)
+
+
+def _move_history_tables(conn: sqlite3.Connection, schema: str, main_tables: List[Tuple[str, str, str]]):
+    cursor = conn.cursor()
+    copy_data = not _has_rows(conn, schema, 'run_history')
+    if not copy_data and _has_rows(conn, 'main', 'run_history'):
+        main_max = cursor.execute("SELECT MAX(id) FROM main.run_history").fetchone()[0]
+        history_max = cursor.execute(f"SELECT MAX(id) FROM {schema}.run_history").fetchone()[0]
+        if main_max > history_max:
+            raise RuntimeError("主库和运行历史库中都有运行历史数据，且主库中的数据更新，请先手动合并")
+
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        existing = {row[0] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master")}
+        # 先建表和索引并复制数据，最后再建触发器，避免复制时触发计数和引用更新
+        for name, _, sql in main_tables:
+            if name not in existing:
+                cursor.execute(_OBJECT_NAME_PATTERN.sub(rf'\g<1>{schema}.', sql, count=1))
+        for name, _, sql in _schema_objects(conn, 'main', 'index'):
+            if name not in existing:
+                cursor.execute(_OBJECT_NAME_PATTERN.sub(rf'\g<1>{schema}.', sql, count=1))
+
+        for name, _, sql in main_tables:
+            # 独立库中原本没有的表总是复制数据；已有的表只在独立库还没有运行历史时复制
+            if name in existing and not copy_data:
+                continue
+            if name == 'run_history_fts':
+                cursor.execute(f'''
+                    INSERT INTO {schema}.run_history_fts (rowid, case_name, error, extracted_text, expected_text)
+                    SELECT rowid, case_name, error, extracted_text, expected_text FROM main.run_history_fts
+                ''')
+            elif name == 'text_blobs_fts':
+                # 无内容的FTS表无法读回原文，从text_blobs重新建立索引
+                for blob_id, data in cursor.execute("SELECT id, data FROM main.text_blobs").fetchall():
+                    cursor.execute(
+                        f"INSERT INTO {schema}.text_blobs_fts (rowid, content) VALUES (?, ?)",
+                        (blob_id, blob_store.decompress_text(data))
+                    )
+            else:
+                cursor.execute(f"INSERT INTO {schema}.{name} SELECT * FROM main.{name}")
+
+        for name, _, sql in _schema_objects(conn, 'main', 'trigger'):
+            if name not in existing and name not in CROSS_DATABASE_TRIGGERS:
+                cursor.execute(_OBJECT_NAME_PATTERN.sub(rf'\g<1>{schema}.', sql, count=1))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # 独立库提交后再删除主库中的表（删除表会一并删除其上的触发器和索引）
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("DROP TRIGGER IF EXISTS main.trg_test_cases_fts_rename")
+        for name, _, _ in main_tables:
+            cursor.execute(f"DROP TABLE IF EXISTS main.{name}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def install_cross_database_triggers(conn: sqlite3.Connection, schema: str):
+    """在连接上创建跨库的TEMP触发器（运行历史全文索引需要读取主库中的用例名称）"""
+    if not fts_available(conn, schema):
+        return
+    for sql in CROSS_DATABASE_TRIGGERS.values():
+        conn.execute(sql.format(schema=schema))
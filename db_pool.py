@@ -0,0 +1,161 @@
+import sqlite3
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+class _PooledConnection(sqlite3.Connection):
+    """记录已经应用了前几个连接钩子（钩子只追加，按注册顺序应用）"""
+    hooks_applied = 0
+
+
+class SQLiteConnectionPool:
+    """SQLite连接池
+
+    复用已打开的连接，避免每次操作都重新 connect；所有连接统一开启 WAL、
+    busy_timeout、synchronous=NORMAL 等 PRAGMA，减少 "database is locked" 错误。
+    同一线程内嵌套调用 connection() 会复用外层连接，由最外层负责提交或回滚。
+    attachments 中的数据库文件会在每个连接上 ATTACH，并设置同样的 PRAGMA（各自独立的WAL）。
+    """
+
+    def __init__(self, db_path: str, max_idle: int = 8, busy_timeout: int = 5000,
+                 cache_size_kb: int = 16384, attachments: Optional[Dict[str, str]] = None):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.cache_size_kb = cache_size_kb
+        self.attachments = dict(attachments or {})
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self._local = threading.local()
+        self._connect_hooks: Dict[str, Callable[[sqlite3.Connection], None]] = {}
+        self._hook_list: List[Callable[[sqlite3.Connection], None]] = []
+        self._hooks_lock = threading.Lock()
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """创建新连接并设置PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            factory=_PooledConnection
+        )
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self._apply_schema_pragmas(conn, 'main')
+        for schema, path in self.attachments.items():
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+            self._apply_schema_pragmas(conn, schema)
+        self._apply_hooks(conn)
+        return conn
+
+    def _apply_hooks(self, conn: _PooledConnection):
+        """补上该连接尚未执行的连接钩子"""
+        if conn.hooks_applied == len(self._hook_list):
+            return
+        with self._hooks_lock:
+            hooks = self._hook_list[conn.hooks_applied:]
+        for hook in hooks:
+            hook(conn)
+            conn.hooks_applied += 1
+
+    def _apply_schema_pragmas(self, conn: sqlite3.Connection, schema: str):
+        # 只对尚未建表的新库生效（必须在切换WAL之前）；已有的库用 python history_archive.py --enable-incremental-vacuum 离线转换
+        conn.execute(f"PRAGMA {schema}.auto_vacuum=INCREMENTAL")
+        conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        conn.execute(f"PRAGMA {schema}.synchronous=NORMAL")
+        # 负数表示以KB为单位
+        conn.execute(f"PRAGMA {schema}.cache_size=-{int(self.cache_size_kb)}")
+
+    def add_connect_hook(self, name: str, hook: Callable[[sqlite3.Connection], None]):
+        """注册在每个连接上执行的初始化函数（同名只注册一次）
+
+        新连接创建时执行；注册时已存在的连接（空闲的或正被借出的）在下次借出时补上。
+        """
+        with self._hooks_lock:
+            if name in self._connect_hooks:
+                return
+            self._connect_hooks[name] = hook
+            self._hook_list.append(hook)
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._create_connection()
+        try:
+            self._apply_hooks(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            # 空闲连接已满，多出的连接直接关闭
+            conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借出一个连接，正常退出时提交，异常时回滚"""
+        current = getattr(self._local, 'conn', None)
+        if current is not None:
+            # 嵌套调用，复用外层连接和事务
+            yield current
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.after_transaction = []
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            # 包括被丢弃的流式生成器（GeneratorExit）和KeyboardInterrupt，连接不能带着未结束的事务回到池中
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            callbacks = self._local.after_transaction
+            self._local.conn = None
+            self._local.after_transaction = None
+            self._release(conn)
+            for callback in callbacks:
+                callback()
+
+    def call_after_transaction(self, callback: Callable[[], None]):
+        """在最外层connection()结束（提交或回滚）后调用callback；不在事务中时立即调用
+
+        用于缓存失效：必须在写入对其他连接可见之后执行，否则并发读取可能把旧数据重新放入缓存。
+        """
+        callbacks = getattr(self._local, 'after_transaction', None)
+        if callbacks is None:
+            callback()
+        else:
+            callbacks.append(callback)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools: Dict[str, SQLiteConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str, attachments: Optional[Dict[str, str]] = None) -> SQLiteConnectionPool:
+    """获取指定数据库文件的共享连接池（同一文件的ATTACH配置必须一致）"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = SQLiteConnectionPool(db_path, attachments=attachments)
+            _pools[db_path] = pool
+        elif pool.attachments != dict(attachments or {}):
+            raise ValueError(f"数据库 {db_path} 的连接池已使用不同的ATTACH配置创建")
+        return pool
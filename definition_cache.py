@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# 最多缓存的条目数（用例定义和步骤列表各算一条）
+DEFINITION_CACHE_MAX_ENTRIES = 512
+
+MISSING = object()
+
+
+def _copy(value: Any) -> Any:
+    """用例和步骤都是由标量组成的字典（或字典列表），浅拷贝即可"""
+    if isinstance(value, list):
+        return [dict(item) for item in value]
+    return dict(value)
+
+
+class DefinitionCache:
+    """用例定义和步骤的进程内读穿缓存（LRU）
+
+    每个数据库一个代数，写操作提交后删除该用例的条目并把代数加1；读取时先记下代数，
+    查完数据库后只有代数未变才写入缓存，避免并发写入期间把旧数据放回缓存。
+    代数按数据库而不是按用例记录，占用的内存不随写过的用例数增长。
+    只感知本进程内通过Database的写入。
+    """
+
+    def __init__(self, max_entries: int = DEFINITION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, int], Any]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def generation(self, db_path: str) -> int:
+        with self._lock:
+            return self._generations.get(db_path, 0)
+
+    def get(self, db_path: str, kind: str, case_id: int):
+        """返回缓存值的副本；未命中时返回MISSING"""
+        key = (db_path, kind, case_id)
+        with self._lock:
+            value = self._entries.get(key, MISSING)
+            if value is MISSING:
+                self._misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self._hits += 1
+        # 调用方可能修改返回的字典，缓存中保留原件
+        return _copy(value)
+
+    def put(self, db_path: str, kind: str, case_id: int, generation: int, value: Any):
+        key = (db_path, kind, case_id)
+        with self._lock:
+            if generation != self._generations.get(db_path, 0):
+                return
+            self._entries[key] = _copy(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, db_path: str, case_id: int):
+        with self._lock:
+            self._generations[db_path] = self._generations.get(db_path, 0) + 1
+            for kind in ('case', 'steps'):
+                self._entries.pop((db_path, kind, case_id), None)
+            self._invalidations += 1
+
+    def clear(self, db_path: Optional[str] = None):
+        with self._lock:
+            for key in [key for key in self._entries if db_path is None or key[0] == db_path]:
+                del self._entries[key]
+            for path in ([db_path] if db_path is not None else list(self._generations)):
+                self._generations[path] = self._generations.get(path, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else None,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations
+            }
+
+
+definition_cache = DefinitionCache()
@@ -0,0 +1,57 @@
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+# SSE连接在没有新选择时发送保活注释的间隔（秒）；长轮询单次最多等待的秒数
+SELECTION_KEEPALIVE_SECONDS = 15
+SELECTION_LONG_POLL_MAX_SECONDS = 30
+
+
+class SelectionChannel:
+    """浏览器中选中的元素从Playwright回调线程推送给等待中的请求
+
+    每次选择版本号加一，等待方记住已收到的版本号，只有更新的选择才会唤醒它，
+    不会漏掉也不会重复收到同一次选择。关闭选择模式时唤醒所有等待方。
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._element: Optional[Dict[str, Any]] = None
+        self._active = False
+
+    @property
+    def version(self) -> int:
+        with self._condition:
+            return self._version
+
+    def open(self):
+        """进入选择模式，丢弃上一次的选择（版本号不变，之前记下的版本号仍然有效）"""
+        with self._condition:
+            self._element = None
+            self._active = True
+
+    def close(self):
+        """退出选择模式，正在等待的请求立即返回"""
+        with self._condition:
+            self._active = False
+            self._condition.notify_all()
+
+    def publish(self, element: Dict[str, Any]):
+        """记录一次选择并唤醒所有等待方"""
+        with self._condition:
+            self._version += 1
+            self._element = element
+            self._condition.notify_all()
+
+    def wait(self, after_version: int, timeout: float) -> Tuple[int, Optional[Dict[str, Any]], bool]:
+        """等待版本号大于after_version的选择，返回(版本号, 选中的元素或None, 是否仍在选择模式)
+
+        超时或选择模式已关闭时元素为None。
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > after_version or not self._active, timeout)
+            element = self._element if self._version > after_version else None
+            return self._version, element, self._active
+
+
+selection_channel = SelectionChannel()
@@ -0,0 +1,150 @@
+import gzip
+import json
+import os
+import zlib
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 归档文件中保存的运行历史字段
+ARCHIVE_FIELDS = ('id', 'case_id', 'status', 'duration', 'error', 'extracted_text', 'expected_text', 'created_at')
+
+
+def archive_dir_for(db_path: str) -> str:
+    """归档目录：与数据库文件同目录下的 <库名>_archive"""
+    base = os.path.splitext(os.path.abspath(db_path))[0]
+    return base + '_archive'
+
+
+def archive_key(case_id: Optional[int]) -> int:
+    """归档使用的用例键：没有用例的运行历史记为0（与run_history_archive表一致）"""
+    return case_id if case_id is not None else 0
+
+
+def archive_path(archive_dir: str, case_id: Optional[int]) -> str:
+    """每个用例一个归档文件，按用例查询时只需读取一个文件"""
+    key = archive_key(case_id)
+    if key == 0:
+        # 早期版本把没有用例的记录写入case_none
+        legacy = os.path.join(archive_dir, "case_none.ndjson.gz")
+        if os.path.exists(legacy):
+            return legacy
+    return os.path.join(archive_dir, f"case_{key}.ndjson.gz")
+
+
+def append_rows(path: str, rows: Iterable[tuple]) -> Tuple[int, int, int]:
+    """以新的gzip成员追加写入NDJSON行，写入后fsync，返回(起始位置, 结束位置, 写入行数)
+
+    多个gzip成员首尾相接仍是合法的gzip流，读取时会被连续解压。
+    调用方在删除这些记录的同一事务中把成员登记到run_history_archive_members：
+    中断后留在文件中、未提交的成员不会被登记，读取时也不会读到。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path, 'ab') as raw:
+        start = raw.seek(0, os.SEEK_END)
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as gz:
+            for row in rows:
+                record = dict(zip(ARCHIVE_FIELDS, row))
+                gz.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+                gz.write(b'\n')
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+        end = raw.tell()
+    return start, end, count
+
+
+def rewrite_archive(path: str) -> Optional[Tuple[int, int, int]]:
+    """把没有成员登记的旧归档去重后重写为一个成员，返回(起始位置, 结束位置, 行数)；文件不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    records = read_case_rows(path)
+    records.reverse()
+    temp_path = path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    member = append_rows(temp_path, [tuple(record.get(field) for field in ARCHIVE_FIELDS) for record in records])
+    os.replace(temp_path, path)
+    return member
+
+
+def _read_range(raw: BinaryIO, start: int, end: int) -> List[Dict[str, Any]]:
+    """解压[start, end)之间的gzip成员，按写入顺序返回记录"""
+    raw.seek(start)
+    data = raw.read(end - start)
+    records = []
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        text = decompressor.decompress(data)
+        data = decompressor.unused_data
+        records.extend(json.loads(line) for line in text.decode('utf-8').splitlines() if line.strip())
+    return records
+
+
+def iter_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """按写入顺序逐行读取归档记录"""
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_case_rows(path: str) -> List[Dict[str, Any]]:
+    """读取一个用例的全部归档记录，按时间倒序返回
+
+    归档写入成功但删除未提交时（进程中断），重跑会再次归档同一批记录，这里按id去重。
+    """
+    records = {}
+    for record in iter_rows(path):
+        records[record['id']] = record
+    return sorted(records.values(), key=lambda r: (r['created_at'] or '', r['id']), reverse=True)
+
+
+def read_page(path: str, members: List[Tuple[int, int, int]], offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """按时间倒序分页读取一个用例的归档记录，返回(记录, 总数)
+
+    members为已登记的(起始位置, 结束位置, 行数)，按写入顺序排列。归档按时间顺序追加，
+    从最后一个成员往前读，只解压覆盖该页的成员。
+    """
+    total = sum(count for _, _, count in members)
+    page: List[Dict[str, Any]] = []
+    if not members:
+        return page, total
+    skip = offset
+    with open(path, 'rb') as raw:
+        for start, end, count in reversed(members):
+            if len(page) >= limit:
+                break
+            if skip >= count:
+                skip -= count
+                continue
+            records = _read_range(raw, start, end)
+            records.reverse()
+            page.extend(records[skip:skip + limit - len(page)])
+            skip = 0
+    return page, total
+
+
+if __name__ == '__main__':
+    import argparse
+    from database import Database, RETENTION_MAX_AGE_DAYS, RETENTION_KEEP_PER_CASE
+
+    parser = argparse.ArgumentParser(description='按保留策略归档运行历史并回收数据库空间')
+    parser.add_argument('--db', default='test_cases.db', help='数据库文件路径')
+    parser.add_argument('--max-age-days', type=int, default=RETENTION_MAX_AGE_DAYS, help='归档早于该天数的记录，0表示不按天数归档')
+    parser.add_argument('--keep-per-case', type=int, default=RETENTION_KEEP_PER_CASE, help='每个用例保留的最近记录数，0表示不按数量归档')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='只把旧库转换为增量auto_vacuum（完整VACUUM，执行期间数据库不可写，请在停机时运行）')
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    if args.enable_incremental_vacuum:
+        schemas = ['main'] + ([database.history_schema] if database.history_schema != 'main' else [])
+        result = [database.enable_incremental_vacuum(schema) for schema in schemas]
+    else:
+        result = database.archive_run_history(
+            max_age_days=args.max_age_days or None,
+            keep_per_case=args.keep_per_case or None
+        )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# 导出的运行历史字段（按此顺序输出）
+EXPORT_COLUMNS = ('id', 'project_id', 'project_name', 'case_id', 'case_name', 'status', 'duration',
+                  'created_at', 'error', 'extracted_text', 'expected_text')
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet')
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+# 每次查询的行数（也是parquet每个行组的行数）
+EXPORT_CHUNK_SIZE = 5000
+# 文本格式攒够该字节数再输出一次
+OUTPUT_BUFFER_BYTES = 64 * 1024
+
+_TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+def parse_time(value: Optional[str]) -> Optional[str]:
+    """把时间筛选参数规范为created_at的存储格式，格式错误时抛出ValueError"""
+    if not value:
+        return None
+    for time_format in _TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"无效的时间: {value}，应为YYYY-MM-DD或YYYY-MM-DD HH:MM:SS")
+
+
+def csv_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """CSV（首行为表头）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        if buffer.tell() >= OUTPUT_BUFFER_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """每行一个JSON对象"""
+    buffer = bytearray()
+    for rows in batches:
+        for row in rows:
+            buffer += json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            buffer += b'\n'
+        if len(buffer) >= OUTPUT_BUFFER_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class _ChunkSink(io.RawIOBase):
+    """只追加写入的输出流，写入的数据由生成器取走（parquet写入器不需要seek）"""
+
+    def __init__(self):
+        self.chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def parquet_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """Parquet，每批一个行组；需要安装pyarrow"""
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()), ('project_id', pyarrow.int64()), ('project_name', pyarrow.string()),
+        ('case_id', pyarrow.int64()), ('case_name', pyarrow.string()), ('status', pyarrow.string()),
+        ('duration', pyarrow.float64()), ('created_at', pyarrow.string()), ('error', pyarrow.string()),
+        ('extracted_text', pyarrow.string()), ('expected_text', pyarrow.string()),
+    ])
+    sink = _ChunkSink()
+    with pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def export_chunks(export_format: str, batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """按格式编码导出数据，格式不支持时抛出ValueError"""
+    if export_format == 'csv':
+        return csv_chunks(batches)
+    if export_format == 'ndjson':
+        return ndjson_chunks(batches)
+    if export_format == 'parquet':
+        if pyarrow is None:
+            raise ValueError("导出parquet需要安装pyarrow")
+        return parquet_chunks(batches)
+    raise ValueError(f"不支持的导出格式: {export_format}，可选: {', '.join(EXPORT_FORMATS)}")
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='导出运行历史（CSV/NDJSON/Parquet），供离线分析')
+    parser.add_argument('--db', default='test_cases.db', help='数据库文件路径')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='导出格式')
+    parser.add_argument('--project-id', type=int, help='只导出该项目的运行历史')
+    parser.add_argument('--case-id', type=int, help='只导出该用例的运行历史')
+    parser.add_argument('--since', help='开始时间（含），YYYY-MM-DD或YYYY-MM-DD HH:MM:SS')
+    parser.add_argument('--until', help='结束时间（不含）')
+    parser.add_argument('--full-text', action='store_true', help='导出完整的错误信息和提取文本（默认只导出预览）')
+    parser.add_argument('-o', '--output', help='输出文件，默认输出到标准输出')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    batches = Database(args.db).iter_run_history_export(
+        project_id=args.project_id, case_id=args.case_id,
+        since=parse_time(args.since), until=parse_time(args.until), full_text=args.full_text
+    )
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_chunks(args.format, batches):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    print(f"导出完成，用时 {time.perf_counter() - start:.2f} 秒", file=sys.stderr)
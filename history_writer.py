@@ -0,0 +1,140 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from logger import uat_logger
+
+# 每批最多写入的记录数，以及第一条记录入队后最多等待多久凑批
+WRITER_MAX_BATCH_SIZE = 200
+WRITER_MAX_DELAY = 0.2
+
+_STOP = object()
+
+
+class BatchWriter:
+    """后台批量写入线程
+
+    执行路径只负责把记录放入队列，写入线程在时间/数量窗口内凑批，
+    每批一个事务提交，避免每条结果单独连接、提交和fsync。
+    进程退出时（atexit）会先把队列中剩余的记录写完。
+    """
+
+    def __init__(self, write_batch: Callable[[List[Dict[str, Any]]], Any], name: str = "batch-writer",
+                 max_batch_size: int = WRITER_MAX_BATCH_SIZE, max_delay: float = WRITER_MAX_DELAY):
+        self._write_batch = write_batch
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            'submitted': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_flush_at': None
+        }
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, record: Dict[str, Any]):
+        """提交一条记录，立即返回；写入线程已关闭时直接同步写入"""
+        with self._lock:
+            self._stats['submitted'] += 1
+            if not self._closed:
+                self._queue.put(record)
+                return
+        self._commit([record])
+
+    def queue_depth(self) -> int:
+        """尚未写入的记录数"""
+        return self._queue.qsize()
+
+    def flush(self):
+        """阻塞直到已提交的记录全部写入"""
+        self._queue.join()
+
+    def close(self, timeout: float = 30):
+        """写完剩余记录并停止写入线程"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self.queue_depth()
+        stats['running'] = self._thread.is_alive()
+        return stats
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _commit(self, batch: List[Dict[str, Any]]):
+        written = 0
+        try:
+            self._write_batch(batch)
+            written = len(batch)
+        except Exception as e:
+            # 整批失败时逐条重试，避免一条坏记录拖累整批
+            uat_logger.error(f"{self.name} 批量写入失败，改为逐条写入: {e}")
+            for record in batch:
+                try:
+                    self._write_batch([record])
+                    written += 1
+                except Exception as record_error:
+                    uat_logger.error(f"{self.name} 写入记录失败，已丢弃: {record_error} | {str(record)[:200]}")
+
+        with self._lock:
+            self._stats['written'] += written
+            self._stats['failed'] += len(batch) - written
+            self._stats['batches'] += 1
+            self._stats['last_batch_size'] = len(batch)
+            self._stats['last_flush_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+_writers: Dict[str, BatchWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_history_writer(db_path: str, write_batch: Callable[[List[Dict[str, Any]]], Any]) -> BatchWriter:
+    """获取指定数据库文件的共享运行历史写入线程（首次调用时创建）"""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = BatchWriter(write_batch, name=f"run-history-writer[{db_path}]")
+            _writers[db_path] = writer
+        return writer
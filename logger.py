@@ -1,16 +1,105 @@
+import atexit
+import contextlib
+import contextvars
+import copy
 import logging
+import logging.handlers
 import os
+import queue
+import uuid
 from datetime import datetime
 import json
 import traceback
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+from run_log import RunLogHandler
+
+# 日志级别（环境变量），低于该级别的日志不格式化、不入队
+LOG_LEVEL_ENV = 'UAT_LOG_LEVEL'
+# 单个日志文件超过该大小后轮转，保留的历史文件个数
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
+# 请求/响应数据在日志中最多保留的字节数（环境变量可覆盖），超出部分截断
+LOG_PAYLOAD_MAX_BYTES_ENV = 'UAT_LOG_PAYLOAD_MAX_BYTES'
+LOG_PAYLOAD_MAX_BYTES = 2048
+# 列表只保留前若干项作为样本
+LOG_PAYLOAD_MAX_ITEMS = 20
+# 日志队列容量，写入跟不上时丢弃新日志而不是阻塞请求
+LOG_QUEUE_SIZE = 10000
+# 附加到每条日志的上下文字段
+LOG_CONTEXT_FIELDS = ('run_id', 'job_id', 'case_id', 'step')
+
+# 当前的运行/任务/步骤上下文；线程和协程各自独立，需要跨线程时用contextvars.copy_context()传递
+_log_context: contextvars.ContextVar = contextvars.ContextVar('uat_log_context', default={})
+
+
+def new_run_id() -> str:
+    """生成运行ID（也用作任务ID）"""
+    return uuid.uuid4().hex
+
+
+def current_log_context() -> Dict[str, Any]:
+    """当前的日志上下文"""
+    return _log_context.get()
+
+
+class _LogContextFilter(logging.Filter):
+    """在调用方线程中把日志上下文附加到日志记录上（监听线程中已经取不到）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        for field in LOG_CONTEXT_FIELDS:
+            setattr(record, field, context.get(field))
+        return True
+
+
+# 入队前把异常信息转为文本，与处理器使用的Formatter输出一致
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志并计数，不阻塞调用方"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """只做入队必需的处理，格式化留给监听线程中的处理器
+
+        标准库的QueueHandler.prepare会在调用方线程中格式化整条日志；这里只把参数合并进消息，
+        异常信息转为文本（traceback引用的栈帧不能跨线程保留），其余字段原样入队。
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 
 class UATLogger:
-    """UI自动化测试平台日志记录器"""
+    """UI自动化测试平台日志记录器
+    
+    调用方只把日志记录放入队列，格式化和文件/控制台输出由后台监听线程完成，请求耗时不受日志I/O影响。
+    """
     
-    def __init__(self, name: str = "UATPlatform", log_dir: str = "logs"):
+    def __init__(self, name: str = "UATPlatform", log_dir: str = "logs",
+                 max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT,
+                 payload_max_bytes: Optional[int] = None):
         self.logger = logging.getLogger(name)
-        self.logger.setLevel(logging.DEBUG)
+        self.logger.setLevel(os.environ.get(LOG_LEVEL_ENV, 'DEBUG').upper())
+        self.payload_max_bytes = payload_max_bytes or int(
+            os.environ.get(LOG_PAYLOAD_MAX_BYTES_ENV) or LOG_PAYLOAD_MAX_BYTES
+        )
         
         # 创建日志目录
         if not os.path.exists(log_dir):
@@ -22,30 +111,81 @@ class UATLogger:
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         
-        # 文件处理器 - 记录所有日志
+        # 文件处理器 - 记录所有日志，按大小轮转
         today = datetime.now().strftime("%Y%m%d")
-        file_handler = logging.FileHandler(
+        file_handler = logging.handlers.RotatingFileHandler(
             os.path.join(log_dir, f"uat_platform_{today}.log"),
+            maxBytes=max_bytes, backupCount=backup_count,
             encoding='utf-8'
         )
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
         
         # 错误文件处理器 - 只记录错误
-        error_handler = logging.FileHandler(
+        error_handler = logging.handlers.RotatingFileHandler(
             os.path.join(log_dir, f"errors_{today}.log"),
+            maxBytes=max_bytes, backupCount=backup_count,
             encoding='utf-8'
         )
         error_handler.setLevel(logging.ERROR)
         error_handler.setFormatter(formatter)
-        self.logger.addHandler(error_handler)
         
         # 控制台处理器 - 只记录INFO及以上级别
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
+        
+        # 运行日志处理器 - 带运行ID的日志另写一份JSON行，并按运行ID建立索引
+        self._run_log_handler = RunLogHandler(log_dir)
+        
+        # 调用方只入队，由监听线程写文件和控制台
+        self._queue_handler = _NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        self._queue_handler.addFilter(_LogContextFilter())
+        self.logger.addHandler(self._queue_handler)
+        self._listener = logging.handlers.QueueListener(
+            self._queue_handler.queue, file_handler, error_handler, console_handler, self._run_log_handler,
+            respect_handler_level=True
+        )
+        self._listener.start()
+        atexit.register(self.close)
+    
+    def close(self):
+        """写完队列中剩余的日志并停止监听线程"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+
+    @property
+    def dropped_records(self) -> int:
+        """因队列已满被丢弃的日志条数"""
+        return self._queue_handler.dropped
+    
+    @contextlib.contextmanager
+    def context(self, **fields):
+        """在with块内给日志附加上下文（run_id、job_id、case_id、step），退出时恢复原来的上下文"""
+        token = _log_context.set({**_log_context.get(), **fields})
+        try:
+            yield _log_context.get()
+        finally:
+            _log_context.reset(token)
+    
+    def update_context(self, **fields):
+        """修改当前上下文（如切换到下一个用例或步骤），在外层context块退出时一并恢复"""
+        _log_context.set({**_log_context.get(), **fields})
+    
+    def set_step(self, step: Any):
+        """标记当前执行的步骤"""
+        self.update_context(step=step)
+    
+    def read_run_logs(self, run_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """读取一次运行的日志（尚在队列中的日志不包含在内）"""
+        return self._run_log_handler.read_run(run_id, limit)
+    
+    def is_enabled_for(self, level: int) -> bool:
+        """该级别的日志是否会被记录，调用方可据此跳过构造日志内容"""
+        return self.logger.isEnabledFor(level)
     
     def debug(self, message: str):
         """记录调试信息"""
@@ -75,24 +215,26 @@ class UATLogger:
     
     def log_api_request(self, endpoint: str, method: str, request_data: Optional[Dict] = None):
         """记录API请求"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
         message = f"API请求: {method} {endpoint}"
         if request_data:
-            # 避免记录敏感信息
-            filtered_data = self._filter_sensitive_data(request_data.copy())
-            message += f" | 数据: {json.dumps(filtered_data, ensure_ascii=False)}"
+            message += f" | 数据: {self.format_payload(request_data)}"
         self.info(message)
     
     def log_api_response(self, endpoint: str, status_code: int, response_data: Optional[Dict] = None):
         """记录API响应"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
         message = f"API响应: {endpoint} | 状态码: {status_code}"
         if response_data:
-            # 避免记录敏感信息
-            filtered_data = self._filter_sensitive_data(response_data.copy())
-            message += f" | 数据: {json.dumps(filtered_data, ensure_ascii=False)}"
+            message += f" | 数据: {self.format_payload(response_data)}"
         self.info(message)
     
     def log_automation_step(self, action: str, selector: Optional[str] = None, details: Optional[str] = None):
         """记录自动化步骤"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
         message = f"自动化操作: {action}"
         if selector:
             message += f" | 选择器: {selector}"
@@ -102,16 +244,48 @@ class UATLogger:
     
     def log_browser_event(self, event_type: str, event_data: Dict[str, Any]):
         """记录浏览器事件"""
-        filtered_data = self._filter_sensitive_data(event_data.copy())
-        message = f"浏览器事件: {event_type} | 数据: {json.dumps(filtered_data, ensure_ascii=False)}"
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        message = f"浏览器事件: {event_type} | 数据: {self.format_payload(event_data)}"
         self.debug(message)
     
     def log_recording_session(self, start_time: datetime, end_time: datetime, step_count: int, url: str):
         """记录录制会话"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
         duration = end_time - start_time
         message = f"录制会话: URL={url} | 时长={duration.total_seconds():.2f}秒 | 步骤数={step_count}"
         self.info(message)
     
+    def format_payload(self, data: Any) -> str:
+        """把请求/响应数据转成日志文本：过滤敏感信息，长字符串和长列表先截断/抽样，结果不超过payload_max_bytes"""
+        if isinstance(data, (bytes, bytearray)):
+            encoded = bytes(data)
+        else:
+            if isinstance(data, (dict, list)):
+                data = self._filter_sensitive_data(data.copy())
+            encoded = json.dumps(self._shrink_payload(data), ensure_ascii=False, default=str).encode('utf-8')
+        if len(encoded) <= self.payload_max_bytes:
+            return encoded.decode('utf-8', errors='replace')
+        return encoded[:self.payload_max_bytes].decode('utf-8', errors='ignore') + f"...(已截断，共{len(encoded)}字节)"
+    
+    def _shrink_payload(self, data: Any, depth: int = 0) -> Any:
+        """截断过长的字符串、只保留列表的前几项，避免序列化整个HTML文档或大列表"""
+        if isinstance(data, str):
+            if len(data) > self.payload_max_bytes:
+                return data[:self.payload_max_bytes] + f"...(共{len(data)}字符)"
+            return data
+        if depth >= 8:
+            return data if isinstance(data, (int, float, bool, type(None))) else '...'
+        if isinstance(data, dict):
+            return {key: self._shrink_payload(value, depth + 1) for key, value in data.items()}
+        if isinstance(data, (list, tuple)):
+            sample = [self._shrink_payload(item, depth + 1) for item in data[:LOG_PAYLOAD_MAX_ITEMS]]
+            if len(data) > LOG_PAYLOAD_MAX_ITEMS:
+                sample.append(f"...(共{len(data)}项)")
+            return sample
+        return data
+    
     def log_exception(self, func_name: str, exception: Exception, additional_info: Optional[str] = None):
         """记录异常"""
         message = f"异常捕获: 函数={func_name} | 异常类型={type(exception).__name__} | 异常消息={str(exception)}"
@@ -3,9 +3,91 @@ from playwright.async_api import async_playwright
 from typing import List, Dict, Any, Optional
 import json
 import time
-from logger import uat_logger
+from logger import uat_logger, new_run_id
+from element_selection import selection_channel
+from recording_stream import RecordingCompactor, RECORDING_PENDING_FLUSH, RECORDING_DRAIN_TIMEOUT
 import ctypes  # 用于调用Windows API获取真实屏幕尺寸
 
+# 元素选择器:高亮鼠标下的元素,点击时拦截页面自身的处理,
+# 通过__uatElementSelected绑定把元素信息直接交给Python,不需要前端轮询。
+# 与录制脚本一起作为初始化脚本注册,只定义开关函数,由录制脚本中的__uatSetModes按选择模式调用
+ELEMENT_PICKER_JS = r"""
+(() => {
+    const overlay = document.createElement('div');
+    overlay.style.cssText = 'position:fixed;pointer-events:none;z-index:2147483647;display:none;' +
+        'border:2px solid #409eff;background:rgba(64,158,255,0.15);box-sizing:border-box;';
+    
+    function describeElement(element) {
+        const selector = typeof window.generateSelector === 'function' ? window.generateSelector(element) : element.tagName.toLowerCase();
+        return {
+            selector: selector,
+            elementInfo: {
+                tagName: element.tagName,
+                id: element.id || '',
+                className: element.getAttribute('class') || '',
+                textContent: element.textContent ? element.textContent.substring(0, 100) : '',
+                attributes: {
+                    type: element.type || '',
+                    name: element.name || '',
+                    value: element.value || '',
+                    href: element.href || '',
+                    src: element.src || '',
+                    alt: element.alt || '',
+                    title: element.title || '',
+                    'data-testid': element.getAttribute('data-testid') || ''
+                }
+            }
+        };
+    }
+    
+    function onMouseMove(e) {
+        // 初始化脚本执行时文档还没有内容,高亮框在第一次使用时才插入
+        if (!overlay.isConnected) {
+            (document.body || document.documentElement).appendChild(overlay);
+        }
+        const rect = e.target.getBoundingClientRect();
+        overlay.style.display = 'block';
+        overlay.style.left = rect.left + 'px';
+        overlay.style.top = rect.top + 'px';
+        overlay.style.width = rect.width + 'px';
+        overlay.style.height = rect.height + 'px';
+    }
+    
+    function onClick(e) {
+        // 选择模式下的点击不触发页面自身的处理,也不会被录制
+        e.preventDefault();
+        e.stopImmediatePropagation();
+        const detail = describeElement(e.target);
+        window.automationSelection.selectedElement = e.target;
+        window.dispatchEvent(new CustomEvent('elementSelected', { detail: detail }));
+        if (typeof window.__uatElementSelected === 'function') {
+            window.__uatElementSelected(detail);
+        }
+    }
+    
+    window.automationSelection = { active: false, selectedElement: null };
+    
+    window.enableElementSelection = function() {
+        if (window.automationSelection.active) {
+            return;
+        }
+        window.addEventListener('mousemove', onMouseMove, true);
+        window.addEventListener('click', onClick, true);
+        window.automationSelection.active = true;
+    };
+    
+    window.disableElementSelection = function() {
+        if (!window.automationSelection.active) {
+            return;
+        }
+        window.removeEventListener('mousemove', onMouseMove, true);
+        window.removeEventListener('click', onClick, true);
+        overlay.remove();
+        window.automationSelection.active = false;
+    };
+})();
+"""
+
 class PlaywrightAutomation:
     def __init__(self):
         self.browser = None
@@ -17,6 +99,11 @@ class PlaywrightAutomation:
         self.page_events = []  # 存储页面事件以便后续处理
         self.sync_task = None  # 用于同步录制事件的后台任务
         self.playwright = None  # 初始化playwright实例变量
+        self.page_modes = {'recording': False, 'selecting': False}  # 页面脚本的录制/元素选择模式
+        self._scripts_context = None  # 已注册初始化脚本的浏览器上下文
+        self._recorder = None  # 录制中的事件压缩器,压缩后的步骤交给start_recording指定的接收方
+        self._received_seq = {}  # 录制中各页面文档已通过绑定收到的最后一个事件序号
+        self._received_signal = None  # 收到录制事件时置位,停止录制时等待剩余事件
     
     async def start_browser(self, headless=False):
         """启动浏览器"""
@@ -72,6 +159,17 @@ class PlaywrightAutomation:
                     no_viewport=True  # 让浏览器自动管理视口大小
                 )
                 
+                # 页面中的元素选择器点击元素后通过该绑定回调Python，选择结果由selection_channel推送给前端
+                await self.context.expose_binding('__uatElementSelected', self._on_element_selected)
+                # 录制的事件发生时立即通过该绑定交给Python
+                await self.context.expose_binding('__uatRecordEvent', self._on_recorded_event)
+                # 新文档加载时通过该绑定查询当前的录制/选择模式
+                await self.context.expose_binding('__uatGetModes', self._get_page_modes)
+                
+                # 录制和元素选择脚本每个上下文注册一次,之后打开的页面和框架都会在页面脚本之前执行
+                self.page_modes = {'recording': False, 'selecting': False}
+                await self._setup_event_listeners()
+                
                 # 创建新页面
                 self.page = await self.context.new_page()
                 
@@ -97,13 +195,7 @@ class PlaywrightAutomation:
                 uat_logger.info(f"浏览器窗口外尺寸: {outer_size['width']}x{outer_size['height']}")
                 uat_logger.info(f"浏览器已设置为全屏模式,右上角最大化按钮应不可见")
                 
-                uat_logger.info("浏览器已启动并最大化,设置事件监听器")
-                
-                # 设置事件监听器用于录制用户操作
-                await self._setup_event_listeners()
-                
-                # 监听页面跳转事件,确保在新页面上也设置事件监听器
-                self.page.on('framenavigated', self._on_page_navigated)
+                uat_logger.info("浏览器已启动并最大化")
             
             return self.page
         except Exception as e:
@@ -111,146 +203,354 @@ class PlaywrightAutomation:
             raise Exception(f"启动浏览器失败: {str(e)}")
     
     async def _setup_event_listeners(self):
-        """设置页面事件监听器用于录制操作"""
-        if self.page:
+        """在浏览器上下文中注册录制和元素选择的初始化脚本(每个上下文只注册一次)
+        
+        初始化脚本在每个页面和框架的页面脚本之前执行,页面跳转后不需要重新注入;
+        录制和元素选择模式通过_set_page_modes切换。
+        """
+        if self.context is None:
+            uat_logger.warning("浏览器上下文为None,无法设置事件监听器")
+        elif self._scripts_context is not self.context:
             # 定义事件监听器JavaScript代码
             event_listeners_js = r"""
-                // 检查是否已经添加了事件监听器,避免重复添加
+                // 同一文档中只设置一次
                 if (!window.eventListenersAdded) {
                     // 初始化事件数组
                     window.automationEvents = window.automationEvents || [];
                     window.automationConfig = {
                         scrollTimeout: null,
                         lastScrollPosition: { x: 0, y: 0 },
-                        scrollThreshold: 50, // 只有滚动超过50px才记录
-                        inputDebounce: {},
-                        debounceDelay: 500
+                        scrollThreshold: 50 // 只有滚动超过50px才记录
                     };
                 
-                // 生成更精确的CSS选择器
-                // 递归辅助函数:生成元素的完整路径选择器
-                function generateFullPath(element, maxDepth = 4, currentDepth = 0) {
-                    if (!element || element.tagName === 'HTML' || currentDepth >= maxDepth) {
-                        return [];
+                // 录制/选择模式:新文档通过__uatGetModes向Python查询,之后由Python调用__uatSetModes切换;
+                // 查询结果返回前发生的事件先暂存,确定正在录制后再发送
+                window.automationModes = null;
+                const pendingEvents = [];
+                
+                // 返回停止录制时队列中剩余的事件(直接交给Python,不经过绑定),
+                // 以及本文档的标识和已通过绑定发出的最后一个事件的序号
+                window.__uatSetModes = function(modes) {
+                    const wasRecording = !!(window.automationModes && window.automationModes.recording);
+                    // 切换模式前先处理完暂存队列,否则停止录制后这些事件会被丢弃
+                    let flushed = [];
+                    if (wasRecording && modes.recording === false) {
+                        flushed = takeRecordQueue();
+                    } else {
+                        flushRecordQueue();
+                    }
+                    window.automationModes = Object.assign({ recording: false, selecting: false }, window.automationModes, modes);
+                    if (window.automationModes.recording && !wasRecording) {
+                        window.automationEvents = [];  // 丢弃录制开始前暂存的事件
+                    }
+                    const queued = pendingEvents.splice(0);
+                    if (window.automationModes.recording) {
+                        queued.forEach(sendEvent);
+                    }
+                    if (!window.automationModes.recording && !window.automationModes.selecting) {
+                        resetSelectorCache();
+                    }
+                    if (typeof window.enableElementSelection === 'function') {
+                        if (window.automationModes.selecting) {
+                            window.enableElementSelection();
+                        } else {
+                            window.disableElementSelection();
+                        }
+                    }
+                    return { events: flushed, doc: documentId, seq: sentSeq };
+                };
+                
+                // 不在录制时跳过生成选择器等开销
+                function isRecording() {
+                    return window.automationModes === null || window.automationModes.recording;
+                }
+                
+                // 事件通过绑定立即发送给Python,页面跳转前已发生的事件不会丢失;
+                // 绑定不可用时暂存在automationEvents中,停止录制时再取。
+                // 通过绑定发出的事件带有文档标识和递增的序号,停止录制时Python据此等待它们全部到达
+                const documentId = Date.now().toString(36) + Math.random().toString(36).slice(2);
+                let sentSeq = 0;
+                function sendEvent(event) {
+                    if (typeof window.__uatRecordEvent === 'function') {
+                        event.doc = documentId;
+                        event.seq = ++sentSeq;
+                        window.__uatRecordEvent(event);
+                    } else {
+                        window.automationEvents.push(event);
+                    }
+                }
+                
+                function deliverEvent(event) {
+                    if (window.automationModes === null) {
+                        pendingEvents.push(event);
+                    } else if (window.automationModes.recording) {
+                        sendEvent(event);
+                    }
+                }
+                
+                // 事件处理函数只生成路径选择器,唯一性校验(需要查询文档)放到浏览器空闲时进行,
+                // 之后按发生顺序发送;页面卸载前立即处理剩余的事件,不会丢失
+                const recordQueue = [];
+                let recordFlushScheduled = false;
+                const RECORD_QUEUE_MAX = 50;
+                
+                // 同一输入框的连续输入在FILL_DEBOUNCE_MS内只保留最后一次;输入框失去焦点、
+                // 记录其他事件(点击、提交、按键等)或取出队列时立即放入队列,不会排在后续事件之后或丢失
+                const FILL_DEBOUNCE_MS = 300;
+                let pendingFill = null;
+                let pendingFillTimer = null;
+                
+                function takePendingFill() {
+                    if (pendingFillTimer !== null) {
+                        clearTimeout(pendingFillTimer);
+                        pendingFillTimer = null;
+                    }
+                    if (pendingFill) {
+                        recordQueue.push(pendingFill);
+                        pendingFill = null;
+                    }
+                }
+                
+                function recordFill(event, element) {
+                    if (pendingFill && pendingFill[1] !== element) {
+                        takePendingFill();
+                    }
+                    pendingFill = [event, element, siblingPosition(element)];
+                    if (pendingFillTimer !== null) {
+                        clearTimeout(pendingFillTimer);
+                    }
+                    pendingFillTimer = setTimeout(function() {
+                        pendingFillTimer = null;
+                        takePendingFill();
+                        scheduleRecordFlush();
+                    }, FILL_DEBOUNCE_MS);
+                }
+                
+                // 取出队列中的事件并完成唯一性校验
+                function takeRecordQueue() {
+                    takePendingFill();
+                    recordFlushScheduled = false;
+                    const queued = recordQueue.splice(0);
+                    for (const [event, element, position] of queued) {
+                        if (element && event.selector) {
+                            event.selector = ensureUnique(event.selector, element, position);
+                        }
+                    }
+                    return queued.map(entry => entry[0]);
+                }
+                
+                function flushRecordQueue() {
+                    takeRecordQueue().forEach(deliverEvent);
+                }
+                
+                function recordEvent(event, element) {
+                    takePendingFill();
+                    // 元素在兄弟元素中的位置在事件发生时记下,之后元素被移除或重新排序不影响结果
+                    recordQueue.push([event, element, element ? siblingPosition(element) : null]);
+                    scheduleRecordFlush();
+                }
+                
+                function scheduleRecordFlush() {
+                    if (recordQueue.length >= RECORD_QUEUE_MAX) {
+                        flushRecordQueue();
+                    } else if (!recordFlushScheduled) {
+                        recordFlushScheduled = true;
+                        if (typeof window.requestIdleCallback === 'function') {
+                            window.requestIdleCallback(flushRecordQueue, { timeout: 200 });
+                        } else {
+                            setTimeout(flushRecordQueue, 0);
+                        }
+                    }
+                }
+                
+                window.addEventListener('pagehide', flushRecordQueue, true);
+                window.addEventListener('beforeunload', flushRecordQueue, true);
+                document.addEventListener('focusout', function(e) {
+                    if (pendingFill && pendingFill[1] === e.target) {
+                        takePendingFill();
+                        scheduleRecordFlush();
+                    }
+                }, true);
+                
+                // ===== 选择器生成 =====
+                // 录制时每个事件都要生成选择器,重复的工作尽量缓存:
+                // 类名过滤规则合并编译一次,过滤结果按class属性值缓存;每个元素的路径片段和最终选择器用WeakMap缓存,
+                // 元素属性变化时由MutationObserver作废对应的缓存,DOM有任何变化时作废唯一性校验的结果
+                const MAX_PATH_DEPTH = 4;
+                // 稳定属性 - 扩展更多自动化测试常用属性
+                const STABLE_ATTRS = [
+                    'data-testid', 'data-cy', 'data-test', 'data-qa', 
+                    'data-automation', 'data-selector', 'data-key', 
+                    'data-id', 'data-name', 'data-component', 
+                    'data-module', 'data-section', 'data-field',
+                    'data-action', 'data-target', 'data-type',
+                    'name', 'title', 'role', 'aria-label', 
+                    'aria-labelledby', 'aria-describedby', 'aria-controls'
+                ];
+                const ADDITIONAL_ATTRS = ['data-name', 'role', 'aria-label', 'aria-labelledby'];
+                // 这些属性变化时元素的路径片段需要重新生成
+                const SEGMENT_ATTRS = Array.from(new Set(STABLE_ATTRS.concat(ADDITIONAL_ATTRS, [
+                    'id', 'class', 'type', 'name', 'placeholder', 'value', 'title', 'alt', 'src', 'href'
+                ])));
+                // 动态类名规则,合并成一个正则
+                const DYNAMIC_CLASS_PATTERNS = [
+                    /^is-\w+$/, /^has-\w+$/, /^\w+-\w+-(leave|enter|active|done)$/, 
+                    /^el-\w+(-\w+)*$/, /^ant-\w+(-\w+)*$/, /^t-[a-zA-Z0-9]{8}$/, 
+                    /^weui-\w+(-\w+)*$/, /^layui-\w+(-\w+)*$/, /^v-\w+$/, 
+                    /^ng-\w+$/, /^vue-\w+$/, /^react-\w+$/, /^svelte-\w+$/, 
+                    /^css-\w+$/, /^scss-\w+$/, /^style-\w+$/, /^component-\w+$/, 
+                    /^theme-\w+$/, /^mode-\w+$/, /^state-\w+$/, /^variant-\w+$/, 
+                    /^hover-\w+$/, /^focus-\w+$/, /^active-\w+$/, /^disabled-\w+$/, 
+                    /^selected-\w+$/, /^checked-\w+$/, /^expanded-\w+$/, /^collapsed-\w+$/, /^open-\w+$/, /^closed-\w+$/, 
+                    /^loading-\w+$/, /^error-\w+$/, /^success-\w+$/, /^warning-\w+$/, /^info-\w+$/, 
+                    /^\d+-\w+$/, /^\w+-\d+$/, /^[a-f0-9]{6,}$/, /^\w+-[a-f0-9]{6,16}$/, 
+                    /^\w+-[0-9a-z]{8,}$/, /^[a-z]{3,6}-[0-9a-z]{5,10}$/, 
+                    /^v?\d+\.\d+\.\d+$/, /^[0-9]+$/, 
+                    /^flex$/, /^grid$/, /^block$/, /^inline$/, /^hidden$/, /^visible$/, 
+                    /^absolute$/, /^relative$/, /^fixed$/, /^sticky$/, 
+                    /^left-\d+$/, /^right-\d+$/, /^top-\d+$/, /^bottom-\d+$/, 
+                    /^w-\d+$/, /^h-\d+$/, /^max-w-\d+$/, /^max-h-\d+$/, 
+                    /^p-\d+$/, /^m-\d+$/, /^mt-\d+$/, /^mr-\d+$/, /^mb-\d+$/, /^ml-\d+$/, 
+                    /^pt-\d+$/, /^pr-\d+$/, /^pb-\d+$/, /^pl-\d+$/, 
+                    /^text-\w+$/, /^bg-\w+$/, /^border-\w+$/, /^rounded-\w+$/, 
+                    /^lang-\w+$/, /^i18n-\w+$/, /^ltr$/, /^rtl$/, 
+                    /^mobile-\w+$/, /^tablet-\w+$/, /^desktop-\w+$/, /^xl-\w+$/, /^sm-\w+$/, /^md-\w+$/, /^lg-\w+$/
+                ];
+                const DYNAMIC_CLASS_PATTERN = new RegExp(DYNAMIC_CLASS_PATTERNS.map(p => `(?:${p.source})`).join('|'));
+                // 只有数字或特殊字符的类名
+                const INVALID_CLASS_PATTERN = /^[0-9_\-\.\s]+$/;
+                // querySelectorAll不支持的伪类,带有它们的选择器无法校验唯一性
+                const NON_STANDARD_PSEUDO_PATTERN = /:contains\(|:has-text\(/;
+                const CLASS_CACHE_MAX = 2000;
+                
+                const classSuffixCache = new Map();
+                let segmentCache = new WeakMap();
+                let selectorCache = new WeakMap();
+                let domGeneration = 0;
+                let domObserver = null;
+                
+                function observeDom() {
+                    if (domObserver) return;
+                    domObserver = new MutationObserver(records => {
+                        domGeneration++;
+                        for (const record of records) {
+                            if (record.type === 'attributes') {
+                                segmentCache.delete(record.target);
+                            }
+                        }
+                    });
+                    domObserver.observe(document, { subtree: true, childList: true, attributes: true, attributeFilter: SEGMENT_ATTRS });
+                }
+                
+                // 录制和选择都关闭时停止监听DOM并丢弃缓存,不影响回放时的页面性能
+                function resetSelectorCache() {
+                    if (domObserver) {
+                        domObserver.disconnect();
+                        domObserver = null;
+                    }
+                    segmentCache = new WeakMap();
+                    selectorCache = new WeakMap();
+                    classSuffixCache.clear();
+                }
+                
+                // 过滤掉动态类名后最多保留3个类名
+                function stableClassSuffix(className) {
+                    let suffix = classSuffixCache.get(className);
+                    if (suffix === undefined) {
+                        const stableClasses = className.split(' ').filter(c =>
+                            c.length > 2 && !DYNAMIC_CLASS_PATTERN.test(c) && !INVALID_CLASS_PATTERN.test(c)
+                        );
+                        suffix = stableClasses.length ? '.' + stableClasses.slice(0, 3).join('.') : '';
+                        if (classSuffixCache.size >= CLASS_CACHE_MAX) {
+                            classSuffixCache.clear();
+                        }
+                        classSuffixCache.set(className, suffix);
+                    }
+                    return suffix;
+                }
+                
+                // 生成元素自身在路径中的片段;有ID时为#id,路径到此为止
+                function elementSegment(element) {
+                    // 输入框的value、按钮的文本不是属性变化,这两类元素不缓存
+                    const cacheable = element.tagName !== 'INPUT' && element.tagName !== 'BUTTON';
+                    if (cacheable) {
+                        const cached = segmentCache.get(element);
+                        if (cached !== undefined) return cached;
                     }
                     
                     let elementSelector = '';
                     const tagName = element.tagName.toLowerCase();
                     
-                    // 优先使用ID
                     if (element.id) {
-                        return [`#${element.id}`];
+                        elementSelector = `#${element.id}`;
+                        if (cacheable) segmentCache.set(element, elementSelector);
+                        return elementSelector;
                     }
                     
-                    // 优先使用稳定属性 - 扩展更多自动化测试常用属性
-                    const stableAttrs = [
-                        'data-testid', 'data-cy', 'data-test', 'data-qa', 
-                        'data-automation', 'data-selector', 'data-key', 
-                        'data-id', 'data-name', 'data-component', 
-                        'data-module', 'data-section', 'data-field',
-                        'data-action', 'data-target', 'data-type',
-                        'name', 'title', 'role', 'aria-label', 
-                        'aria-labelledby', 'aria-describedby', 'aria-controls'
-                    ];
+                    // 优先使用稳定属性
                     let hasStableAttr = false;
-                        for (const attr of stableAttrs) {
-                            const value = element.getAttribute(attr);
-                            if (value && value.length > 0) {
-                                // 支持包含空格的值,使用转义双引号
-                                const safeValue = value.replace(/"/g, '&quot;');
-                                elementSelector = `${tagName}[${attr}="${safeValue}"]`;
-                                hasStableAttr = true;
-                                break;
-                            }
+                    for (const attr of STABLE_ATTRS) {
+                        const value = element.getAttribute(attr);
+                        if (value && value.length > 0) {
+                            // 支持包含空格的值,使用转义双引号
+                            const safeValue = value.replace(/"/g, '&quot;');
+                            elementSelector = `${tagName}[${attr}="${safeValue}"]`;
+                            hasStableAttr = true;
+                            break;
                         }
+                    }
                     
                     if (!hasStableAttr) {
                         elementSelector = tagName;
                         // 处理类名,过滤掉动态类名
-                        if (element.className) {
-                            const allClasses = element.className.split(' ').filter(c => c.length > 2); // 过滤掉太短的类名
-                            const dynamicClassPatterns = [
-                                /^is-\w+$/, /^has-\w+$/, /^\w+-\w+-(leave|enter|active|done)$/, 
-                                /^el-\w+(-\w+)*$/, /^ant-\w+(-\w+)*$/, /^t-[a-zA-Z0-9]{8}$/, 
-                                /^weui-\w+(-\w+)*$/, /^layui-\w+(-\w+)*$/, /^v-\w+$/, 
-                                /^ng-\w+$/, /^vue-\w+$/, /^react-\w+$/, /^svelte-\w+$/, 
-                                /^css-\w+$/, /^scss-\w+$/, /^style-\w+$/, /^component-\w+$/, 
-                                /^theme-\w+$/, /^mode-\w+$/, /^state-\w+$/, /^variant-\w+$/, 
-                                /^hover-\w+$/, /^focus-\w+$/, /^active-\w+$/, /^disabled-\w+$/, 
-                                /^selected-\w+$/, /^checked-\w+$/, /^expanded-\w+$/, /^collapsed-\w+$/, /^open-\w+$/, /^closed-\w+$/, 
-                                /^loading-\w+$/, /^error-\w+$/, /^success-\w+$/, /^warning-\w+$/, /^info-\w+$/, 
-                                /^\d+-\w+$/, /^\w+-\d+$/, /^[a-f0-9]{6,}$/, /^\w+-[a-f0-9]{6,16}$/, 
-                                /^\w+-[0-9a-z]{8,}$/, /^[a-z]{3,6}-[0-9a-z]{5,10}$/, 
-                                /^v?\d+\.\d+\.\d+$/, /^[0-9]+$/, 
-                                /^flex$/, /^grid$/, /^block$/, /^inline$/, /^hidden$/, /^visible$/, 
-                                /^absolute$/, /^relative$/, /^fixed$/, /^sticky$/, 
-                                /^left-\d+$/, /^right-\d+$/, /^top-\d+$/, /^bottom-\d+$/, 
-                                /^w-\d+$/, /^h-\d+$/, /^max-w-\d+$/, /^max-h-\d+$/, 
-                                /^p-\d+$/, /^m-\d+$/, /^mt-\d+$/, /^mr-\d+$/, /^mb-\d+$/, /^ml-\d+$/, 
-                                /^pt-\d+$/, /^pr-\d+$/, /^pb-\d+$/, /^pl-\d+$/, 
-                                /^text-\w+$/, /^bg-\w+$/, /^border-\w+$/, /^rounded-\w+$/, 
-                                /^lang-\w+$/, /^i18n-\w+$/, /^ltr$/, /^rtl$/, 
-                                /^mobile-\w+$/, /^tablet-\w+$/, /^desktop-\w+$/, /^xl-\w+$/, /^sm-\w+$/, /^md-\w+$/, /^lg-\w+$/
-                            ];
-                            
-                            const stableClasses = allClasses.filter(c => {
-                                    // 过滤掉动态类名
-                                    const isDynamic = dynamicClassPatterns.some(p => p.test(c));
-                                    // 过滤掉只有数字或特殊字符的类名
-                                    const isInvalid = /^[0-9_\-\.\s]+$/.test(c);
-                                    // 过滤掉太短的类名(可能是动态生成的)
-                                    const isTooShort = c.length < 3;
-                                    return !isDynamic && !isInvalid && !isTooShort;
-                                });
-                            if (stableClasses.length) {
-                                elementSelector += '.' + stableClasses.slice(0, 3).join('.');
-                            }
+                        const className = element.getAttribute('class');
+                        if (className) {
+                            elementSelector += stableClassSuffix(className);
                         }
                     }
                     
                     // 元素类型特定属性处理,增强对动态表单元素的支持
-                        if (tagName === 'input') {
-                            // 对于表单输入元素,添加更多识别属性
-                            const type = element.type;
-                            elementSelector += `[type="${type}"]`;
-                            
-                            // 优化表单元素识别顺序,优先使用更多稳定属性
-                            if (element.name && element.name.length > 0) {
-                                elementSelector += `[name="${element.name}"]`;
-                            } else if (element.placeholder && element.placeholder.length > 0) {
-                                elementSelector += `[placeholder="${element.placeholder}"]`;
-                            } else if (element.value && element.value.length > 0 && !element.value.match(/^[0-9]+$/)) {
-                                // 仅对非数字的静态值使用value属性
-                                elementSelector += `[value="${element.value}"]`;
-                            } else if (element.getAttribute('aria-label')) {
-                                elementSelector += `[aria-label="${element.getAttribute('aria-label')}"]`;
-                            }
-                        } else if (tagName === 'textarea' || tagName === 'select') {
-                            // 对于其他表单元素,增强识别能力
-                            if (element.name && element.name.length > 0) {
-                                elementSelector += `[name="${element.name}"]`;
-                            } else if (element.placeholder && element.placeholder.length > 0) {
-                                elementSelector += `[placeholder="${element.placeholder}"]`;
-                            } else if (element.title && element.title.length > 0) {
-                                elementSelector += `[title="${element.title}"]`;
-                            } else if (element.getAttribute('aria-label')) {
-                                elementSelector += `[aria-label="${element.getAttribute('aria-label')}"]`;
-                            }
-                        } else if (tagName === 'button') {
-                            // 增强按钮元素的识别,优化动态按钮处理
-                            if (element.textContent && element.textContent.trim().length > 0) {
-                                const text = element.textContent.trim().substring(0, 25).replace(/"/g, '&quot;');
-                                elementSelector += `:contains("${text}")`;
-                            } else if (element.getAttribute('aria-label')) {
-                                elementSelector += `[aria-label="${element.getAttribute('aria-label')}"]`;
-                            } else if (element.type) {
-                                elementSelector += `[type="${element.type}"]`;
-                            }
-                        } else if (tagName === 'img') {
-                            // 对于图片,使用更精确的定位
-                            if (element.alt && element.alt.length > 0) {
-                                elementSelector += `[alt="${element.alt}"]`;
-                            } else if (element.src && element.src.length > 0) {
+                    if (tagName === 'input') {
+                        // 对于表单输入元素,添加更多识别属性
+                        elementSelector += `[type="${element.type}"]`;
+                        
+                        // 优化表单元素识别顺序,优先使用更多稳定属性
+                        if (element.name && element.name.length > 0) {
+                            elementSelector += `[name="${element.name}"]`;
+                        } else if (element.placeholder && element.placeholder.length > 0) {
+                            elementSelector += `[placeholder="${element.placeholder}"]`;
+                        } else if (element.value && element.value.length > 0 && !element.value.match(/^[0-9]+$/)) {
+                            // 仅对非数字的静态值使用value属性
+                            elementSelector += `[value="${element.value}"]`;
+                        } else if (element.getAttribute('aria-label')) {
+                            elementSelector += `[aria-label="${element.getAttribute('aria-label')}"]`;
+                        }
+                    } else if (tagName === 'textarea' || tagName === 'select') {
+                        // 对于其他表单元素,增强识别能力
+                        if (element.name && element.name.length > 0) {
+                            elementSelector += `[name="${element.name}"]`;
+                        } else if (element.placeholder && element.placeholder.length > 0) {
+                            elementSelector += `[placeholder="${element.placeholder}"]`;
+                        } else if (element.title && element.title.length > 0) {
+                            elementSelector += `[title="${element.title}"]`;
+                        } else if (element.getAttribute('aria-label')) {
+                            elementSelector += `[aria-label="${element.getAttribute('aria-label')}"]`;
+                        }
+                    } else if (tagName === 'button') {
+                        // 增强按钮元素的识别,优化动态按钮处理
+                        if (element.textContent && element.textContent.trim().length > 0) {
+                            const text = element.textContent.trim().substring(0, 25).replace(/"/g, '&quot;');
+                            elementSelector += `:contains("${text}")`;
+                        } else if (element.getAttribute('aria-label')) {
+                            elementSelector += `[aria-label="${element.getAttribute('aria-label')}"]`;
+                        } else if (element.type) {
+                            elementSelector += `[type="${element.type}"]`;
+                        }
+                    } else if (tagName === 'img') {
+                        // 对于图片,使用更精确的定位
+                        if (element.alt && element.alt.length > 0) {
+                            elementSelector += `[alt="${element.alt}"]`;
+                        } else if (element.src && element.src.length > 0) {
                             // 对于图片,使用部分src路径
                             const srcParts = element.src.split('/');
                             const filename = srcParts[srcParts.length - 1];
@@ -259,98 +559,142 @@ class PlaywrightAutomation:
                     } else if (tagName === 'a') {
                         // 对于链接,使用href属性
                         if (element.href && element.href.length > 0) {
-                            const url = element.href;
                             // 只使用相对路径或域名后的路径
-                            const path = url.replace(/^https?:\/\//, '').split('/').slice(1).join('/');
+                            const path = element.href.replace(/^https?:\/\//, '').split('/').slice(1).join('/');
                             if (path.length > 0) {
                                 elementSelector += `[href*="${path}"]`;
                             }
                         }
-                    } else if (tagName === 'button') {
-                        // 对于按钮,添加更多识别属性
-                        if (element.textContent && element.textContent.trim().length > 0) {
-                            // 只在没有其他更好的属性时使用文本内容
-                            const text = element.textContent.trim();
-                            if (text.length < 20 && !elementSelector.includes(':has-text(')) {
-                                elementSelector += `:has-text("${text}")`;
-                            }
-                        } else if (element.title && element.title.length > 0 && !elementSelector.includes('[title=')) {
-                            elementSelector += `[title="${element.title}"]`;
-                        }
                     }
                     
                     // 添加更多稳定属性作为补充
-                    const additionalAttrs = ['data-name', 'role', 'aria-label', 'aria-labelledby'];
-                    for (const attr of additionalAttrs) {
+                    for (const attr of ADDITIONAL_ATTRS) {
                         const value = element.getAttribute(attr);
                         if (value && value.length > 0 && !value.includes(' ') && !elementSelector.includes(`[${attr}=`)) {
                             elementSelector += `[${attr}="${value}"]`;
                         }
                     }
                     
-                    // 添加更多稳定属性
                     if (element.title && element.title.length > 0 && !elementSelector.includes('[title=')) {
                         elementSelector += `[title="${element.title}"]`;
                     }
                     
-                    const parentPath = generateFullPath(element.parentElement, maxDepth, currentDepth + 1);
-                    return [...parentPath, elementSelector];
+                    if (cacheable) segmentCache.set(element, elementSelector);
+                    return elementSelector;
                 }
                 
-                // 生成完整的CSS选择器
-                function generateSelector(element) {
+                // 生成元素的完整路径:从元素向上最多MAX_PATH_DEPTH层,遇到有ID的祖先为止
+                function generateFullPath(element) {
+                    observeDom();
+                    const path = [];
+                    let current = element;
+                    while (current && current.tagName !== 'HTML' && path.length < MAX_PATH_DEPTH) {
+                        const segment = elementSegment(current);
+                        path.push(segment);
+                        if (segment[0] === '#') break;
+                        current = current.parentElement;
+                    }
+                    return path.reverse();
+                }
+                
+                // 路径选择器(不含唯一性校验),事件处理函数中只做这一步
+                function selectorPath(element) {
                     if (!element) return '';
-                    
-                    // 生成完整路径
-                    let path = generateFullPath(element);
-                    
+                    const path = generateFullPath(element);
                     // 如果路径为空,直接返回标签名
-                    if (path.length === 0) {
-                        return element.tagName.toLowerCase();
+                    return path.length ? path.join(' > ') : element.tagName.toLowerCase();
+                }
+                
+                // 路径以唯一的ID开头时,匹配的元素一定在该元素之下,只查询它的子树
+                function countMatches(selector) {
+                    const separator = selector.indexOf(' > ');
+                    if (selector[0] === '#' && separator > 0) {
+                        const anchors = document.querySelectorAll(selector.slice(0, separator));
+                        if (anchors.length === 1) {
+                            return anchors[0].querySelectorAll(':scope' + selector.slice(separator)).length;
+                        }
+                    }
+                    return document.querySelectorAll(selector).length;
+                }
+                
+                // 元素在同类型兄弟元素中的位置(从1开始)和同类型兄弟元素的数量,以及计算时的DOM版本
+                function siblingPosition(element) {
+                    let index = 0;
+                    let count = 0;
+                    const parent = element.parentElement;
+                    if (parent) {
+                        for (const child of parent.children) {
+                            if (child.tagName === element.tagName) {
+                                count++;
+                                if (child === element) index = count;
+                            }
+                        }
+                    }
+                    return { index: index, count: count, generation: domGeneration };
+                }
+                
+                // 检查选择器的唯一性,不唯一时给元素自身的片段加nth-of-type作为兜底;
+                // position为事件发生时的siblingPosition,省略时按当前DOM计算。
+                // 结果按元素缓存,DOM没有变化时不再查询
+                function ensureUnique(selector, element, position) {
+                    position = position || siblingPosition(element);
+                    // DOM在事件发生后有变化时,缓存的结果和当前的查询都不完全代表事件发生时的状态
+                    const current = position.generation === domGeneration;
+                    const cached = selectorCache.get(element);
+                    if (current && cached && cached.generation === domGeneration && cached.path === selector) {
+                        return cached.selector;
                     }
                     
-                    // 将路径数组转换为完整的CSS选择器
-                    let fullSelector = path.join(' > ');
-                    
-                    // 检查选择器的唯一性
-                    try {
-                        const matches = document.querySelectorAll(fullSelector);
-                        if (matches.length > 1) {
-                            // 如果选择器不唯一,添加nth-of-type作为兜底
-                            let uniquePath = [...path];
-                            let index = 1;
-                            let parent = element.parentElement;
-                            
-                            // 查找当前元素在父元素中的位置
-                            if (parent) {
-                                const siblings = Array.from(parent.children).filter(child => child.tagName === element.tagName);
-                                index = siblings.indexOf(element) + 1;
-                                
-                                // 如果有多个同类型的兄弟元素,添加nth-of-type
-                                if (siblings.length > 1) {
-                                    const lastSelector = uniquePath.pop();
-                                    const tagName = element.tagName.toLowerCase();
-                                    // 确保我们只给基础标签添加nth-of-type
-                                    if (lastSelector.startsWith(tagName + '[') || lastSelector === tagName) {
-                                        uniquePath.push(`${lastSelector}:nth-of-type(${index})`);
-                                    } else {
-                                        uniquePath.push(lastSelector);
-                                    }
-                                    fullSelector = uniquePath.join(' > ');
+                    let uniqueSelector = selector;
+                    // 没有同类型兄弟元素时nth-of-type无法区分,不需要查询整个文档
+                    if (position.count > 1 && !NON_STANDARD_PSEUDO_PATTERN.test(selector)) {
+                        const separator = selector.lastIndexOf(' > ');
+                        const lastSelector = separator >= 0 ? selector.slice(separator + 3) : selector;
+                        const tagName = element.tagName.toLowerCase();
+                        // 确保我们只给基础标签添加nth-of-type
+                        if (lastSelector.startsWith(tagName + '[') || lastSelector === tagName) {
+                            // 元素已从文档移除(如点击后关闭的下拉选项)时无法再校验,按事件发生时的位置兜底
+                            let ambiguous = true;
+                            if (element.isConnected) {
+                                try {
+                                    ambiguous = countMatches(selector) > 1;
+                                } catch (e) {
+                                    // 如果查询失败,使用原始选择器
+                                    console.error('选择器验证失败:', e);
+                                    ambiguous = false;
                                 }
                             }
+                            if (ambiguous) {
+                                uniqueSelector = `${selector}:nth-of-type(${position.index})`;
+                            }
                         }
-                    } catch (e) {
-                        // 如果查询失败,使用原始选择器
-                        console.error('选择器验证失败:', e);
                     }
                     
-                    return fullSelector;
+                    if (current) {
+                        selectorCache.set(element, { generation: domGeneration, path: selector, selector: uniqueSelector });
+                    }
+                    return uniqueSelector;
+                }
+                
+                // 生成完整的CSS选择器
+                function generateSelector(element) {
+                    if (!element) return '';
+                    return ensureUnique(selectorPath(element), element);
+                }
+                // 元素选择脚本和get_selected_element也使用它;新版Playwright会把初始化脚本包在函数里,需要显式挂到window上
+                window.generateSelector = generateSelector;
+                
+                // 选择器相关的变量都已定义,再查询模式(__uatSetModes会用到它们)
+                if (typeof window.__uatGetModes === 'function') {
+                    window.__uatGetModes().then(window.__uatSetModes, () => window.__uatSetModes({}));
+                } else {
+                    window.__uatSetModes({});
                 }
                 
                 // 点击事件监听 - 使用冒泡阶段避免重复事件
                 if (document && document.addEventListener) {
                     document.addEventListener('click', function(e) {
+                        if (!isRecording()) return;
                         const target = e.target;
                         let actualTarget = target;
                         
@@ -419,7 +763,7 @@ class PlaywrightAutomation:
                             }
                         }
                         
-                        const selector = generateSelector(actualTarget);
+                        const selector = selectorPath(actualTarget);
                         
                         // 记录详细的元素信息
                         const elementInfo = {
@@ -438,12 +782,12 @@ class PlaywrightAutomation:
                         });
                         
                         if (window && window.automationEvents) {
-                            window.automationEvents.push({
+                            recordEvent({
                                 action: 'click',
                                 selector: selector,
                                 timestamp: Date.now(),
                                 elementInfo: elementInfo
-                            });
+                            }, actualTarget);
                             
                             // 检查是否点击了提交按钮,如果是则记录submit事件
                             const isSubmitButton = actualTarget.tagName === 'BUTTON' || 
@@ -460,7 +804,7 @@ class PlaywrightAutomation:
                                     const formSelector = generateSelector(form);
                                     // 记录submit事件,选择器是提交按钮的选择器,而不是表单的选择器
                                     // 这样在回放时可以直接点击提交按钮来触发表单提交
-                                    window.automationEvents.push({
+                                    recordEvent({
                                         action: 'submit',
                                         selector: selector,
                                         timestamp: Date.now(),
@@ -472,7 +816,7 @@ class PlaywrightAutomation:
                                             formSelector: formSelector,
                                             formAction: form.action || ''
                                         }
-                                    });
+                                    }, actualTarget);
                                 }
                             }
                         }
@@ -482,6 +826,7 @@ class PlaywrightAutomation:
                 // 输入事件监听 - 带防抖以避免过于频繁的事件
                 if (document && document.addEventListener && window && window.automationConfig) {
                     document.addEventListener('input', function(e) {
+                        if (!isRecording()) return;
                         const target = e.target;
                         
                         // 精确检查元素类型,只处理真正可输入的文本元素
@@ -503,40 +848,31 @@ class PlaywrightAutomation:
                             return; // 忽略非文本输入事件
                         }
                         
-                        // 只处理文本输入类型
-                        const selector = generateSelector(target);
-                        const elementId = selector + '_' + target.tagName; // 创建唯一ID用于防抖
-                        
-                        // 清除之前的防抖定时器
-                        if (window.automationConfig.inputDebounce[elementId]) {
-                            clearTimeout(window.automationConfig.inputDebounce[elementId]);
+                        // 只处理文本输入类型;短时间内的连续输入在页面中合并(见recordFill),
+                        // 跨过防抖间隔的连续输入再由Python端合并
+                        const selector = selectorPath(target);
+                        if (window && window.automationEvents) {
+                            recordFill({
+                                action: 'fill',
+                                selector: selector,
+                                text: target.value,
+                                timestamp: Date.now(),
+                                elementInfo: {
+                                    tagName: target.tagName,
+                                    id: target.id || '',
+                                    className: target.className || '',
+                                    name: target.name || '',
+                                    type: target.type || ''
+                                }
+                            }, target);
                         }
-                        
-                        // 设置新的防抖定时器
-                        window.automationConfig.inputDebounce[elementId] = setTimeout(() => {
-                            if (window && window.automationEvents) {
-                                window.automationEvents.push({
-                                    action: 'fill',
-                                    selector: selector,
-                                    text: target.value,
-                                    timestamp: Date.now(),
-                                    elementInfo: {
-                                        tagName: target.tagName,
-                                        id: target.id || '',
-                                        className: target.className || '',
-                                        name: target.name || '',
-                                        type: target.type || ''
-                                    }
-                                });
-                            }
-                            delete window.automationConfig.inputDebounce[elementId];
-                        }, window.automationConfig.debounceDelay);
                     }, true);
                 }
                 
                 // 表单提交事件
                 if (document && document.addEventListener) {
                     document.addEventListener('submit', function(e) {
+                        if (!isRecording()) return;
                         const target = e.target;
                         if (target.tagName === 'FORM') {
                             // 不要阻止默认的表单提交行为,让表单能够正常提交
@@ -556,10 +892,11 @@ class PlaywrightAutomation:
                             }
                             
                             // 如果找到提交按钮,使用提交按钮的选择器;否则使用表单的选择器
-                            const selector = submitButton ? generateSelector(submitButton) : generateSelector(target);
+                            const submitTarget = submitButton || target;
+                            const selector = selectorPath(submitTarget);
                             
                             if (window && window.automationEvents) {
-                                window.automationEvents.push({
+                                recordEvent({
                                     action: 'submit',
                                     selector: selector,
                                     timestamp: Date.now(),
@@ -569,7 +906,7 @@ class PlaywrightAutomation:
                                         className: submitButton ? (submitButton.className || '') : (target.className || ''),
                                         action: target.action || ''
                                     }
-                                });
+                                }, submitTarget);
                             }
                         }
                     }, true);
@@ -581,7 +918,7 @@ class PlaywrightAutomation:
                 
                 history.pushState = function() {
                     const result = originalPushState.apply(history, arguments);
-                    window.automationEvents.push({
+                    recordEvent({
                         action: 'navigate',
                         url: location.href,
                         timestamp: Date.now(),
@@ -592,7 +929,7 @@ class PlaywrightAutomation:
                 
                 history.replaceState = function() {
                     const result = originalReplaceState.apply(history, arguments);
-                    window.automationEvents.push({
+                    recordEvent({
                         action: 'navigate',
                         url: location.href,
                         timestamp: Date.now(),
@@ -605,7 +942,7 @@ class PlaywrightAutomation:
                 if (window && window.addEventListener) {
                     window.addEventListener('hashchange', function(e) {
                         if (window && window.automationEvents) {
-                            window.automationEvents.push({
+                            recordEvent({
                                 action: 'navigate',
                                 url: location.href,
                                 timestamp: Date.now(),
@@ -621,7 +958,7 @@ class PlaywrightAutomation:
                 if (window && window.addEventListener) {
                     window.addEventListener('popstate', function(e) {
                         if (window && window.automationEvents) {
-                            window.automationEvents.push({
+                            recordEvent({
                                 action: 'navigate',
                                 url: location.href,
                                 timestamp: Date.now(),
@@ -635,6 +972,7 @@ class PlaywrightAutomation:
                 // 改进的滚动事件监听
                 if (window && window.addEventListener && window.automationConfig) {
                     window.addEventListener('scroll', function() {
+                        if (!isRecording()) return;
                         // 清除之前的定时器
                         if (window.automationConfig.scrollTimeout) {
                             clearTimeout(window.automationConfig.scrollTimeout);
@@ -652,7 +990,7 @@ class PlaywrightAutomation:
                                 
                                 // 只有当滚动距离超过阈值时才记录
                                 if (deltaX >= window.automationConfig.scrollThreshold || deltaY >= window.automationConfig.scrollThreshold) {
-                                    window.automationEvents.push({
+                                    recordEvent({
                                         action: 'scroll',
                                         scrollPosition: {
                                             x: scrollLeft,
@@ -682,13 +1020,14 @@ class PlaywrightAutomation:
                 // 监听键盘事件(可选,用于特殊交互)
                 if (document && document.addEventListener) {
                     document.addEventListener('keydown', function(e) {
+                        if (!isRecording()) return;
                         // 只记录特殊按键,如回车、ESC等
                         if (e.key === 'Enter' || e.key === 'Escape' || e.key === 'Tab') {
                             const target = e.target;
-                            const selector = generateSelector(target);
+                            const selector = selectorPath(target);
                             
                             if (window && window.automationEvents) {
-                                window.automationEvents.push({
+                                recordEvent({
                                     action: 'keypress',
                                     selector: selector,
                                     key: e.key,
@@ -698,7 +1037,7 @@ class PlaywrightAutomation:
                                         id: target.id || '',
                                         className: target.className || ''
                                     }
-                                });
+                                }, target);
                             }
                         }
                     }, true);
@@ -707,6 +1046,7 @@ class PlaywrightAutomation:
                 // 监听悬停事件(可选)
                 if (document && document.addEventListener) {
                     document.addEventListener('mouseover', function(e) {
+                        if (!isRecording()) return;
                         const target = e.target;
                         
                         // 只对可交互元素记录悬停
@@ -717,9 +1057,9 @@ class PlaywrightAutomation:
                                             target.getAttribute('role') === 'link';
                         
                         if (isInteractive) {
-                            const selector = generateSelector(target);
+                            const selector = selectorPath(target);
                             if (window && window.automationEvents) {
-                                window.automationEvents.push({
+                                recordEvent({
                                     action: 'hover',
                                     selector: selector,
                                     timestamp: Date.now(),
@@ -728,7 +1068,7 @@ class PlaywrightAutomation:
                                         id: target.id || '',
                                         className: target.className || ''
                                     }
-                                });
+                                }, target);
                             }
                         }
                     }, true);
@@ -741,38 +1081,56 @@ class PlaywrightAutomation:
             }
             """;
             
-            # 1. 添加初始化脚本,确保新页面加载时自动设置监听器
-            await self.page.add_init_script(event_listeners_js);
-            
-            # 2. 直接在当前页面执行,确保已加载页面也能捕获事件
-            await self.page.evaluate(event_listeners_js);
+            # 录制脚本在前:它定义的generateSelector和__uatSetModes供元素选择脚本使用
+            await self.context.add_init_script(event_listeners_js)
+            await self.context.add_init_script(ELEMENT_PICKER_JS)
+            self._scripts_context = self.context
             
             uat_logger.info("事件监听器已成功设置")
-        else:
-            uat_logger.warning("页面对象为None,无法设置事件监听器")
 
-    async def _on_page_navigated(self, frame):
-        """页面导航事件处理函数"""
-        # 在页面导航后重新设置事件监听器,确保在新页面上也能记录用户操作
-        try:
-            # 多层检查确保页面对象有效且可用
-            if (self.page is not None and 
-                not (hasattr(self.page, 'is_closed') and self.page.is_closed()) and 
-                not (hasattr(self.page, 'closed') and self.page.closed)):
-                
-                try:
-                    # 调用统一的事件监听器设置方法
-                    # _setup_event_listeners 方法内部会检查 window.eventListenersAdded 标志
-                    # 避免重复添加事件监听器
-                    await self._setup_event_listeners()
-                    uat_logger.info("页面导航完成,已重新设置事件监听器")
-                except Exception as inner_e:
-                    # 捕获页面操作相关的异常
-                    uat_logger.error(f"页面操作失败,可能页面已关闭: {str(inner_e)}")
-            else:
-                uat_logger.warning("页面对象无效或已关闭,无法设置事件监听器")
-        except Exception as e:
-            uat_logger.error(f"重新设置页面事件监听器时出错: {str(e)}")
+    async def _get_page_modes(self, source):
+        """新文档查询录制/选择模式的绑定回调"""
+        return dict(self.page_modes)
+
+    async def _set_page_modes(self, **modes):
+        """切换录制/选择模式:更新之后加载的文档查询到的模式,并通知当前页面的所有框架
+        
+        返回(停止录制时各框架中尚未发送的事件(按时间排序), {文档标识: 切换前通过绑定发出的最后一个事件序号})
+        """
+        self.page_modes.update(modes)
+        flushed = []
+        sent = {}
+        if self.page is None or self.page.is_closed():
+            return flushed, sent
+        for frame in self.page.frames:
+            try:
+                result = await frame.evaluate(
+                    "modes => window.__uatSetModes ? window.__uatSetModes(modes) : null", self.page_modes
+                )
+                if isinstance(result, dict):
+                    flushed.extend(result.get('events') or [])
+                    if result.get('doc') and result.get('seq'):
+                        sent[result['doc']] = result['seq']
+            except Exception as e:
+                # 框架可能正在跳转或已分离,新文档会自行查询模式
+                uat_logger.debug(f"切换框架模式失败: {str(e)}")
+        flushed.sort(key=lambda event: event.get('timestamp') or 0)
+        return flushed, sent
+    
+    async def _wait_for_recorded_events(self, sent, timeout=RECORDING_DRAIN_TIMEOUT):
+        """等待各文档通过绑定发出的事件(序号不超过sent中记录的)全部到达,超时后不再等待"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while any(self._received_seq.get(doc, 0) < seq for doc, seq in sent.items()):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                uat_logger.warning("停止录制时等待页面事件超时,部分事件可能未收到")
+                return
+            self._received_signal.clear()
+            try:
+                await asyncio.wait_for(self._received_signal.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
 
     async def get_recorded_events(self):
         """从浏览器获取记录的事件"""
@@ -792,8 +1150,6 @@ class PlaywrightAutomation:
                 has_events = await self.page.evaluate("typeof window.automationEvents !== 'undefined'")
                 if not has_events:
                     uat_logger.warning("window.automationEvents 未定义,可能是事件监听器未设置")
-                    # 尝试重新设置事件监听器
-                    await self._setup_event_listeners()
                     return []
                 
                 # 调试:检查事件数组中是否有内容
@@ -815,11 +1171,6 @@ class PlaywrightAutomation:
                 return []
         except Exception as e:
             uat_logger.error(f"获取浏览器事件时出错: {str(e)}")
-            # 尝试重新设置事件监听器
-            try:
-                await self._setup_event_listeners()
-            except:
-                pass
             return []
 
     async def sync_recorded_events(self):
@@ -984,16 +1335,8 @@ class PlaywrightAutomation:
                 "timestamp": int(time.time() * 1000)  # 转换为毫秒,与浏览器事件保持一致
             }
             
-            # 应用去重逻辑
-            if self.recorded_steps:
-                last_step = self.recorded_steps[-1]
-                if last_step['action'] == 'navigate' and last_step.get('url') == step.get('url'):
-                    # 计算时间差(毫秒)
-                    time_diff = step.get('timestamp', 0) - last_step.get('timestamp', 0)
-                    if time_diff < 2000:  # 使用与其他地方一致的2秒阈值
-                        return  # 跳过短时间内重复的导航步骤
-            
-            self.recorded_steps.append(step)
+            # 去重逻辑由录制压缩器统一处理
+            self._record_step(step)
             uat_logger.info(f"录制导航步骤: {url}")
         else:
             uat_logger.info(f"执行导航操作: {url}")
@@ -1188,7 +1531,7 @@ class PlaywrightAutomation:
                 "selector": selector,
                 "timestamp": int(time.time() * 1000)  # 转换为毫秒,与浏览器事件保持一致
             }
-            self.recorded_steps.append(step)
+            self._record_step(step)
     
     async def fill_input(self, selector: str, text: str, selector_type: str = "css", iframe_selector: str = None, iframe_context=None):
         """填充输入框"""
@@ -1350,7 +1693,7 @@ class PlaywrightAutomation:
                 "text": text,
                 "timestamp": int(time.time() * 1000)  # 转换为毫秒,与浏览器事件保持一致
             }
-            self.recorded_steps.append(step)
+            self._record_step(step)
     
     async def scroll_page(self, direction: str = "down", pixels: int = 500, iframe_selector: str = None, iframe_context=None):
         """滚动页面或iframe"""
@@ -1406,7 +1749,7 @@ class PlaywrightAutomation:
                 "iframe_selector": iframe_selector,
                 "timestamp": int(time.time() * 1000)  # 转换为毫秒,与浏览器事件保持一致
             }
-            self.recorded_steps.append(step)
+            self._record_step(step)
     
     async def get_page_text(self) -> str:
         """获取页面文本内容"""
@@ -2400,7 +2743,7 @@ class PlaywrightAutomation:
                 "iframe_selector": iframe_selector,
                 "timestamp": int(time.time() * 1000)  # 转换为毫秒,与浏览器事件保持一致
             }
-            self.recorded_steps.append(step)
+            self._record_step(step)
     
     async def double_click_element(self, selector: str, selector_type: str = "css", iframe_selector: str = None, iframe_context=None):
         """双击元素"""
@@ -2442,7 +2785,7 @@ class PlaywrightAutomation:
                 "iframe_selector": iframe_selector,
                 "timestamp": int(time.time() * 1000)  # 转换为毫秒,与浏览器事件保持一致
             }
-            self.recorded_steps.append(step)
+            self._record_step(step)
     
     async def right_click_element(self, selector: str, selector_type: str = "css", iframe_selector: str = None, iframe_context=None):
         """右键点击元素"""
@@ -2484,7 +2827,7 @@ class PlaywrightAutomation:
                 "iframe_selector": iframe_selector,
                 "timestamp": int(time.time() * 1000)  # 转换为毫秒,与浏览器事件保持一致
             }
-            self.recorded_steps.append(step)
+            self._record_step(step)
     
     async def get_element_screenshot(self, selector: str, path: str = None):
         """截取特定元素的截图"""
@@ -2808,6 +3151,7 @@ class PlaywrightAutomation:
         
         for step in deduplicated_steps:
             step_index += 1
+            uat_logger.set_step(step_index)
             action = step.get("action")
             uat_logger.info(f"🎯 [STEP_DEBUG] ========== 开始执行步骤 {step_index}/{len(deduplicated_steps)} ==========")
             uat_logger.info(f"🎯 [STEP_DEBUG] 步骤类型: {action}, 详情: {step}")
@@ -3344,6 +3688,8 @@ class PlaywrightAutomation:
         
         for case_index, case_id in enumerate(case_ids):
             case_number = case_index + 1
+            # 每个用例一个运行ID，该用例的日志和运行历史记录通过它关联
+            uat_logger.update_context(run_id=new_run_id(), case_id=case_id, step=None)
             uat_logger.info(f"🎯 [MULTI_CASE] ========== 开始执行第 {case_number}/{len(case_ids)} 个测试用例,ID: {case_id} ==========")
             
             try:
@@ -3402,6 +3748,14 @@ class PlaywrightAutomation:
                         exec_step["url"] = step["url"] or step["input_value"]
                     elif step["action"] == "keypress":
                         exec_step["key"] = step["input_value"]
+                    elif step["action"] == "scroll":
+                        # 录制的滚动步骤在input_value中保存滚动到的位置，如{"x": 0, "y": 800}
+                        try:
+                            scroll_position = json.loads(step["input_value"] or "")
+                        except ValueError:
+                            scroll_position = None
+                        if isinstance(scroll_position, dict):
+                            exec_step["scrollPosition"] = scroll_position
                     elif step["action"] == "wait":
                         try:
                             exec_step["time"] = int(step["input_value"])
@@ -3451,14 +3805,14 @@ class PlaywrightAutomation:
                 
                 # 记录测试用例执行结果到数据库
                 try:
-                    db.create_run_history(
+                    db.enqueue_run_history(
                         case_id,
                         case_status,
                         0,  # 暂时设置为0,后续可以计算实际执行时间
                         "" if case_status == "success" else str(case_results),
                         extracted_text
                     )
-                    uat_logger.info(f"📋 [MULTI_CASE] 测试结果已保存到数据库")
+                    uat_logger.info(f"📋 [MULTI_CASE] 测试结果已提交写入数据库")
                 except Exception as db_error:
                     uat_logger.error(f"❌ [MULTI_CASE] 保存测试结果到数据库失败: {db_error}")
                 
@@ -3499,21 +3853,55 @@ class PlaywrightAutomation:
         
         return all_results
     
-    async def start_recording(self):
-        """开始录制"""
+    async def start_recording(self, on_step=None):
+        """开始录制
+        
+        浏览器事件发生时即通过绑定传回,经压缩(去重、合并连续输入)后逐条交给on_step;
+        未指定on_step时保存在recorded_steps中,由stop_recording返回。
+        """
         self.recording = True
         self.recorded_steps = []
+        self._recorder = RecordingCompactor(on_step or self.recorded_steps.append)
+        # 序号按文档递增、跨录制保留,已收到的序号不清空
+        if self._received_signal is None:
+            self._received_signal = asyncio.Event()
+        self.sync_task = asyncio.create_task(self._release_idle_steps(self._recorder))
         
-        # 确保页面上有事件监听器来捕获用户操作
-        if self.page:
-            await self._setup_event_listeners()
-            uat_logger.info("录制已开始,事件监听器已设置")
+        # 事件监听器已随初始化脚本存在于每个页面中,这里只打开录制模式
+        await self._set_page_modes(recording=True)
+        uat_logger.info("录制已开始")
+    
+    async def _release_idle_steps(self, recorder):
+        """录制期间定期交出空闲的待定步骤,最后一个操作不必等到下一个事件或停止录制才保存"""
+        while self._recorder is recorder:
+            await asyncio.sleep(RECORDING_PENDING_FLUSH / 2)
+            try:
+                recorder.release_idle()
+            except Exception as e:
+                uat_logger.error(f"交出录制步骤时出错: {str(e)}")
+    
+    def _record_step(self, step):
+        """录制一个步骤(浏览器事件或接口执行的操作),经压缩器交给接收方"""
+        if self._recorder is not None:
+            self._recorder.add_step(step)
         else:
-            uat_logger.warning("页面对象为None,无法设置事件监听器")
-        
-        # 不启动后台任务,因为这会导致事件循环冲突
-        # 我们将在stop_recording时一次性获取所有事件
-        uat_logger.info("录制已开始,事件将在停止录制时获取")
+            self.recorded_steps.append(step)
+    
+    async def _on_recorded_event(self, source, event):
+        """页面上报录制事件的绑定回调,不在录制时忽略"""
+        if isinstance(event, dict) and event.get('doc') is not None:
+            # 记下各文档已收到的事件序号,停止录制时据此判断已发出的事件是否都已处理
+            doc = event['doc']
+            self._received_seq[doc] = max(self._received_seq.get(doc, 0), event.get('seq') or 0)
+            if self._received_signal is not None:
+                self._received_signal.set()
+        if not self.recording or self._recorder is None or not isinstance(event, dict):
+            return
+        try:
+            uat_logger.log_browser_event(event.get('action', 'unknown'), event)
+            self._recorder.add_event(event)
+        except Exception as e:
+            uat_logger.error(f"处理录制事件时出错: {str(e)}")
     
     def _get_and_process_events(self):
         """获取并处理浏览器中的事件"""
@@ -3603,97 +3991,38 @@ class PlaywrightAutomation:
                 await asyncio.sleep(1)
     
     async def stop_recording(self) -> List[Dict[str, Any]]:
-        """停止录制并返回录制的步骤"""
+        """停止录制,交出最后一个步骤并返回recorded_steps(指定了on_step时步骤已交给接收方,列表为空)"""
+        # 页面切换模式前会先处理完等待校验的事件:已经通过绑定发出的事件在切换完成前仍要接收,
+        # 切换时剩余的事件作为返回值交回
+        flushed, sent = await self._set_page_modes(recording=False)
+        # 等切换前通过绑定发出的事件都处理完,再处理返回的事件,保持事件顺序
+        await self._wait_for_recorded_events(sent)
         self.recording = False
+        recorder, self._recorder = self._recorder, None
+        if self.sync_task is not None:
+            self.sync_task.cancel()
+            self.sync_task = None
+        if recorder is None:
+            return self.recorded_steps
         
-        # 在关闭浏览器前,先获取浏览器中记录的所有事件
+        # 绑定不可用时事件暂存在页面中,停止录制时补上
+        events = []
         if self.page:
             try:
                 # 检查页面是否仍然可用
                 if not hasattr(self.page, 'is_closed') or not self.page.is_closed():
-                    # 直接获取浏览器中剩余的所有事件
                     events = await self.get_recorded_events()
-                    uat_logger.info(f"停止录制时获取到 {len(events)} 个浏览器事件")
-                    
-                    # 将浏览器中的事件转换为录制步骤格式
-                    for event in events:
-                        step = {
-                            "action": event.get('action'),
-                            "timestamp": event.get('timestamp')
-                        }
-                        
-                        if event.get('action') == 'click':
-                            step['selector'] = event.get('selector')
-                        elif event.get('action') == 'fill':
-                            step['selector'] = event.get('selector')
-                            step['text'] = event.get('text', '')
-                        elif event.get('action') == 'navigate':
-                            step['url'] = event.get('url')
-                        elif event.get('action') == 'scroll':
-                            step['scrollPosition'] = event.get('scrollPosition')
-                        elif event.get('action') == 'hover':
-                            step['selector'] = event.get('selector')
-                        elif event.get('action') == 'double_click':
-                            step['selector'] = event.get('selector')
-                        elif event.get('action') == 'right_click':
-                            step['selector'] = event.get('selector')
-                        elif event.get('action') == 'submit':
-                            step['selector'] = event.get('selector')
-                        
-                        # 记录事件
-                        uat_logger.log_browser_event(event.get('action', 'unknown'), event)
-                        
-                        # 应用去重逻辑
-                        if self.recorded_steps:
-                            last_step = self.recorded_steps[-1]
-                            
-                            # 特殊处理:click和submit事件都需要保留,不要跳过
-                            # 因为回放时需要先点击按钮,再提交表单
-                            
-                            # 重新获取上一步骤
-                            if self.recorded_steps:
-                                last_step = self.recorded_steps[-1]
-                            
-                            # 关键修复:过滤掉submit事件后的navigate事件
-                            # 因为submit操作本身就会导致页面导航,不需要额外的navigate步骤
-                            if step['action'] == 'navigate' and last_step['action'] == 'submit':
-                                time_diff = step.get('timestamp', 0) - last_step.get('timestamp', 0)
-                                if time_diff < 3000:  # 3秒内的navigate事件都认为是submit导致的
-                                    uat_logger.info(f"🚫 [NAV_FILTER] 过滤掉submit后的navigate事件,时间差: {time_diff}ms")
-                                    continue
-                            
-                            # 检查是否与上一步骤完全相同
-                            if last_step['action'] == step['action']:
-                                # 计算时间差(毫秒)
-                                time_diff = step.get('timestamp', 0) - last_step.get('timestamp', 0)
-                                
-                                # 对于导航步骤,检查URL是否相同且时间间隔小于2秒
-                                if step['action'] == 'navigate' and last_step.get('url') == step.get('url') and time_diff < 2000:
-                                    continue  # 跳过短时间内重复的导航步骤
-                                # 对于点击步骤,检查选择器是否相同且时间间隔小于1秒
-                                elif step['action'] == 'click' and last_step.get('selector') == step.get('selector') and time_diff < 1000:
-                                    continue  # 跳过短时间内重复的点击步骤
-                                # 对于悬停步骤,检查选择器是否相同且时间间隔小于1秒
-                                elif step['action'] == 'hover' and last_step.get('selector') == step.get('selector') and time_diff < 1000:
-                                    continue  # 跳过短时间内重复的悬停步骤
-                                # 对于填充步骤,检查选择器和文本是否相同且时间间隔小于2秒
-                                elif step['action'] == 'fill' and last_step.get('selector') == step.get('selector') and last_step.get('text') == step.get('text') and time_diff < 2000:
-                                    continue  # 跳过短时间内重复的填充步骤
-                                # 对于按键步骤,检查选择器和按键是否相同且时间间隔小于1秒
-                                elif step['action'] == 'keypress' and last_step.get('selector') == step.get('selector') and last_step.get('key') == step.get('key') and time_diff < 1000:
-                                    continue  # 跳过短时间内重复的按键步骤
-                                # 对于提交步骤,检查选择器是否相同且时间间隔小于1秒
-                                elif step['action'] == 'submit' and last_step.get('selector') == step.get('selector') and time_diff < 1000:
-                                    continue  # 跳过短时间内重复的提交步骤
-                                # 对于滚动步骤,检查滚动位置是否基本相同且时间间隔小于1秒
-                                elif step['action'] == 'scroll' and last_step.get('scrollPosition') == step.get('scrollPosition') and time_diff < 1000:
-                                    continue  # 跳过短时间内重复的滚动步骤
-                        
-                        # 添加到录制步骤中
-                        self.recorded_steps.append(step)
+                    if events:
+                        uat_logger.info(f"停止录制时获取到 {len(events)} 个暂存的浏览器事件")
             except Exception as e:
                 uat_logger.log_exception("stop_recording", e)
+        # 暂存的事件和切换时返回的事件都没有经过绑定,按发生时间合并
+        for event in sorted(events + flushed, key=lambda event: event.get('timestamp') or 0):
+            uat_logger.log_browser_event(event.get('action', 'unknown'), event)
+            recorder.add_event(event)
         
+        recorder.flush()
+        uat_logger.info(f"录制结束,收到 {recorder.received} 个事件,压缩后 {recorder.emitted} 个步骤")
         return self.recorded_steps
     
     def _get_recorded_events_sync(self):
@@ -3783,6 +4112,10 @@ class PlaywrightAutomation:
                 # 确保页面已加载
                 await self.page.wait_for_load_state('networkidle')
             
+            # 打开选择模式,之后跳转的页面加载时也会自动启用选择器;用户点击元素时通过绑定回调_on_element_selected
+            selection_channel.open()
+            await self._set_page_modes(selecting=True)
+            
             # 如果提供了URL,则导航到该URL
             if url:
                 await self.page.goto(url)
@@ -3796,18 +4129,13 @@ class PlaywrightAutomation:
 
     async def disable_element_selection(self):
         """禁用元素选择模式"""
+        selection_channel.close()
         if self.page is None:
+            self.page_modes['selecting'] = False
             return False
         
         try:
-            await self.page.evaluate("""
-                (() => {
-                    if (typeof disableElementSelection === 'function') {
-                        disableElementSelection();
-                    }
-                })
-            """)
-            
+            await self._set_page_modes(selecting=False)
             uat_logger.info("元素选择模式已禁用")
             return True
         except Exception as e:
@@ -3861,41 +4189,7 @@ class PlaywrightAutomation:
             """)
             
             if raw_element_info:
-                # 处理原始元素信息,转换为前端期望的格式
-                element = raw_element_info.get('elementInfo', {})
-                css_selector = raw_element_info.get('selector', '')
-                text_content = element.get('textContent', '').strip()
-                
-                # 选择最合适的定位方式
-                selector_type = 'css'
-                selector_value = css_selector
-                
-                # 如果有ID,优先使用ID选择器
-                element_id = element.get('id', '')
-                if element_id:
-                    selector_type = 'id'
-                    selector_value = element_id
-                # 如果有data-testid属性,优先使用testid
-                elif element.get('attributes', {}).get('data-testid'):
-                    selector_type = 'testid'
-                    selector_value = element.get('attributes', {}).get('data-testid')
-                # 如果是文本内容比较独特,使用文本选择器
-                elif text_content and len(text_content) > 5:
-                    selector_type = 'text'
-                    selector_value = text_content
-                
-                # 构造前端期望的返回格式
-                formatted_element_info = {
-                    'selector_type': selector_type,
-                    'selector_value': selector_value,
-                    'text_content': text_content,
-                    'page_name': page_name,
-                    'tag_name': element.get('tagName', '').lower(),
-                    'css_selector': css_selector,
-                    'id': element_id,
-                    'class_name': element.get('className', '')
-                }
-                
+                formatted_element_info = self._format_selected_element(raw_element_info, page_name)
                 uat_logger.info(f"获取到格式化的选中元素: {formatted_element_info}")
                 return formatted_element_info
             return None
@@ -3903,6 +4197,54 @@ class PlaywrightAutomation:
             uat_logger.error(f"获取选中元素信息时出错: {str(e)}")
             raise Exception(f"获取选中元素信息失败: {str(e)}")
 
+    async def _on_element_selected(self, source, raw_element_info):
+        """页面中的元素选择器点击元素后的绑定回调,格式化后推送给等待中的请求"""
+        try:
+            page = source.get('page')
+            page_name = await page.title() if page else ''
+            element_info = self._format_selected_element(raw_element_info or {}, page_name)
+            uat_logger.info(f"用户选择了元素: {element_info}")
+            selection_channel.publish(element_info)
+        except Exception as e:
+            uat_logger.error(f"处理选中元素时出错: {str(e)}")
+
+    @staticmethod
+    def _format_selected_element(raw_element_info, page_name):
+        """把页面返回的原始元素信息转换为前端期望的格式"""
+        element = raw_element_info.get('elementInfo', {})
+        css_selector = raw_element_info.get('selector', '')
+        text_content = element.get('textContent', '').strip()
+        
+        # 选择最合适的定位方式
+        selector_type = 'css'
+        selector_value = css_selector
+        
+        # 如果有ID,优先使用ID选择器
+        element_id = element.get('id', '')
+        if element_id:
+            selector_type = 'id'
+            selector_value = element_id
+        # 如果有data-testid属性,优先使用testid
+        elif element.get('attributes', {}).get('data-testid'):
+            selector_type = 'testid'
+            selector_value = element.get('attributes', {}).get('data-testid')
+        # 如果是文本内容比较独特,使用文本选择器
+        elif text_content and len(text_content) > 5:
+            selector_type = 'text'
+            selector_value = text_content
+        
+        # 构造前端期望的返回格式
+        return {
+            'selector_type': selector_type,
+            'selector_value': selector_value,
+            'text_content': text_content,
+            'page_name': page_name,
+            'tag_name': element.get('tagName', '').lower(),
+            'css_selector': css_selector,
+            'id': element_id,
+            'class_name': element.get('className', '')
+        }
+
     async def extract_json_from_selected_element(self):
         """从用户选定的区域提取JSON数据"""
         if self.page is None:
@@ -3970,6 +4312,7 @@ def reset_automation_instance():
 # 使用一个全局事件循环来避免重复创建
 import threading
 import queue
+import contextvars
 
 # 创建一个专门的线程池来处理Playwright操作
 class PlaywrightWorker:
@@ -3979,6 +4322,7 @@ class PlaywrightWorker:
         self.worker_thread = None
         self.loop = None
         self.running = False
+        self._wakeup = None
         self._start_worker()
     
     def _start_worker(self):
@@ -3996,18 +4340,24 @@ class PlaywrightWorker:
         
         while self.running:
             try:
-                # 获取任务,超时1秒
-                task = self.task_queue.get(timeout=1)
-                task_id, func, args, kwargs = task
+                # 空闲时事件循环继续运行,页面通过expose_binding发起的回调才能及时处理;
+                # 有新任务时execute唤醒等待,否则最多等待1秒
+                self._wakeup = self.loop.create_future()
+                try:
+                    task = self.task_queue.get_nowait()
+                except queue.Empty:
+                    self.loop.run_until_complete(asyncio.wait([self._wakeup], timeout=1))
+                    continue
+                task_id, func, args, kwargs, context = task
                 
                 try:
-                    # 检查是否是协程函数
+                    # 在调用方的上下文中执行，日志带上调用方的运行ID和步骤
                     if asyncio.iscoroutinefunction(func):
                         # 在事件循环中执行异步函数
-                        result = self.loop.run_until_complete(func(*args, **kwargs))
+                        result = context.run(self.loop.run_until_complete, func(*args, **kwargs))
                     else:
                         # 执行同步函数
-                        result = func(*args, **kwargs)
+                        result = context.run(func, *args, **kwargs)
                     
                     self.result_queue.put((task_id, "success", result))
                 except Exception as e:
@@ -4017,8 +4367,6 @@ class PlaywrightWorker:
                     self.result_queue.put((task_id, "error", {"message": str(e), "traceback": exc_info}))
                 
                 self.task_queue.task_done()
-            except queue.Empty:
-                continue
             except Exception as e:
                 import traceback
                 exc_info = traceback.format_exc()
@@ -4031,7 +4379,8 @@ class PlaywrightWorker:
             self._start_worker()
         
         task_id = str(time.time()) + str(id(func))
-        self.task_queue.put((task_id, func, args, kwargs))
+        self.task_queue.put((task_id, func, args, kwargs, contextvars.copy_context()))
+        self._wake()
         
         # 等待结果
         while True:
@@ -4050,6 +4399,18 @@ class PlaywrightWorker:
             except queue.Empty:
                 raise Exception("执行超时")
     
+    def _wake(self):
+        """唤醒空闲中的工作线程(回调在事件循环中执行,取到的是当时正在等待的future)"""
+        def set_wakeup():
+            if self._wakeup is not None and not self._wakeup.done():
+                self._wakeup.set_result(None)
+        
+        if self.loop is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(set_wakeup)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+    
     def stop(self):
         """停止工作线程"""
         self.running = False
@@ -4202,9 +4563,9 @@ def sync_wait_for_element_visible(selector: str, timeout: int = 30000, selector_
         return await automation.wait_for_element_visible(selector, timeout, selector_type)
     return worker.execute(run)
 
-def sync_start_recording():
+def sync_start_recording(on_step=None):
     async def run():
-        return await automation.start_recording()
+        return await automation.start_recording(on_step)
     return worker.execute(run)
 
 def sync_stop_recording():
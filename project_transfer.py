@@ -0,0 +1,116 @@
+import gzip
+import io
+import json
+import zlib
+from typing import Any, BinaryIO, Dict, Iterable, Iterator
+
+# 导出文件格式标识和版本，导入时校验
+EXPORT_FORMAT = 'uat-project'
+EXPORT_VERSION = 1
+# 导出时每次查询的行数，导入时每个事务写入的记录数
+EXPORT_CHUNK_SIZE = 500
+IMPORT_CHUNK_SIZE = 500
+# 导出时攒够该字节数再输出一次，避免每行一次写入
+OUTPUT_BUFFER_BYTES = 64 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def dump_records(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """把记录编码为NDJSON行，按OUTPUT_BUFFER_BYTES攒批输出"""
+    buffer = bytearray()
+    for record in records:
+        buffer += json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        buffer += b'\n'
+        if len(buffer) >= OUTPUT_BUFFER_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """流式gzip压缩，只产出压缩器已输出的数据"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _PrefixedStream(io.RawIOBase):
+    """把已读出的开头字节放回流前面（用于探测gzip魔数）"""
+
+    def __init__(self, prefix: bytes, stream: BinaryIO):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_records(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """逐行读取NDJSON记录（自动识别gzip压缩），格式错误时抛出ValueError"""
+    prefix = stream.read(2)
+    raw = io.BufferedReader(_PrefixedStream(prefix, stream))
+    if prefix == GZIP_MAGIC:
+        raw = gzip.GzipFile(fileobj=raw, mode='rb')
+    for line_number, line in enumerate(io.TextIOWrapper(raw, encoding='utf-8'), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第 {line_number} 行不是有效的JSON: {e}")
+        if not isinstance(record, dict) or 'type' not in record:
+            raise ValueError(f"第 {line_number} 行缺少记录类型")
+        yield record
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='以NDJSON格式导出或导入项目（用例、步骤，可选运行历史）')
+    parser.add_argument('--db', default='test_cases.db', help='数据库文件路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='导出项目')
+    export_parser.add_argument('project_id', type=int, help='项目ID')
+    export_parser.add_argument('-o', '--output', help='输出文件，以.gz结尾时gzip压缩；默认输出到标准输出')
+    export_parser.add_argument('--history', action='store_true', help='同时导出运行历史')
+    import_parser = subparsers.add_parser('import', help='导入项目（总是创建新项目）')
+    import_parser.add_argument('input', help='导入文件（NDJSON或gzip压缩的NDJSON），-表示标准输入')
+    import_parser.add_argument('--name', help='新项目名称，默认使用导出文件中的名称')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    if args.command == 'export':
+        chunks = dump_records(db.iter_project_export(args.project_id, include_history=args.history))
+        if args.output:
+            if args.output.endswith('.gz'):
+                chunks = gzip_chunks(chunks)
+            with open(args.output, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+    else:
+        if args.input == '-':
+            result = db.import_project(read_records(sys.stdin.buffer), name=args.name)
+        else:
+            with open(args.input, 'rb') as f:
+                result = db.import_project(read_records(f), name=args.name)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
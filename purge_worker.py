@@ -0,0 +1,60 @@
+import threading
+import time
+from typing import Callable, Dict
+
+from logger import uat_logger
+
+# 批与批之间让出写锁的时间，以及出错后重试前的等待时间（秒）
+PURGE_BATCH_PAUSE = 0.05
+PURGE_RETRY_DELAY = 5
+
+
+class PurgeWorker:
+    """后台清理线程
+
+    被唤醒后反复调用run_batch，直到它返回False（没有待清理的数据）。
+    每批一个短事务，批之间暂停一小段时间，让用例编辑和结果写入可以拿到写锁。
+    清理进度保存在数据库中，进程中断后下次启动会继续。
+    """
+
+    def __init__(self, run_batch: Callable[[], bool], name: str = "purge-worker",
+                 pause: float = PURGE_BATCH_PAUSE):
+        self._run_batch = run_batch
+        self.name = name
+        self.pause = pause
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """有新的清理任务时调用"""
+        self._wake.set()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                while self._run_batch():
+                    time.sleep(self.pause)
+            except Exception as e:
+                uat_logger.error(f"{self.name} 清理失败，{PURGE_RETRY_DELAY}秒后重试: {e}")
+                time.sleep(PURGE_RETRY_DELAY)
+                self._wake.set()
+
+
+_workers: Dict[str, PurgeWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def get_purge_worker(db_path: str, run_batch: Callable[[], bool]) -> PurgeWorker:
+    """获取指定数据库文件的共享清理线程（首次调用时创建）"""
+    with _workers_lock:
+        worker = _workers.get(db_path)
+        if worker is None:
+            worker = PurgeWorker(run_batch, name=f"purge-worker[{db_path}]")
+            _workers[db_path] = worker
+        return worker
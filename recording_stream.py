@@ -0,0 +1,117 @@
+import time
+from typing import Any, Callable, Dict, Optional
+
+# 录制步骤写入test_steps的批量大小和最长等待时间（秒）
+RECORDING_BATCH_SIZE = 50
+RECORDING_FLUSH_INTERVAL = 1.0
+# 待定步骤超过该时间（秒）没有变化就交出，录制进程意外退出时最多丢失这段时间内的操作
+RECORDING_PENDING_FLUSH = 2.0
+# 停止录制时等待页面已通过绑定发出的事件到达的最长时间（秒）
+RECORDING_DRAIN_TIMEOUT = 2.0
+
+# 同一操作在该时间窗口（毫秒）内重复出现时视为重复事件
+DUPLICATE_WINDOWS = {
+    'navigate': 2000,
+    'click': 1000,
+    'hover': 1000,
+    'keypress': 1000,
+    'submit': 1000,
+    'scroll': 1000,
+}
+# submit之后该时间窗口（毫秒）内的navigate是提交引起的，回放时不需要单独导航
+SUBMIT_NAVIGATE_WINDOW = 3000
+
+# 判断重复时除操作类型外需要相同的字段
+_DUPLICATE_KEYS = {
+    'navigate': ('url',),
+    'click': ('selector',),
+    'hover': ('selector',),
+    'keypress': ('selector', 'key'),
+    'submit': ('selector',),
+    'scroll': ('scrollPosition',),
+}
+
+
+def event_to_step(event: Dict[str, Any]) -> Dict[str, Any]:
+    """把浏览器端上报的事件转换为录制步骤格式"""
+    action = event.get('action')
+    step = {
+        "action": action,
+        "timestamp": event.get('timestamp')
+    }
+    if action in ('click', 'hover', 'double_click', 'right_click', 'submit'):
+        step['selector'] = event.get('selector')
+    elif action == 'fill':
+        step['selector'] = event.get('selector')
+        step['text'] = event.get('text', '')
+    elif action == 'navigate':
+        step['url'] = event.get('url')
+    elif action == 'scroll':
+        step['scrollPosition'] = event.get('scrollPosition')
+        step['scrollDirection'] = event.get('scrollDirection')
+        step['scrollDistance'] = event.get('scrollDistance')
+    elif action == 'keypress':
+        step['selector'] = event.get('selector')
+        step['key'] = event.get('key')
+    return step
+
+
+class RecordingCompactor:
+    """录制事件的压缩阶段：去掉重复事件、合并同一输入框的连续输入，再逐条交给emit
+
+    只保留最后一个步骤：下一个步骤到来时它才最终确定（连续输入会改写它的文本），
+    因此无论录制多久，内存中都只有一个待定步骤。待定步骤空闲超过RECORDING_PENDING_FLUSH秒
+    由release_idle交出（之后同一输入框的输入记为新的步骤），录制结束时调用flush交出。
+    """
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], Any]):
+        self._emit = emit
+        self._pending: Optional[Dict[str, Any]] = None
+        self._pending_at = 0.0
+        # 最近的步骤（待定或已交出），判断重复事件和提交引起的导航
+        self._last: Optional[Dict[str, Any]] = None
+        self.received = 0
+        self.emitted = 0
+
+    def add_event(self, event: Dict[str, Any]):
+        """接收一个浏览器事件"""
+        self.add_step(event_to_step(event))
+
+    def add_step(self, step: Dict[str, Any]):
+        """接收一个录制步骤（浏览器事件或通过接口执行的操作）"""
+        self.received += 1
+        last = self._last
+        if last is not None:
+            time_diff = (step.get('timestamp') or 0) - (last.get('timestamp') or 0)
+            action = step.get('action')
+            if action == 'navigate' and last.get('action') == 'submit' and time_diff < SUBMIT_NAVIGATE_WINDOW:
+                return
+            if action == last.get('action'):
+                if action == 'fill' and last is self._pending and step.get('selector') == last.get('selector'):
+                    # 同一输入框的连续输入只保留最终的文本
+                    last['text'] = step.get('text', '')
+                    last['timestamp'] = step.get('timestamp')
+                    self._pending_at = time.monotonic()
+                    return
+                keys = _DUPLICATE_KEYS.get(action)
+                if keys and time_diff < DUPLICATE_WINDOWS[action] and \
+                        all(step.get(key) == last.get(key) for key in keys):
+                    return
+        self._release()
+        self._pending = self._last = step
+        self._pending_at = time.monotonic()
+
+    def release_idle(self, max_idle: float = RECORDING_PENDING_FLUSH):
+        """待定步骤超过max_idle秒没有变化时交出"""
+        if self._pending is not None and time.monotonic() - self._pending_at >= max_idle:
+            self._release()
+
+    def flush(self):
+        """交出最后一个待定步骤"""
+        self._release()
+
+    def _release(self):
+        if self._pending is not None:
+            step, self._pending = self._pending, None
+            self.emitted += 1
+            self._emit(step)
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# 运行日志分段文件的大小上限和保留的段数（最旧的段连同索引一起删除）
+RUN_LOG_SEGMENT_BYTES = 50 * 1024 * 1024
+RUN_LOG_SEGMENTS_KEEP = 20
+# 索引攒批写入：待写入的区间达到该数量或距上次写入超过该秒数时写一次
+RUN_LOG_INDEX_BATCH = 200
+RUN_LOG_INDEX_INTERVAL = 1.0
+
+RUN_LOG_INDEX_FILE = 'run_logs_index.db'
+_SEGMENT_PREFIX = 'run_logs_'
+_SEGMENT_SUFFIX = '.jsonl'
+
+
+class RunLogHandler(logging.Handler):
+    """带运行上下文的日志写成JSON行，并按运行ID索引每段日志在文件中的字节区间
+
+    同一运行连续写入的行合并为一个区间；并发运行交错写入时每行一个区间。
+    按运行读取日志只需查索引再按区间seek读取，不用扫描整个日志文件。
+    emit在日志监听线程中执行，读取在请求线程中执行，两者通过锁串行访问文件和索引。
+    """
+
+    def __init__(self, log_dir: str, segment_bytes: int = RUN_LOG_SEGMENT_BYTES,
+                 segments_keep: int = RUN_LOG_SEGMENTS_KEEP):
+        super().__init__(logging.DEBUG)
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self.segments_keep = segments_keep
+        self._io_lock = threading.Lock()
+        self._index = sqlite3.connect(os.path.join(log_dir, RUN_LOG_INDEX_FILE), check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute("PRAGMA synchronous=NORMAL")
+        self._index.execute('''
+            CREATE TABLE IF NOT EXISTS run_log_spans (
+                run_id TEXT NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        ''')
+        self._index.execute("CREATE INDEX IF NOT EXISTS idx_run_log_spans_run ON run_log_spans (run_id, segment, offset)")
+        self._index.commit()
+        # 正在增长的区间 {run_id: [segment, offset, length]} 和已结束、待写入索引的区间
+        self._open_spans: Dict[str, List[int]] = {}
+        self._pending: List[tuple] = []
+        self._last_index_flush = time.monotonic()
+        segments = self._segments()
+        self._segment = segments[-1] if segments else 1
+        self._file = open(self._segment_path(self._segment), 'ab')
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.log_dir, f"{_SEGMENT_PREFIX}{segment:06d}{_SEGMENT_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        segments = []
+        for name in os.listdir(self.log_dir):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                number = name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]
+                if number.isdigit():
+                    segments.append(int(number))
+        return sorted(segments)
+
+    def emit(self, record: logging.LogRecord):
+        run_id = getattr(record, 'run_id', None)
+        if not run_id:
+            return
+        try:
+            line = json.dumps({
+                'time': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+                'level': record.levelname,
+                'run_id': run_id,
+                'job_id': getattr(record, 'job_id', None),
+                'case_id': getattr(record, 'case_id', None),
+                'step': getattr(record, 'step', None),
+                'message': record.getMessage(),
+            }, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+            with self._io_lock:
+                if self._file.tell() >= self.segment_bytes:
+                    self._rotate()
+                offset = self._file.tell()
+                self._file.write(line)
+                span = self._open_spans.get(run_id)
+                if span and span[0] == self._segment and span[1] + span[2] == offset:
+                    span[2] += len(line)
+                else:
+                    if span:
+                        self._pending.append((run_id, *span))
+                    self._open_spans[run_id] = [self._segment, offset, len(line)]
+                if len(self._pending) >= RUN_LOG_INDEX_BATCH or \
+                        time.monotonic() - self._last_index_flush >= RUN_LOG_INDEX_INTERVAL:
+                    self._flush_index()
+        except Exception:
+            self.handleError(record)
+
+    def _flush_index(self):
+        """把文件缓冲和所有区间写入索引（调用方持有_io_lock）；正在增长的区间之后从新区间继续"""
+        self._file.flush()
+        spans = self._pending + [(run_id, *span) for run_id, span in self._open_spans.items()]
+        self._pending = []
+        self._open_spans = {}
+        self._last_index_flush = time.monotonic()
+        if spans:
+            with self._index:
+                self._index.executemany(
+                    "INSERT INTO run_log_spans (run_id, segment, offset, length) VALUES (?, ?, ?, ?)", spans
+                )
+
+    def _rotate(self):
+        """开始新的分段，删除超出保留数量的旧分段及其索引"""
+        self._flush_index()
+        self._file.close()
+        self._segment += 1
+        self._file = open(self._segment_path(self._segment), 'ab')
+        expired = [segment for segment in self._segments() if segment <= self._segment - self.segments_keep]
+        if expired:
+            with self._index:
+                self._index.execute("DELETE FROM run_log_spans WHERE segment <= ?", (expired[-1],))
+            for segment in expired:
+                try:
+                    os.remove(self._segment_path(segment))
+                except OSError:
+                    pass
+
+    def flush(self):
+        with self._io_lock:
+            if not self._file.closed:
+                self._flush_index()
+
+    def read_run(self, run_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按索引读取一次运行的全部日志（按写入顺序），limit限制返回的条数"""
+        entries = []
+        with self._io_lock:
+            if not self._file.closed:
+                self._flush_index()
+            spans = self._index.execute(
+                "SELECT segment, offset, length FROM run_log_spans WHERE run_id = ? ORDER BY segment, offset",
+                (run_id,)
+            ).fetchall()
+        files = {}
+        try:
+            for segment, offset, length in spans:
+                f = files.get(segment)
+                if f is None:
+                    try:
+                        f = files[segment] = open(self._segment_path(segment), 'rb')
+                    except FileNotFoundError:
+                        continue
+                f.seek(offset)
+                for line in f.read(length).splitlines():
+                    entries.append(json.loads(line))
+                    if limit is not None and len(entries) >= limit:
+                        return entries
+        finally:
+            for f in files.values():
+                f.close()
+        return entries
+
+    def close(self):
+        with self._io_lock:
+            if not self._file.closed:
+                self._flush_index()
+                self._file.close()
+                self._index.close()
+        super().close()